@@ -0,0 +1,131 @@
+"""Benchmark the speed and accuracy of the fast curvature estimators against the spline based curvature.
+
+Generates synthetic circles and ellipses with known curvature, optionally with noise, and compares
+`calculate_curvature_fast` with `calculate_curvature_periodic_boundary` on error against the true curvature,
+difference from the spline curvature and time per trace.
+
+```
+python benchmarks/curvature_benchmark.py --n-traces 100 --n-points 200 --noise 0.01
+python benchmarks/curvature_benchmark.py --json > bench_output.txt
+```
+"""
+
+import argparse
+import json
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+
+from sylvialib.numpy_scripts import calculate_curvature_fast, calculate_curvature_periodic_boundary
+
+
+def synthetic_ellipses(
+    n_traces: int, n_points: int, aspect_ratio: float, noise: float, seed: int = 0
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Make a batch of anticlockwise ellipses with random sizes, and their true curvature.
+
+    An aspect ratio of 1 gives circles. Noise is Gaussian, relative to the semi-major axis.
+
+    Returns
+    -------
+    np.ndarray
+        (n_traces, n_points) x coordinates.
+    np.ndarray
+        (n_traces, n_points) y coordinates.
+    np.ndarray
+        (n_traces, n_points) true curvature.
+    """
+    rng = np.random.default_rng(seed)
+    angles = np.linspace(0, 2 * np.pi, n_points, endpoint=False)
+    semi_major = rng.uniform(20, 100, size=(n_traces, 1))
+    semi_minor = semi_major / aspect_ratio
+    x_points = semi_major * np.cos(angles) + rng.normal(scale=noise, size=(n_traces, n_points)) * semi_major
+    y_points = semi_minor * np.sin(angles) + rng.normal(scale=noise, size=(n_traces, n_points)) * semi_major
+    curvature = (semi_major * semi_minor) / np.power(
+        semi_major**2 * np.sin(angles) ** 2 + semi_minor**2 * np.cos(angles) ** 2, 3 / 2
+    )
+    return x_points, y_points, curvature
+
+
+def relative_error(estimate: np.ndarray, reference: np.ndarray) -> float:
+    """Median absolute difference relative to the mean magnitude of the reference."""
+    return float(np.median(np.abs(estimate - reference)) / np.mean(np.abs(reference)))
+
+
+def spline_curvatures(x_points: np.ndarray, y_points: np.ndarray) -> np.ndarray:
+    """Spline curvature of each trace in a batch, one trace at a time."""
+    return np.stack([calculate_curvature_periodic_boundary(x, y)[0] for x, y in zip(x_points, y_points)])
+
+
+def timed(function: Callable, *args, **kwargs) -> Tuple[Any, float]:
+    """Call a function, returning its result and the number of seconds it took."""
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def run_benchmark(n_traces: int, n_points: int, noise: float, window_length: int, polyorder: int) -> List[Dict]:
+    """Run every estimator on circles and ellipses, returning one result per shape and estimator."""
+    results = []
+    for shape, aspect_ratio in (("circle", 1.0), ("ellipse", 2.0)):
+        *points, true_curvature = synthetic_ellipses(n_traces, n_points, aspect_ratio, noise)
+
+        spline_curvature, spline_seconds = timed(spline_curvatures, *points)
+        results.append(
+            {
+                "shape": shape,
+                "estimator": "spline",
+                "seconds_per_trace": spline_seconds / n_traces,
+                "error_vs_truth": relative_error(spline_curvature, true_curvature),
+                "difference_vs_spline": 0.0,
+            }
+        )
+
+        for method in ("savgol", "finite_difference"):
+            (curvature, _, _), seconds = timed(
+                calculate_curvature_fast,
+                *points,
+                closed=True,
+                method=method,
+                window_length=window_length,
+                polyorder=polyorder,
+            )
+            results.append(
+                {
+                    "shape": shape,
+                    "estimator": method,
+                    "seconds_per_trace": seconds / n_traces,
+                    "error_vs_truth": relative_error(curvature, true_curvature),
+                    "difference_vs_spline": relative_error(curvature, spline_curvature),
+                }
+            )
+    return results
+
+
+def main(argv: List[str] = None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Benchmark the fast curvature estimators against the spline.")
+    parser.add_argument("--n-traces", type=int, default=50, help="Number of traces of each shape.")
+    parser.add_argument("--n-points", type=int, default=200, help="Number of points per trace.")
+    parser.add_argument("--noise", type=float, default=0.0, help="Noise relative to the trace size.")
+    parser.add_argument("--window-length", type=int, default=11, help="Savitzky-Golay window length.")
+    parser.add_argument("--polyorder", type=int, default=3, help="Savitzky-Golay polynomial order.")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON.")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args.n_traces, args.n_points, args.noise, args.window_length, args.polyorder)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'shape':<10}{'estimator':<20}{'us / trace':>12}{'error vs truth':>16}{'diff vs spline':>16}")
+    for result in results:
+        print(
+            f"{result['shape']:<10}{result['estimator']:<20}{result['seconds_per_trace'] * 1e6:>12.1f}"
+            f"{result['error_vs_truth']:>16.2e}{result['difference_vs_spline']:>16.2e}"
+        )
+
+
+if __name__ == "__main__":
+    main()
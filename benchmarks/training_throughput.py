@@ -0,0 +1,201 @@
+"""Benchmark the training throughput of the image generator and the U-NET models.
+
+Writes a synthetic dataset of image / mask pairs to disk, then times `image_generator` on its own and feeding
+`unet_model` and `multiclass_unet_model` for a fixed number of training steps. For each run it reports samples
+per second, step time percentiles, the fraction of each step spent waiting for the generator and the peak
+resident memory of the process so far. The runs share the process, so the peak of each run includes the runs
+before it. The defaults are small enough for a CPU only test job.
+
+```
+python benchmarks/training_throughput.py
+python benchmarks/training_throughput.py --steps 20 --batch-size 4 --output-dtype uint8 --json > bench.json
+```
+"""
+
+import argparse
+import contextlib
+import json
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from sylvialib.deep_learning.generator import image_generator
+
+RUNS = ("generator", "unet", "multiclass")
+
+
+def make_synthetic_dataset(directory: Path, n_images: int, image_size: int, file_type: str, seed: int = 0):
+    """Save random images of bright discs on a noisy background, with the discs as the masks."""
+    rng = np.random.default_rng(seed)
+    rows, cols = np.indices((image_size, image_size))
+    for index in range(n_images):
+        mask = np.zeros((image_size, image_size), dtype=bool)
+        for _ in range(5):
+            row, col = rng.integers(0, image_size, size=2)
+            radius = rng.uniform(0.02, 0.1) * image_size
+            mask |= (rows - row) ** 2 + (cols - col) ** 2 < radius**2
+        image = rng.normal(size=(image_size, image_size)) * 0.2 + mask
+        if file_type == ".png":
+            # Imported here so that the benchmark only needs PIL for png datasets
+            from PIL import Image  # pylint: disable=import-outside-toplevel
+
+            image = np.round((image - image.min()) * (255 / (image.max() - image.min()))).astype(np.uint8)
+            Image.fromarray(image).save(directory / f"image_{index}.png")
+            Image.fromarray(mask.astype(np.uint8) * 255).save(directory / f"mask_{index}.png")
+        else:
+            np.save(directory / f"image_{index}.npy", image)
+            np.save(directory / f"mask_{index}.npy", mask.astype(np.uint8))
+
+
+def peak_rss_mb() -> float:
+    """Peak resident memory of this process so far in MB. Linux reports it in kB and macOS in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+
+def summarise(name: str, batch_size: int, step_seconds: np.ndarray, wait_seconds: np.ndarray) -> Dict:
+    """Reduce the timings of the measured steps of a run to its result."""
+    return {
+        "run": name,
+        "steps": len(step_seconds),
+        "batch_size": batch_size,
+        "samples_per_second": batch_size * len(step_seconds) / step_seconds.sum(),
+        "step_seconds_p50": float(np.percentile(step_seconds, 50)),
+        "step_seconds_p90": float(np.percentile(step_seconds, 90)),
+        "step_seconds_p99": float(np.percentile(step_seconds, 99)),
+        "input_wait_fraction": float(wait_seconds.sum() / step_seconds.sum()),
+        "process_peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def time_run(generator, steps: int, warmup_steps: int, train_step=None):
+    """Time the steps of a run, each of which takes a batch from the generator and optionally trains on it.
+
+    Returns
+    -------
+    np.ndarray
+        Time taken by each measured step.
+    np.ndarray
+        Time each measured step spent waiting for the generator.
+    """
+    step_seconds = []
+    wait_seconds = []
+    for step in range(warmup_steps + steps):
+        start = time.perf_counter()
+        batch_x, batch_y = next(generator)
+        loaded = time.perf_counter()
+        if train_step is not None:
+            train_step(batch_x, batch_y)
+        stop = time.perf_counter()
+        # The warmup steps include building the training function, so are not measured
+        if step >= warmup_steps:
+            step_seconds.append(stop - start)
+            wait_seconds.append(loaded - start)
+    return np.array(step_seconds), np.array(wait_seconds)
+
+
+def make_train_step(run: str, output_dtype: str) -> Callable[[np.ndarray, np.ndarray], None]:
+    """Build the model of a run and return a function that trains it on a batch from the generator."""
+    # Imported here so that the generator alone can be benchmarked without loading tensorflow
+    # pylint: disable=import-outside-toplevel
+    from sylvialib.deep_learning.unet_binary_class import unet_model
+    from sylvialib.deep_learning.unet_multi_class import NUM_CLASSES, multiclass_unet_model
+
+    model_fn = unet_model if run == "unet" else multiclass_unet_model
+    # The builders print a model summary, keep stdout for the results
+    with contextlib.redirect_stdout(sys.stderr):
+        model = model_fn(512, 512, 1, normalise_inputs=output_dtype == "uint8")
+
+    def train_step(batch_x: np.ndarray, batch_y: np.ndarray):
+        if run == "multiclass":
+            # One hot masks for the multi class model, only the first two classes are present
+            batch_y = np.eye(NUM_CLASSES, dtype=np.float32)[batch_y.astype(np.intp)]
+        else:
+            batch_y = batch_y[..., np.newaxis]
+        model.train_on_batch(batch_x[..., np.newaxis], batch_y)
+
+    return train_step
+
+
+def run_benchmark(  # pylint: disable=too-many-arguments
+    data_dir: Path,
+    runs: List[str],
+    n_images: int,
+    batch_size: int,
+    *,
+    steps: int,
+    warmup_steps: int,
+    file_type: str,
+    output_dtype: str,
+) -> List[Dict]:
+    """Run the generator and each model for a fixed number of steps, returning one result per run."""
+
+    def make_generator():
+        return image_generator(
+            data_dir,
+            data_dir,
+            list(range(n_images)),
+            batch_size=batch_size,
+            file_type=file_type,
+            output_dtype=output_dtype,
+        )
+
+    results = []
+    for run in runs:
+        train_step = None if run == "generator" else make_train_step(run, output_dtype)
+        results.append(summarise(run, batch_size, *time_run(make_generator(), steps, warmup_steps, train_step)))
+    return results
+
+
+def main(argv: List[str] = None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Benchmark generator and U-NET training throughput.")
+    parser.add_argument("--runs", nargs="+", choices=RUNS, default=list(RUNS), help="Runs to benchmark.")
+    parser.add_argument("--data-dir", type=Path, default=None, help="Directory for the dataset, else a temp dir.")
+    parser.add_argument("--n-images", type=int, default=16, help="Number of synthetic image / mask pairs.")
+    parser.add_argument("--image-size", type=int, default=512, help="Size of the synthetic images on disk.")
+    parser.add_argument("--file-type", choices=(".npy", ".png"), default=".npy", help="File type of the dataset.")
+    parser.add_argument("--output-dtype", choices=("float32", "uint8"), default="float32", help="Batch dtype.")
+    parser.add_argument("--batch-size", type=int, default=2, help="Batch size.")
+    parser.add_argument("--steps", type=int, default=5, help="Number of measured steps per run.")
+    parser.add_argument("--warmup-steps", type=int, default=1, help="Number of unmeasured steps per run.")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON.")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        data_dir = Path(temporary_dir) if args.data_dir is None else args.data_dir
+        data_dir.mkdir(parents=True, exist_ok=True)
+        make_synthetic_dataset(data_dir, args.n_images, args.image_size, args.file_type)
+        results = run_benchmark(
+            data_dir,
+            args.runs,
+            args.n_images,
+            args.batch_size,
+            steps=args.steps,
+            warmup_steps=args.warmup_steps,
+            file_type=args.file_type,
+            output_dtype=args.output_dtype,
+        )
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(
+        f"{'run':<12}{'samples / s':>12}{'p50 s':>10}{'p90 s':>10}{'p99 s':>10}"
+        f"{'input wait':>12}{'proc peak MB':>14}"
+    )
+    for result in results:
+        print(
+            f"{result['run']:<12}{result['samples_per_second']:>12.2f}{result['step_seconds_p50']:>10.3f}"
+            f"{result['step_seconds_p90']:>10.3f}{result['step_seconds_p99']:>10.3f}"
+            f"{result['input_wait_fraction']:>12.1%}{result['process_peak_rss_mb']:>14.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,87 +1,184 @@
 """File management scripts"""
 
+import os
+import uuid
 from pathlib import Path
 import sys
-
-
-def rename_files_alphabetical(path: Path, file_ext: str, file_name_base: str):
-    """Renames all files in a directory to a given filename and extension, with index i where i
-    is replaced with the number of the file as it appears in the directory after being sorted
-    alphabetically. This is useful for renaming files that have been labelled by software to
-    something more useful.
+from typing import List, Tuple
+
+from sylvialib.instrumentation import instrument
+
+RENAME_ORDERS = ("alphabetical", "numerical")
+
+
+def _numerical_sort_key(file_name: str) -> tuple:
+    """Sort key for the number made of the digits in a file name. Names without digits sort last,
+    alphabetically."""
+    digits = "".join(filter(str.isdigit, file_name))
+    if digits:
+        return (0, int(digits), file_name)
+    return (1, 0, file_name)
+
+
+@instrument
+def plan_renames(
+    path: Path, file_ext: str, file_name_base: str, order: str = "alphabetical"
+) -> List[Tuple[Path, Path]]:
+    """Work out how to rename all files with a given extension in a directory to `{file_name_base}_{i}{file_ext}`,
+    without renaming anything. The directory is scanned once.
+
+    Parameters
+    ----------
+    path: Path
+        The directory containing the files.
+    file_ext: str
+        The extension of the files to rename, with or without the leading period.
+    file_name_base: str
+        The base of the new file names.
+    order: str
+        How to sort the files before numbering them. "alphabetical" sorts by file name, "numerical" sorts
+        by the number made of the digits in the file name, with names without digits last.
+
+    Returns
+    -------
+    List[Tuple[Path, Path]]
+        (current path, new path) pairs for every file, in the order the files are numbered. Files that
+        already have the right name have the same current and new path.
     """
-
-    # Ensure that the path is a directory
+    path = Path(path)
     if not path.is_dir():
-        print("Path is not a directory")
-        sys.exit()
+        raise NotADirectoryError(f"{path} is not a directory")
+    if order not in RENAME_ORDERS:
+        raise ValueError(f"order must be one of {RENAME_ORDERS}, got {order}")
 
     # Ensure that the file extension starts with a period
-    if file_ext[0] != ".":
+    if not file_ext.startswith("."):
         file_ext = "." + file_ext
 
-    i = 0
+    with os.scandir(path) as entries:
+        file_names = [entry.name for entry in entries if entry.name.endswith(file_ext) and entry.is_file()]
+    if len(file_names) == 0:
+        raise FileNotFoundError(f"No {file_ext} files found in {path}")
 
-    files = list(path.glob("*" + file_ext))
-    files.sort()
-
-    if len(files) == 0:
+    if order == "numerical":
+        # Compute each key once rather than inside every comparison
+        file_names.sort(key=_numerical_sort_key)
+    else:
+        file_names.sort()
+
+    return [(path / file_name, path / f"{file_name_base}_{i}{file_ext}") for i, file_name in enumerate(file_names)]
+
+
+@instrument
+def rename_files(
+    path: Path, file_ext: str, file_name_base: str, order: str = "alphabetical", dry_run: bool = False
+) -> List[Tuple[Path, Path]]:
+    """Rename all files with a given extension in a directory to `{file_name_base}_{i}{file_ext}`, where i is the
+    position of the file after sorting.
+
+    The plan is computed in memory from a single scan of the directory. Only files whose new name is
+    currently taken by another file being renamed are moved through a temporary name first; every other
+    file is renamed once. If a rename fails, the renames already made are undone, so the files are left with
+    their original names, and the error is raised.
+
+    Parameters
+    ----------
+    path: Path
+        The directory containing the files.
+    file_ext: str
+        The extension of the files to rename, with or without the leading period.
+    file_name_base: str
+        The base of the new file names.
+    order: str
+        How to sort the files before numbering them, either "alphabetical" or "numerical". See `plan_renames`.
+    dry_run: bool
+        If True, only compute and return the plan without renaming anything.
+
+    Returns
+    -------
+    List[Tuple[Path, Path]]
+        (original path, new path) pairs for every file, in the order the files are numbered.
+    """
+    plan = plan_renames(path, file_ext, file_name_base, order=order)
+    if dry_run:
+        return plan
+
+    moves = [(source, target) for source, target in plan if source != target]
+    targets = {target for _, target in moves}
+
+    token = uuid.uuid4().hex
+    done = []
+    try:
+        # First pass, move files whose current name is needed by another file out of the way
+        staged = []
+        for i, (source, target) in enumerate(moves):
+            if source in targets:
+                temp_path = source.with_name(f".rename_{token}_{i}.tmp")
+                source.rename(temp_path)
+                done.append((source, temp_path))
+                staged.append((temp_path, target))
+            else:
+                staged.append((source, target))
+
+        # Second pass, every target name is now free
+        for source, target in staged:
+            source.rename(target)
+            done.append((source, target))
+    except OSError as error:
+        _undo_renames(done, error)
+        raise
+
+    return plan
+
+
+def _undo_renames(done: List[Tuple[Path, Path]], error: OSError):
+    """Undo (source, target) renames in reverse order after a failed rename. Raises an OSError listing the
+    files that could not be moved back."""
+    stranded = []
+    for source, target in reversed(done):
+        try:
+            target.rename(source)
+        except OSError:
+            stranded.append((target, source))
+    if stranded:
+        stranded_list = ", ".join(f"{target} (originally {source})" for target, source in stranded)
+        raise OSError(f"Renaming failed and could not be undone, files left at: {stranded_list}") from error
+
+
+def _rename_files_legacy(path: Path, file_ext: str, file_name_base: str, order: str):
+    """Rename files, printing each rename and exiting on errors, as the original rename scripts did."""
+    try:
+        plan = rename_files(path, file_ext, file_name_base, order=order)
+    except NotADirectoryError:
+        print("Path is not a directory")
+        sys.exit()
+    except FileNotFoundError:
         print("No files found")
         sys.exit()
-    else:
-        # First pass, rename to temporary name to avoid overwriting
-        for i, file in enumerate(files):
-            temp_filename = path / f"temp_{i}{file_ext}"
-            print(f"Renaming {file.name} to {temp_filename}")
-            file.rename(temp_filename)
 
-        # Second pass, rename to desired name
-        temp_files = list(path.glob("*" + file_ext))
-        temp_files.sort()
-        for i, file in enumerate(temp_files):
-            new_filename = path / f"{file_name_base}_{i}{file_ext}"
-            print(f"Renaming {file.name} to {new_filename}")
-            file.rename(new_filename)
+    for source, target in plan:
+        print(f"Renamed {source.name} to {target}")
 
 
-def rename_files_numerical(path: Path, file_ext: str, file_name_base: str):
-    """Renames all files in a directory. Sorts the files in order of numbers that appear
-    in the existing file names.
+@instrument
+def rename_files_alphabetical(path: Path, file_ext: str, file_name_base: str):
+    """Renames all files in a directory to a given filename and extension, with index i where i
+    is replaced with the number of the file as it appears in the directory after being sorted
+    alphabetically. This is useful for renaming files that have been labelled by software to
+    something more useful.
 
-    Eg: [image_1.png, image_5.png, image_8.png] -> [image_0.png, image_1.png, image_2.png]
+    Prints each rename and exits on errors, use `rename_files` to get the plan back and exceptions instead.
     """
+    _rename_files_legacy(path, file_ext, file_name_base, order="alphabetical")
 
-    # Ensure that the path is a directory
-    if not path.is_dir():
-        print("Path is not a directory")
-        sys.exit()
 
-    # Ensure that the file extension starts with a period
-    if file_ext[0] != ".":
-        file_ext = "." + file_ext
-
-    i = 0
+@instrument
+def rename_files_numerical(path: Path, file_ext: str, file_name_base: str):
+    """Renames all files in a directory. Sorts the files in order of numbers that appear
+    in the existing file names.
 
-    # Get all files in the directory
-    files = list(path.glob("*" + file_ext))
-    # Sort the files by the number that appears in the filename
-    files.sort(key=lambda f: int("".join(filter(str.isdigit, f.name))))
+    Eg: [image_1.png, image_5.png, image_8.png] -> [image_0.png, image_1.png, image_2.png]
 
-    if len(files) == 0:
-        print("No files found")
-        sys.exit()
-    else:
-        # First pass, rename to temporary name to avoid overwriting
-        for i, file in enumerate(files):
-            temp_filename = path / f"temp_{i}{file_ext}"
-            print(f"Renaming {file.name} to {temp_filename}")
-            file.rename(temp_filename)
-
-        # Rename the files
-        temp_files = list(path.glob("*" + file_ext))
-        temp_files.sort(key=lambda f: int("".join(filter(str.isdigit, f.name))))
-
-        for i, file in enumerate(temp_files):
-            new_filename = path / f"{file_name_base}_{i}{file_ext}"
-            print(f"Renaming {file.name} to {new_filename}")
-            file.rename(new_filename)
+    Prints each rename and exits on errors, use `rename_files` to get the plan back and exceptions instead.
+    """
+    _rename_files_legacy(path, file_ext, file_name_base, order="numerical")
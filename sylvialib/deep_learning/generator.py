@@ -7,14 +7,19 @@ import cv2
 import numpy as np
 from PIL import Image
 
+from sylvialib.instrumentation import instrument
+
 
 # An image generator that loads images as they are needed
+@instrument
 def image_generator(
     original_image_dir: Path,
     mask_dir: Path,
-    image_indexes: list,
+    image_indexes: list = None,
     batch_size: int = 4,
     file_type: str = ".npy",
+    manifest: dict = None,
+    output_dtype: str = "float32",
 ):
     """A generator that yields batches of images and ground truth masks.
 
@@ -25,11 +30,21 @@ def image_generator(
     mask_dir : Path
         The directory containing the ground truth masks.
     image_indexes : list
-        A list of the indices of the images to be loaded.
+        A list of the indices of the images to be loaded. May be None if a manifest is given, in which case
+        every pair in the manifest is used.
     batch_size : int, optional
         The number of images to be loaded per batch. The default is 4.
     file_type : str, optional
-        The file type of the images. The default is ".npy".
+        The file type of the images. The default is ".npy". Ignored if a manifest is given.
+    manifest : dict, optional
+        A manifest from `build_manifest` or `load_manifest`. If given, file paths are taken from the manifest
+        instead of being built from the directories, and the image indexes are checked against it up front.
+    output_dtype : str, optional
+        Either "float32", to yield images normalised to between 0 and 1 and masks as float32, or "uint8", to
+        yield unnormalised uint8 images and masks, a quarter of the size, for models that normalise their own
+        inputs such as `unet_model(..., normalise_inputs=True)`. Images that are not already uint8 are
+        min-max scaled to 0 to 255, so the normalised result differs from the float32 mode by at most 1 / 510.
+        The default is "float32".
 
     Yields
     ------
@@ -40,6 +55,20 @@ def image_generator(
 
     """
 
+    if output_dtype not in ("float32", "uint8"):
+        raise ValueError(f"output_dtype must be either float32 or uint8, got {output_dtype}")
+
+    if manifest is not None:
+        if image_indexes is None:
+            image_indexes = sorted(manifest)
+        missing_indexes = [index for index in image_indexes if index not in manifest]
+        if missing_indexes:
+            raise ValueError(f"Image indexes missing from the manifest: {missing_indexes[:10]}")
+        image_paths = {index: Path(manifest[index]["image"]["path"]) for index in image_indexes}
+        mask_paths = {index: Path(manifest[index]["mask"]["path"]) for index in image_indexes}
+    elif image_indexes is None:
+        raise ValueError("image_indexes must be given if there is no manifest")
+
     while True:
         # Select files (paths/indices) for the batch
         batch_image_indexes = np.random.choice(a=image_indexes, size=batch_size)
@@ -48,26 +77,41 @@ def image_generator(
 
         # Load the image and ground truth
         for index in batch_image_indexes:
+            if manifest is not None:
+                image_path = image_paths[index]
+                mask_path = mask_paths[index]
+                file_type = image_path.suffix
+            else:
+                image_path = original_image_dir / f"image_{index}{file_type}"
+                mask_path = mask_dir / f"mask_{index}{file_type}"
+
             # Load the training image
             if file_type == ".npy":
-                image = np.load(original_image_dir / f"image_{index}.npy")
+                image = np.load(image_path)
             elif file_type == ".png":
-                image = cv2.imread(str(original_image_dir / f"image_{index}.png"), 0)
+                image = cv2.imread(str(image_path), 0)
             else:
                 raise ValueError("File type must be either .npy or .png")
             # Rescale the image to 512x512
             image = Image.fromarray(image)
             image = image.resize((512, 512))
             image = np.array(image)
-            # Normalise the image
-            image = image - np.min(image)
-            image = image / np.max(image)
+            if output_dtype == "uint8":
+                # Leave the normalisation to the model, only scaling images with more than 8 bits to fit
+                if image.dtype != np.uint8:
+                    image = image - np.min(image)
+                    scale = 255 / np.max(image) if np.max(image) > 0 else 0
+                    image = np.round(image * scale).astype(np.uint8)
+            else:
+                # Normalise the image
+                image = image - np.min(image)
+                image = image / np.max(image)
 
             # Load the ground truth
             if file_type == ".npy":
-                ground_truth = np.load(mask_dir / f"mask_{index}.npy")
+                ground_truth = np.load(mask_path)
             elif file_type == ".png":
-                ground_truth = cv2.imread(str(mask_dir / f"mask_{index}.png"), 0)
+                ground_truth = cv2.imread(str(mask_path), 0)
             else:
                 raise ValueError("File type must be either .npy or .png")
             ground_truth = np.array(ground_truth)
@@ -93,7 +137,7 @@ def image_generator(
             batch_output.append(ground_truth)
 
         # Force the batch to be numpy arrays
-        batch_x = np.array(batch_input).astype(np.float32)
-        batch_y = np.array(batch_output).astype(np.float32)
+        batch_x = np.array(batch_input).astype(output_dtype)
+        batch_y = np.array(batch_output).astype(output_dtype)
 
         yield (batch_x, batch_y)
@@ -0,0 +1,276 @@
+"""Inference helpers for the U-NET models."""
+
+import time
+import warnings
+from typing import Dict, List, Sequence, Tuple, Union
+
+import numpy as np
+
+# The eight dihedral transforms as (number of 90 degree rotations, flip) pairs. The order is chosen so that the
+# first two and first four variants keep the image shape, meaning non-square images can use up to four variants.
+DIHEDRAL_TRANSFORMS = [
+    (0, False),
+    (0, True),
+    (2, False),
+    (2, True),
+    (1, False),
+    (1, True),
+    (3, False),
+    (3, True),
+]
+
+
+def dihedral_transform(images: np.ndarray, rotation: int, flip: bool) -> np.ndarray:
+    """Apply a dihedral transform to a batch of images, flipping (along the width axis) before rotating.
+
+    Parameters
+    ----------
+    images: np.ndarray
+        Batch of images with shape (batch, height, width, ...).
+    rotation: int
+        Number of 90 degree rotations to apply.
+    flip: bool
+        Whether to flip the images along the width axis before rotating.
+
+    Returns
+    -------
+    np.ndarray
+        The transformed batch of images.
+    """
+    if flip:
+        images = np.flip(images, axis=2)
+    return np.rot90(images, rotation, axes=(1, 2))
+
+
+def inverse_dihedral_transform(images: np.ndarray, rotation: int, flip: bool) -> np.ndarray:
+    """Undo a transform applied by dihedral_transform.
+
+    Parameters
+    ----------
+    images: np.ndarray
+        Batch of transformed images with shape (batch, height, width, ...).
+    rotation: int
+        Number of 90 degree rotations that were applied.
+    flip: bool
+        Whether the images were flipped before rotating.
+
+    Returns
+    -------
+    np.ndarray
+        The batch of images in the original orientation.
+    """
+    images = np.rot90(images, -rotation, axes=(1, 2))
+    if flip:
+        images = np.flip(images, axis=2)
+    return images
+
+
+def predict_with_tta(model, images: np.ndarray, n_variants: int = 8, batch_size: int = None) -> np.ndarray:
+    """Predict a batch of images using dihedral test time augmentation (TTA).
+
+    Each image is flipped and rotated to build up to eight variants, matching the augmentation used in the
+    image generator. All the variants are stacked into a single batch so that only one call to `predict` is
+    made, then the transforms are inverted on the outputs and the outputs averaged.
+
+    Parameters
+    ----------
+    model
+        A model with a keras-style `predict` method, eg a model from `unet_model` or `multiclass_unet_model`.
+    images: np.ndarray
+        Batch of images with shape (batch, height, width, ...).
+    n_variants: int
+        Number of dihedral variants to average over, between 1 and 8. Fewer variants are faster but less
+        accurate. Variants 5 to 8 are rotated by 90 degrees, so require square images.
+    batch_size: int
+        Batch size passed on to `predict`. The default of None lets the model decide.
+
+    Returns
+    -------
+    np.ndarray
+        Averaged predictions in the orientation of the input images.
+    """
+    if not 1 <= n_variants <= len(DIHEDRAL_TRANSFORMS):
+        raise ValueError(f"n_variants must be between 1 and {len(DIHEDRAL_TRANSFORMS)}, got {n_variants}.")
+    if n_variants > 4 and images.shape[1] != images.shape[2]:
+        raise ValueError(
+            f"More than 4 variants requires square images, got images of shape {images.shape[1:3]}. "
+            "Use n_variants <= 4 for non-square images."
+        )
+
+    transforms = DIHEDRAL_TRANSFORMS[:n_variants]
+    n_images = images.shape[0]
+
+    # Build every variant into one batch, ordered by variant then by image
+    variants = np.concatenate([dihedral_transform(images, rotation, flip) for rotation, flip in transforms])
+    predictions = np.asarray(model.predict(variants, batch_size=batch_size))
+    predictions = predictions.reshape(n_variants, n_images, *predictions.shape[1:])
+
+    # Invert each transform across the whole batch at once and average
+    averaged = np.zeros(predictions.shape[1:], dtype=np.float64)
+    for variant_predictions, (rotation, flip) in zip(predictions, transforms):
+        averaged += inverse_dihedral_transform(variant_predictions, rotation, flip)
+
+    return (averaged / n_variants).astype(predictions.dtype)
+
+
+class BucketedPredictor:
+    """Predict on images of varying sizes without retracing, by padding them up to a fixed set of shape buckets.
+
+    Every new input shape makes keras retrace the prediction graph, so a service fed scans of many sizes sees
+    large latency spikes. Instead each image is padded up to the smallest bucket it fits in, images in the same
+    bucket are batched together and run through a `tf.function` traced once per bucket, and the outputs are
+    cropped back to the size of each image. Partial batches are padded to the full batch size so that each
+    bucket has a single input shape, which also lets each bucket be compiled with XLA.
+
+    The model must accept every bucket shape, eg a U-NET built with `unet_model(None, None, 1)`. Bucket sides
+    must be multiples of 16 for the four pooling levels of the U-NETs.
+
+    Example:
+    --------
+    ```
+    >>> predictor = BucketedPredictor(unet_model(None, None, 1), buckets=[(256, 256), (512, 512)])
+    >>> predictor.warmup()
+    >>> masks = predictor.predict([scan_1, scan_2, scan_3])
+    ```
+
+    Parameters
+    ----------
+    model: keras.Model
+        Model to predict with.
+    buckets: Sequence[Tuple[int, int]]
+        (height, width) shapes to pad the images up to.
+    batch_size: int
+        Number of images to predict on at once.
+    jit_compile: bool
+        Whether to compile each bucket's function with XLA.
+    pad_mode: str
+        `np.pad` mode to pad the images with. The default of "edge" adds no new values to the images, so it
+        does not change the per-image min-max normalisation of models with `normalise_inputs`.
+    """
+
+    def __init__(
+        self,
+        model,
+        buckets: Sequence[Tuple[int, int]] = ((256, 256), (512, 512), (1024, 1024)),
+        batch_size: int = 4,
+        jit_compile: bool = False,
+        pad_mode: str = "edge",
+    ):
+        # Imported here so that the other inference helpers do not need tensorflow
+        import tensorflow as tf  # pylint: disable=import-outside-toplevel
+
+        self._tf = tf
+        self.model = model
+        self.batch_size = batch_size
+        self.jit_compile = jit_compile
+        self.pad_mode = pad_mode
+        self.n_channels = model.input_shape[-1]
+        self.buckets = []
+        self._functions = {}
+        for bucket in buckets:
+            self.add_bucket(bucket)
+
+    def add_bucket(self, bucket: Tuple[int, int]):
+        """Add a shape bucket, keeping the buckets ordered from smallest to largest area.
+
+        Raises
+        ------
+        ValueError
+            If either side of the bucket is not a multiple of 16.
+        """
+        bucket = (int(bucket[0]), int(bucket[1]))
+        if bucket[0] % 16 or bucket[1] % 16 or min(bucket) <= 0:
+            raise ValueError(f"Bucket sides must be positive multiples of 16, got {bucket}.")
+        if bucket in self._functions:
+            return
+        self._functions[bucket] = self._tf.function(
+            self._predict_batch,
+            input_signature=[
+                self._tf.TensorSpec((self.batch_size, *bucket, self.n_channels), self._tf.float32)
+            ],
+            jit_compile=self.jit_compile,
+            reduce_retracing=False,
+        )
+        self.buckets = sorted(self._functions, key=lambda shape: (shape[0] * shape[1], shape))
+
+    def _predict_batch(self, images):
+        """Run the model in inference mode, the function traced for each bucket."""
+        return self.model(images, training=False)
+
+    def bucket_for(self, shape: Tuple[int, int]) -> Tuple[int, int]:
+        """Find the smallest bucket an image of the given (height, width) fits in.
+
+        Images larger than every bucket get a new bucket, rounded up to multiples of 16, with a warning since
+        it has to be traced.
+        """
+        for bucket in self.buckets:
+            if shape[0] <= bucket[0] and shape[1] <= bucket[1]:
+                return bucket
+        bucket = (-(-shape[0] // 16) * 16, -(-shape[1] // 16) * 16)
+        warnings.warn(f"Image of shape {tuple(shape)} is larger than every bucket, adding bucket {bucket}.")
+        self.add_bucket(bucket)
+        return bucket
+
+    def warmup(self) -> Dict[Tuple[int, int], float]:
+        """Trace (and compile if jit_compile) every bucket's function, eg when a service starts.
+
+        Returns
+        -------
+        Dict[Tuple[int, int], float]
+            Seconds taken to warm up each bucket.
+        """
+        timings = {}
+        for bucket in self.buckets:
+            start = time.perf_counter()
+            self._functions[bucket](np.zeros((self.batch_size, *bucket, self.n_channels), dtype=np.float32))
+            timings[bucket] = time.perf_counter() - start
+        return timings
+
+    @property
+    def n_traces(self) -> int:
+        """Total number of times the buckets' functions have been traced."""
+        return sum(function.experimental_get_tracing_count() for function in self._functions.values())
+
+    def predict(self, images: Union[np.ndarray, Sequence[np.ndarray]], **_kwargs) -> Union[np.ndarray, List]:
+        """Predict on images of any size.
+
+        Parameters
+        ----------
+        images: Union[np.ndarray, Sequence[np.ndarray]]
+            Sequence of images of shape (height, width) or (height, width, channels), which may each be a
+            different size, or a stacked batch of images like `model.predict` takes. Other keyword arguments,
+            such as verbose, are ignored so that the predictor can stand in for the model, eg in a
+            `MicroBatchPredictor`.
+
+        Returns
+        -------
+        Union[np.ndarray, List]
+            The prediction for each image, cropped to its size. A stacked batch if the images were a stacked
+            batch, otherwise a list.
+        """
+        stacked = isinstance(images, np.ndarray)
+        images = [
+            np.asarray(image, dtype=np.float32).reshape(*np.shape(image)[:2], self.n_channels) for image in images
+        ]
+
+        # Group the images by bucket, keeping their original positions
+        bucket_indexes = {}
+        for index, image in enumerate(images):
+            bucket_indexes.setdefault(self.bucket_for(image.shape[:2]), []).append(index)
+
+        predictions = [None] * len(images)
+        for bucket, indexes in bucket_indexes.items():
+            for start in range(0, len(indexes), self.batch_size):
+                batch_indexes = indexes[start : start + self.batch_size]
+                batch = np.zeros((self.batch_size, *bucket, self.n_channels), dtype=np.float32)
+                for position, index in enumerate(batch_indexes):
+                    height, width = images[index].shape[:2]
+                    batch[position] = np.pad(
+                        images[index], ((0, bucket[0] - height), (0, bucket[1] - width), (0, 0)), mode=self.pad_mode
+                    )
+                outputs = np.asarray(self._functions[bucket](batch))
+                for position, index in enumerate(batch_indexes):
+                    height, width = images[index].shape[:2]
+                    predictions[index] = outputs[position, :height, :width]
+
+        return np.stack(predictions) if stacked and predictions else predictions
@@ -0,0 +1,27 @@
+"""Custom keras layers for the U-NET models."""
+
+import keras
+from keras import ops
+
+
+@keras.saving.register_keras_serializable(package="sylvialib")
+class MinMaxNormalisation(keras.layers.Layer):
+    """Scale each image in a batch to the range 0 to 1 by its own minimum and maximum.
+
+    This is the normalisation `image_generator` does on the host, moved into the model so that the generator
+    can yield compact uint8 batches, see its `output_dtype` argument. The input is cast to the layer's compute
+    dtype first, so uint8 batches are converted inside the graph. Constant images, which have no range to
+    scale by, become all zeros.
+    """
+
+    def call(self, inputs):  # pylint: disable=arguments-differ
+        inputs = ops.cast(inputs, self.compute_dtype)
+        # Reduce over every axis but the batch axis
+        axes = tuple(range(1, len(inputs.shape)))
+        minimum = ops.min(inputs, axis=axes, keepdims=True)
+        value_range = ops.max(inputs, axis=axes, keepdims=True) - minimum
+        value_range = ops.where(value_range > 0, value_range, ops.ones_like(value_range))
+        return (inputs - minimum) / value_range
+
+    def compute_output_shape(self, input_shape):
+        return input_shape
@@ -0,0 +1,201 @@
+"""A cached manifest of image / mask pairs for training datasets.
+
+The manifest is stored as JSON lines, one image / mask pair per line:
+
+```
+{"index": 0, "image": {"path": "images/image_0.npy", "shape": [512, 512], "dtype": "float64", "size": 2097280,
+ "mtime_ns": 1700000000000000000}, "mask": {...}}
+```
+"""
+
+import json
+import os
+import re
+import warnings
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+from PIL import Image
+
+# Numpy dtypes of the PIL image modes that are likely to be used for images and masks
+PIL_MODE_DTYPES = {
+    "1": "bool",
+    "L": "uint8",
+    "P": "uint8",
+    "RGB": "uint8",
+    "RGBA": "uint8",
+    "I": "int32",
+    "I;16": "uint16",
+    "F": "float32",
+}
+
+
+def read_array_info(path: Path) -> dict:
+    """Read the shape and dtype of a .npy or .png file from its header, without loading the data.
+
+    Parameters
+    ----------
+    path: Path
+        Path to a .npy or .png file.
+
+    Returns
+    -------
+    dict
+        Dictionary with the "shape" as a list and the "dtype" as a string.
+    """
+    path = Path(path)
+    if path.suffix == ".npy":
+        with open(path, "rb") as file:
+            version = np.lib.format.read_magic(file)
+            if version == (1, 0):
+                shape, _fortran_order, dtype = np.lib.format.read_array_header_1_0(file)
+            else:
+                shape, _fortran_order, dtype = np.lib.format.read_array_header_2_0(file)
+        return {"shape": list(shape), "dtype": str(dtype)}
+    if path.suffix == ".png":
+        with Image.open(path) as image:
+            width, height = image.size
+            bands = len(image.getbands())
+            shape = [height, width] if bands == 1 else [height, width, bands]
+            return {"shape": shape, "dtype": PIL_MODE_DTYPES.get(image.mode, image.mode)}
+    raise ValueError("File type must be either .npy or .png")
+
+
+def _file_record(entry: os.DirEntry, previous: Optional[dict]) -> dict:
+    """Build the manifest record for a file, reusing the previous record if the file has not changed."""
+    stat = entry.stat()
+    if (
+        previous is not None
+        and previous["path"] == entry.path
+        and previous["size"] == stat.st_size
+        and previous["mtime_ns"] == stat.st_mtime_ns
+    ):
+        return previous
+    return {
+        "path": entry.path,
+        **read_array_info(Path(entry.path)),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
+
+
+def _scan_indexed_files(directory: Path, prefix: str, file_type: str) -> Dict[int, os.DirEntry]:
+    """Find the `{prefix}_{index}{file_type}` files in a directory with a single scan."""
+    pattern = re.compile(rf"{re.escape(prefix)}_(\d+){re.escape(file_type)}")
+    files = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            match = pattern.fullmatch(entry.name)
+            if match and entry.is_file():
+                files[int(match.group(1))] = entry
+    return files
+
+
+def load_manifest(manifest_path: Path) -> Dict[int, dict]:
+    """Load a manifest saved by `save_manifest`.
+
+    Parameters
+    ----------
+    manifest_path: Path
+        Path to the JSON lines manifest file.
+
+    Returns
+    -------
+    Dict[int, dict]
+        Dictionary mapping each pair index to its record.
+    """
+    manifest = {}
+    with open(manifest_path, encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                record = json.loads(line)
+                manifest[record["index"]] = record
+    return manifest
+
+
+def save_manifest(manifest: Dict[int, dict], manifest_path: Path):
+    """Save a manifest as JSON lines, one image / mask pair per line, sorted by index.
+
+    The file is written to a temporary file first and then moved into place, so readers never see a
+    partially written manifest.
+
+    Parameters
+    ----------
+    manifest: Dict[int, dict]
+        Dictionary mapping each pair index to its record.
+    manifest_path: Path
+        Path to write the JSON lines manifest file to.
+    """
+    manifest_path = Path(manifest_path)
+    temp_path = manifest_path.with_name(manifest_path.name + ".tmp")
+    with open(temp_path, "w", encoding="utf-8") as file:
+        for index in sorted(manifest):
+            file.write(json.dumps(manifest[index], separators=(",", ":")) + "\n")
+    temp_path.replace(manifest_path)
+
+
+def build_manifest(
+    original_image_dir: Path,
+    mask_dir: Path,
+    file_type: str = ".npy",
+    manifest_path: Path = None,
+) -> Dict[int, dict]:
+    """Build a manifest of the `image_{index}` / `mask_{index}` pairs in a dataset.
+
+    Each directory is scanned once. If `manifest_path` points to an existing manifest, the refresh is
+    incremental: files whose size and modification time are unchanged keep their recorded shape and
+    dtype, so only new or changed files have their headers read. Images or masks without a partner are
+    left out of the manifest with a warning. If `manifest_path` is given, the manifest is saved there.
+
+    Example:
+    --------
+    ```
+    >>> manifest = build_manifest(image_dir, mask_dir, manifest_path=image_dir / "manifest.jsonl")
+    >>> generator = image_generator(image_dir, mask_dir, list(manifest), manifest=manifest)
+    ```
+
+    Parameters
+    ----------
+    original_image_dir: Path
+        The directory containing the original images.
+    mask_dir: Path
+        The directory containing the ground truth masks.
+    file_type: str
+        The file type of the images, either ".npy" or ".png".
+    manifest_path: Path
+        Optional path of the JSON lines manifest file to refresh and save.
+
+    Returns
+    -------
+    Dict[int, dict]
+        Dictionary mapping each pair index to a record with the index and the path, shape, dtype, byte
+        size and modification time of both the image and the mask.
+    """
+    if file_type not in (".npy", ".png"):
+        raise ValueError("File type must be either .npy or .png")
+
+    previous = {}
+    if manifest_path is not None and Path(manifest_path).exists():
+        previous = load_manifest(manifest_path)
+
+    images = _scan_indexed_files(original_image_dir, "image", file_type)
+    masks = _scan_indexed_files(mask_dir, "mask", file_type)
+
+    unpaired = sorted(images.keys() ^ masks.keys())
+    if unpaired:
+        warnings.warn(f"Skipping {len(unpaired)} images or masks without a partner, with indexes {unpaired[:10]}")
+
+    manifest = {}
+    for index in sorted(images.keys() & masks.keys()):
+        previous_record = previous.get(index, {})
+        manifest[index] = {
+            "index": index,
+            "image": _file_record(images[index], previous_record.get("image")),
+            "mask": _file_record(masks[index], previous_record.get("mask")),
+        }
+
+    if manifest_path is not None:
+        save_manifest(manifest, manifest_path)
+
+    return manifest
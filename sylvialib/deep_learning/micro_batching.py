@@ -0,0 +1,215 @@
+"""Micro-batching of single image prediction requests for the U-NET models."""
+
+import asyncio
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+import numpy as np
+
+# Placed on the queue to tell the worker thread to stop
+_STOP = object()
+
+
+class MicroBatchPredictor:
+    """Group single image prediction requests from many callers into batched `predict` calls.
+
+    Requests are queued and a background thread collects them into batches of up to `max_batch_size`
+    images, waiting at most `max_wait` seconds after the first request of a batch arrives. Each batch is
+    run through the model as one forward pass and the results handed back to each caller through a
+    `concurrent.futures.Future`, or awaited with `predict_async` from asyncio code.
+
+    Example:
+    --------
+    ```
+    >>> with MicroBatchPredictor(model, max_batch_size=16, max_wait=0.01) as predictor:
+    ...     future = predictor.submit(image)
+    ...     prediction = future.result()
+    ```
+
+    Parameters
+    ----------
+    model
+        A model with a keras-style `predict` method, eg a model from `unet_model` or `multiclass_unet_model`.
+    max_batch_size: int
+        Maximum number of images to run through the model at once.
+    max_wait: float
+        Maximum time in seconds to wait for a batch to fill once the first request has arrived.
+    """
+
+    def __init__(self, model, max_batch_size: int = 16, max_wait: float = 0.005):
+        if max_batch_size < 1:
+            raise ValueError(f"max_batch_size must be at least 1, got {max_batch_size}.")
+        if max_wait < 0:
+            raise ValueError(f"max_wait must not be negative, got {max_wait}.")
+
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._batch_sizes = Counter()
+        self._n_requests = 0
+        self._max_queue_depth = 0
+
+        self._worker = threading.Thread(target=self._run, name="MicroBatchPredictor", daemon=True)
+        self._worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc_info):
+        self.close()
+
+    def submit(self, image: np.ndarray) -> Future:
+        """Queue a single image for prediction.
+
+        Parameters
+        ----------
+        image: np.ndarray
+            A single image, without a batch axis.
+
+        Returns
+        -------
+        Future
+            A future that resolves to the prediction for the image, without a batch axis.
+        """
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Cannot submit to a closed MicroBatchPredictor.")
+            self._n_requests += 1
+            self._queue.put((np.asarray(image), future))
+            self._max_queue_depth = max(self._max_queue_depth, self._queue.qsize())
+        return future
+
+    def predict(self, image: np.ndarray, timeout: float = None) -> np.ndarray:
+        """Predict a single image, blocking until the batch it was placed in has run.
+
+        Parameters
+        ----------
+        image: np.ndarray
+            A single image, without a batch axis.
+        timeout: float
+            Maximum time in seconds to wait for the prediction. The default of None waits forever.
+
+        Returns
+        -------
+        np.ndarray
+            The prediction for the image, without a batch axis.
+        """
+        return self.submit(image).result(timeout=timeout)
+
+    async def predict_async(self, image: np.ndarray) -> np.ndarray:
+        """Predict a single image from asyncio code without blocking the event loop.
+
+        Parameters
+        ----------
+        image: np.ndarray
+            A single image, without a batch axis.
+
+        Returns
+        -------
+        np.ndarray
+            The prediction for the image, without a batch axis.
+        """
+        return await asyncio.wrap_future(self.submit(image))
+
+    def stats(self) -> dict:
+        """Get the queue depth and batch size statistics.
+
+        Returns
+        -------
+        dict
+            Dictionary with the current and maximum queue depths, the number of requests and batches, the
+            mean and maximum batch sizes, and a histogram mapping each batch size to the number of batches
+            of that size.
+        """
+        with self._lock:
+            n_batches = sum(self._batch_sizes.values())
+            n_batched = sum(size * count for size, count in self._batch_sizes.items())
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self._max_queue_depth,
+                "requests": self._n_requests,
+                "batches": n_batches,
+                "mean_batch_size": n_batched / n_batches if n_batches else 0.0,
+                "max_batch_size": max(self._batch_sizes, default=0),
+                "batch_size_histogram": dict(sorted(self._batch_sizes.items())),
+            }
+
+    def close(self, timeout: float = None):
+        """Stop accepting requests, finish the requests already queued and stop the worker thread.
+
+        Parameters
+        ----------
+        timeout: float
+            Maximum time in seconds to wait for the worker thread to finish. The default of None waits forever.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        self._worker.join(timeout=timeout)
+
+    def _collect_batch(self) -> tuple:
+        """Block until a request arrives, then collect requests until the batch is full or the wait expires.
+
+        Returns a list of (image, future) pairs, and whether the stop sentinel was reached.
+        """
+        first = self._queue.get()
+        if first is _STOP:
+            return [], True
+
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run_batch(self, batch: list):
+        """Run a batch of requests through the model and resolve their futures."""
+        # Requests of different shapes cannot be stacked, so run one forward pass per shape
+        groups = {}
+        for image, future in batch:
+            groups.setdefault((image.shape, image.dtype), []).append((image, future))
+
+        for group in groups.values():
+            # Skip requests whose callers have cancelled them
+            group = [(image, future) for image, future in group if future.set_running_or_notify_cancel()]
+            if not group:
+                continue
+            images, futures = zip(*group)
+            try:
+                predictions = self.model.predict(np.stack(images), verbose=0)
+            # Pass any model error on to the callers rather than killing the worker thread
+            # pylint: disable=broad-exception-caught
+            except Exception as error:
+                for future in futures:
+                    future.set_exception(error)
+                continue
+
+            with self._lock:
+                self._batch_sizes[len(images)] += 1
+            for future, prediction in zip(futures, predictions):
+                future.set_result(prediction)
+
+    def _run(self):
+        """Worker thread loop. Requests queued before close was called are still run."""
+        stopping = False
+        while not stopping:
+            batch, stopping = self._collect_batch()
+            if batch:
+                self._run_batch(batch)
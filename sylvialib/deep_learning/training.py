@@ -0,0 +1,375 @@
+"""Data parallel training of the U-NET models on CPU, with tf.distribute.
+
+A single training process fed by one `image_generator` leaves most of a many core CPU node idle. `train` builds
+the model inside a `tf.distribute` strategy and feeds every replica its own shard of the images:
+
+- Mirrored: one process, the CPU split into several logical devices, one replica per device.
+- Multi-worker: several processes, on one machine or many, described by the `TF_CONFIG` environment variable.
+
+The global batch size is the per-replica batch size times the number of replicas, and the learning rate is
+scaled linearly with the number of replicas.
+
+Start a mirrored run on 4 logical CPU devices with
+
+```
+python -m sylvialib.deep_learning.training --original-image-dir images --mask-dir masks --n-local-devices 4
+```
+
+and a multi-worker run by starting the same command in each worker process, each with its own `TF_CONFIG`, eg
+`{"cluster": {"worker": ["localhost:12345", "localhost:12346"]}, "task": {"type": "worker", "index": 0}}`.
+"""
+
+import argparse
+import functools
+import gc
+import json
+import os
+import warnings
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+import keras
+import tensorflow as tf
+
+from sylvialib.deep_learning.generator import image_generator
+from sylvialib.deep_learning.manifest import load_manifest
+from sylvialib.deep_learning.unet_binary_class import unet_model
+
+# The generator resizes every image to this size
+IMAGE_SIZE = 512
+
+
+def _is_multi_worker() -> bool:
+    """Whether TF_CONFIG describes a cluster of more than one worker."""
+    tf_config = json.loads(os.environ.get("TF_CONFIG", "{}"))
+    cluster = tf_config.get("cluster", {})
+    return len(cluster.get("worker", [])) + len(cluster.get("chief", [])) > 1
+
+
+def make_strategy(n_local_devices: int = None) -> tf.distribute.Strategy:
+    """Make a multi-worker strategy if TF_CONFIG describes a cluster, otherwise a mirrored strategy over logical
+    CPU devices.
+
+    Must be called before anything else initialises the TensorFlow runtime, since the logical devices and the
+    multi-worker collectives cannot be set up afterwards.
+
+    Parameters
+    ----------
+    n_local_devices: int
+        Number of logical CPU devices to split the CPU into for a mirrored strategy. Defaults to one. Ignored for
+        multi-worker training.
+
+    Returns
+    -------
+    tf.distribute.Strategy
+        The distribution strategy.
+    """
+    if _is_multi_worker():
+        return tf.distribute.MultiWorkerMirroredStrategy()
+
+    n_local_devices = 1 if n_local_devices is None else n_local_devices
+    cpus = tf.config.list_physical_devices("CPU")
+    try:
+        tf.config.set_logical_device_configuration(
+            cpus[0], [tf.config.LogicalDeviceConfiguration() for _ in range(n_local_devices)]
+        )
+    except RuntimeError:
+        # The runtime is already initialised, use whichever logical devices exist
+        pass
+    devices = [device.name for device in tf.config.list_logical_devices("CPU")]
+    if len(devices) != n_local_devices:
+        warnings.warn(
+            f"Requested {n_local_devices} logical CPU devices but the TensorFlow runtime was already initialised "
+            f"with {len(devices)}, using those."
+        )
+    return tf.distribute.MirroredStrategy(devices=devices)
+
+
+def shard_indexes(image_indexes: list, n_shards: int, shard_index: int) -> list:
+    """Take every n_shards-th image index, starting from shard_index, so that the shards are disjoint.
+
+    Raises
+    ------
+    ValueError
+        If there are fewer image indexes than shards, which would leave a shard empty.
+    """
+    if len(image_indexes) < n_shards:
+        raise ValueError(f"Cannot split {len(image_indexes)} images into {n_shards} disjoint shards.")
+    return list(image_indexes)[shard_index::n_shards]
+
+
+def make_dataset_fn(  # pylint: disable=too-many-arguments
+    original_image_dir: Path,
+    mask_dir: Path,
+    image_indexes: list,
+    global_batch_size: int,
+    *,
+    file_type: str = ".npy",
+    manifest: dict = None,
+    output_dtype: str = "float32",
+) -> Callable[[tf.distribute.InputContext], tf.data.Dataset]:
+    """Make a dataset function for `strategy.distribute_datasets_from_function` that gives each replica a
+    disjoint shard of the images.
+
+    The function is called once per worker. The worker's dataset cycles between one `image_generator` per local
+    replica, and the strategy hands consecutive batches to consecutive replicas, so each replica only sees its
+    own shard.
+
+    Parameters
+    ----------
+    original_image_dir: Path
+        The directory containing the original images.
+    mask_dir: Path
+        The directory containing the ground truth masks.
+    image_indexes: list
+        Indexes of the images to train on, shared between all the replicas.
+    global_batch_size: int
+        Batch size summed over every replica.
+    file_type: str
+        The file type of the images.
+    manifest: dict
+        Optional manifest from `build_manifest` or `load_manifest`.
+    output_dtype: str
+        Data type of the batches, "float32" or "uint8", see `image_generator`.
+
+    Returns
+    -------
+    Callable[[tf.distribute.InputContext], tf.data.Dataset]
+        The dataset function.
+    """
+
+    def dataset_fn(input_context: tf.distribute.InputContext) -> tf.data.Dataset:
+        batch_size = input_context.get_per_replica_batch_size(global_batch_size)
+        local_replicas = input_context.num_replicas_in_sync // input_context.num_input_pipelines
+        signature = (
+            tf.TensorSpec((batch_size, IMAGE_SIZE, IMAGE_SIZE), output_dtype),
+            tf.TensorSpec((batch_size, IMAGE_SIZE, IMAGE_SIZE), output_dtype),
+        )
+
+        datasets = []
+        for local_replica in range(local_replicas):
+            shard = shard_indexes(
+                image_indexes,
+                input_context.num_replicas_in_sync,
+                input_context.input_pipeline_id * local_replicas + local_replica,
+            )
+            datasets.append(
+                tf.data.Dataset.from_generator(
+                    # Bind the shard now, not when the generator is first called
+                    lambda shard=shard: image_generator(
+                        original_image_dir,
+                        mask_dir,
+                        shard,
+                        batch_size=batch_size,
+                        file_type=file_type,
+                        manifest=manifest,
+                        output_dtype=output_dtype,
+                    ),
+                    output_signature=signature,
+                )
+            )
+        dataset = tf.data.Dataset.choose_from_datasets(datasets, tf.data.Dataset.range(local_replicas).repeat())
+        # Add the channel axis that the models expect
+        dataset = dataset.map(lambda images, masks: (images[..., tf.newaxis], masks[..., tf.newaxis]))
+        return dataset.prefetch(tf.data.AUTOTUNE)
+
+    return dataset_fn
+
+
+def _replica_loss(losses: tf.Tensor, global_batch_size: int, n_replicas: int) -> tf.Tensor:
+    """Scale a replica's loss so that summing it over the replicas gives the mean loss of the global batch.
+
+    Losses with a value per image or per pixel are averaged per image then over the global batch. Losses that
+    are already reduced to a scalar, such as `iou_loss`, are averaged over the replicas.
+    """
+    if losses.shape.rank == 0:
+        return losses / n_replicas
+    per_image_losses = tf.reduce_mean(tf.reshape(losses, [tf.shape(losses)[0], -1]), axis=1)
+    return tf.nn.compute_average_loss(per_image_losses, global_batch_size=global_batch_size)
+
+
+def _make_train_step(
+    model: keras.Model, strategy: tf.distribute.Strategy, global_batch_size: int
+) -> Callable[[tf.distribute.DistributedIterator], tf.Tensor]:
+    """Make a function that runs one training step on every replica, with the next global batch from a distributed
+    iterator, and returns the mean loss of the batch."""
+    loss_fn = keras.losses.get(model.loss)
+    n_classes = model.output_shape[-1]
+
+    def step_fn(images: tf.Tensor, masks: tf.Tensor) -> tf.Tensor:
+        with tf.GradientTape() as tape:
+            predictions = model(images, training=True)
+            if n_classes > 1:
+                # The masks hold class indexes, multi class models predict a score per class
+                targets = tf.one_hot(tf.cast(masks[..., 0], tf.int32), n_classes, dtype=predictions.dtype)
+            else:
+                targets = tf.cast(masks, predictions.dtype)
+            loss = _replica_loss(loss_fn(targets, predictions), global_batch_size, strategy.num_replicas_in_sync)
+        gradients = tape.gradient(loss, model.trainable_variables)
+        model.optimizer.apply_gradients(zip(gradients, model.trainable_variables))
+        return loss
+
+    @tf.function
+    def train_step(iterator) -> tf.Tensor:
+        per_replica_losses = strategy.run(step_fn, args=next(iterator))
+        return strategy.reduce(tf.distribute.ReduceOp.SUM, per_replica_losses, axis=None)
+
+    return train_step
+
+
+def train(  # pylint: disable=too-many-arguments,too-many-locals
+    original_image_dir: Path,
+    mask_dir: Path,
+    image_indexes: list = None,
+    *,
+    model_fn: Callable = unet_model,
+    per_replica_batch_size: int = 4,
+    base_learning_rate: float = 0.001,
+    epochs: int = 1,
+    steps_per_epoch: int = 100,
+    strategy: tf.distribute.Strategy = None,
+    n_local_devices: int = None,
+    file_type: str = ".npy",
+    manifest: dict = None,
+    output_dtype: str = "float32",
+    verbose: bool = True,
+) -> Tuple[keras.Model, Dict[str, List[float]]]:
+    """Train a model data parallel across the replicas of a distribution strategy.
+
+    Uses a custom training loop with `strategy.run` rather than `model.fit`, since keras cannot fit on a
+    multi-worker distributed dataset. The model's compiled optimizer and loss are used.
+
+    Parameters
+    ----------
+    original_image_dir: Path
+        The directory containing the original images.
+    mask_dir: Path
+        The directory containing the ground truth masks.
+    image_indexes: list
+        Indexes of the images to train on. May be None if a manifest is given, to use every pair in it.
+    model_fn: Callable
+        Function taking img_height, img_width, img_channels and learning_rate and returning a compiled model, eg
+        `unet_model`. It is called inside the strategy scope so that the variables are mirrored. If the model
+        has more than one output channel, eg `multiclass_unet_model`, the masks are one hot encoded to match.
+    per_replica_batch_size: int
+        Batch size of each replica, the global batch size is this times the number of replicas.
+    base_learning_rate: float
+        Learning rate for a single replica, scaled linearly with the number of replicas.
+    epochs: int
+        Number of epochs to train for.
+    steps_per_epoch: int
+        Number of global batches per epoch, the generator is infinite.
+    strategy: tf.distribute.Strategy
+        Distribution strategy, by default made with `make_strategy`.
+    n_local_devices: int
+        Number of logical CPU devices for the default mirrored strategy.
+    file_type: str
+        The file type of the images.
+    manifest: dict
+        Optional manifest from `build_manifest` or `load_manifest`.
+    output_dtype: str
+        Data type of the batches, "float32" or "uint8", see `image_generator`. uint8 batches need a model that
+        normalises its inputs, eg `functools.partial(unet_model, normalise_inputs=True)`.
+    verbose: bool
+        Print the loss after each epoch.
+
+    Returns
+    -------
+    keras.Model
+        The trained model.
+    Dict[str, List[float]]
+        The mean loss of each epoch, under "loss".
+    """
+    if strategy is None:
+        strategy = make_strategy(n_local_devices)
+    if image_indexes is None:
+        if manifest is None:
+            raise ValueError("image_indexes must be given if there is no manifest")
+        image_indexes = sorted(manifest)
+
+    n_replicas = strategy.num_replicas_in_sync
+    global_batch_size = per_replica_batch_size * n_replicas
+    learning_rate = base_learning_rate * n_replicas
+
+    with strategy.scope():
+        model = model_fn(IMAGE_SIZE, IMAGE_SIZE, 1, learning_rate=learning_rate)
+        # Create the optimizer's variables now, building them lazily inside the mirrored train step fails
+        model.optimizer.build(model.trainable_variables)
+    train_step = _make_train_step(model, strategy, global_batch_size)
+
+    dataset = strategy.distribute_datasets_from_function(
+        make_dataset_fn(
+            original_image_dir,
+            mask_dir,
+            image_indexes,
+            global_batch_size,
+            file_type=file_type,
+            manifest=manifest,
+            output_dtype=output_dtype,
+        )
+    )
+    iterator = iter(dataset)
+    history = {"loss": []}
+    for epoch in range(epochs):
+        epoch_loss = sum(float(train_step(iterator)) for _ in range(steps_per_epoch)) / steps_per_epoch
+        history["loss"].append(epoch_loss)
+        if verbose:
+            print(f"Epoch {epoch + 1}/{epochs} - loss: {epoch_loss:.4f}")
+
+    # The iterator holds threads running the infinite generators, which stop multi-worker processes from exiting
+    # unless it is released
+    del iterator
+    gc.collect()
+    return model, history
+
+
+def _is_chief(strategy: tf.distribute.Strategy) -> bool:
+    """Whether this process should save the model, the first worker in multi-worker training."""
+    resolver = getattr(strategy, "cluster_resolver", None)
+    return resolver is None or resolver.task_type in (None, "chief") or (
+        resolver.task_type == "worker" and resolver.task_id == 0
+    )
+
+
+def main(argv: List[str] = None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Data parallel training of the binary U-NET on CPU.")
+    parser.add_argument("--original-image-dir", type=Path, required=True, help="Directory of training images.")
+    parser.add_argument("--mask-dir", type=Path, required=True, help="Directory of ground truth masks.")
+    parser.add_argument("--manifest", type=Path, default=None, help="Optional manifest of the image pairs.")
+    parser.add_argument("--image-indexes", type=int, nargs="+", default=None, help="Indexes to train on.")
+    parser.add_argument("--file-type", default=".npy", help="File type of the images.")
+    parser.add_argument("--n-local-devices", type=int, default=None, help="Logical CPU devices for mirroring.")
+    parser.add_argument("--per-replica-batch-size", type=int, default=4, help="Batch size of each replica.")
+    parser.add_argument("--learning-rate", type=float, default=0.001, help="Learning rate for one replica.")
+    parser.add_argument("--epochs", type=int, default=1, help="Number of epochs.")
+    parser.add_argument("--steps-per-epoch", type=int, default=100, help="Global batches per epoch.")
+    parser.add_argument(
+        "--uint8", action="store_true", help="Move uint8 batches and normalise them inside the model."
+    )
+    parser.add_argument("--output", type=Path, default=None, help="Path to save the trained .keras model to.")
+    args = parser.parse_args(argv)
+
+    # Make the strategy first, before anything else initialises the TensorFlow runtime
+    strategy = make_strategy(args.n_local_devices)
+    manifest = load_manifest(args.manifest) if args.manifest is not None else None
+    model, _ = train(
+        args.original_image_dir,
+        args.mask_dir,
+        image_indexes=args.image_indexes,
+        model_fn=functools.partial(unet_model, normalise_inputs=args.uint8),
+        per_replica_batch_size=args.per_replica_batch_size,
+        base_learning_rate=args.learning_rate,
+        epochs=args.epochs,
+        steps_per_epoch=args.steps_per_epoch,
+        strategy=strategy,
+        file_type=args.file_type,
+        manifest=manifest,
+        output_dtype="uint8" if args.uint8 else "float32",
+    )
+    if args.output is not None and _is_chief(strategy):
+        model.save(args.output)
+
+
+if __name__ == "__main__":
+    main()
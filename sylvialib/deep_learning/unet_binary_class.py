@@ -11,6 +11,8 @@ from keras.layers import (
 )
 from keras.optimizers import Adam
 
+from sylvialib.deep_learning.layers import MinMaxNormalisation
+
 # Disable pylint line too long since this is much more readable with each layer on its own line
 # pylint: disable=line-too-long
 
@@ -18,17 +20,24 @@ from keras.optimizers import Adam
 # pylint: disable=too-many-locals
 
 
-def unet_model(img_height: int, img_width: int, img_channels: int, learning_rate: float = 0.001):
-    """U-NET model definition function."""
+def unet_model(
+    img_height: int, img_width: int, img_channels: int, learning_rate: float = 0.001, normalise_inputs: bool = False
+):
+    """U-NET model definition function.
+
+    If normalise_inputs is True, each input image is min-max scaled inside the model by a `MinMaxNormalisation`
+    layer, to train on the uint8 batches from `image_generator(..., output_dtype="uint8")`.
+    """
 
     inputs = Input((img_height, img_width, img_channels))
+    scaled = MinMaxNormalisation()(inputs) if normalise_inputs else inputs
 
     # Downsampling
     # Downsample with increasing numbers of filters to try to capture more complex features (first argument)
     # Dropout is used to try to prevent overfitting. Increase if overfitting happens.
     # Dropout increases deeper into the model to further help prevent overfitting.
 
-    conv1 = Conv2D(16, kernel_size=(3, 3), activation="relu", kernel_initializer="he_normal", padding="same")(inputs)
+    conv1 = Conv2D(16, kernel_size=(3, 3), activation="relu", kernel_initializer="he_normal", padding="same")(scaled)
     conv1 = Dropout(0.1)(conv1)
     conv1 = Conv2D(16, kernel_size=(3, 3), activation="relu", kernel_initializer="he_normal", padding="same")(conv1)
     pooled1 = MaxPooling2D((2, 2))(conv1)
@@ -85,7 +94,7 @@ def unet_model(img_height: int, img_width: int, img_channels: int, learning_rate
     # Sigmoid activation function to force output to be between 0 and 1
     outputs = Conv2D(1, kernel_size=(1, 1), activation="sigmoid")(conv9)
 
-    optimiser = Adam(lr=learning_rate)
+    optimiser = Adam(learning_rate=learning_rate)
 
     # Compile the model
     model = Model(inputs=[inputs], outputs=[outputs])
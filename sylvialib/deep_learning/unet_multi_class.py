@@ -12,6 +12,8 @@ from keras.layers import (
 from keras.optimizers import Adam
 import tensorflow as tf
 
+from sylvialib.deep_learning.layers import MinMaxNormalisation
+
 NUM_CLASSES = 3
 
 # def mean_iou(y_true, y_pred):
@@ -27,6 +29,8 @@ NUM_CLASSES = 3
 
 def mean_iou(y_true, y_pred):
     """Mean Intersection Over Union metric, ignoring the background class."""
+    # Masks may be uint8, see the output_dtype of image_generator
+    y_true = tf.cast(y_true, y_pred.dtype)
     y_true_f = tf.reshape(y_true[:, :, :, 1:], [-1])  # ignore background class
     y_pred_f = tf.round(tf.reshape(y_pred[:, :, :, 1:], [-1]))  # ignore background class
     intersect = tf.reduce_sum(y_true_f * y_pred_f)
@@ -51,6 +55,7 @@ def mean_iou(y_true, y_pred):
 
 def iou_loss(y_true, y_pred):
     """IoU Loss for 2 tensors, ignoring the background class."""
+    y_true = tf.cast(y_true, y_pred.dtype)
     y_true_f = tf.reshape(y_true[:, :, :, 1:], [-1])  # ignore background class
     y_pred_f = tf.reshape(y_pred[:, :, :, 1:], [-1])  # ignore background class
     intersection = tf.reduce_sum(y_true_f * y_pred_f)
@@ -75,7 +80,7 @@ def dice_coefficient(y_true, y_pred):
     # y_true_f = tf.reshape(y_true[:, :, :, 1:], [-1])  # ignore background class
     # y_pred_f = tf.reshape(y_pred[:, :, :, 1:], [-1])  # ignore background class
     # don't ignore background class
-    y_true_f = tf.reshape(y_true, [-1])
+    y_true_f = tf.reshape(tf.cast(y_true, y_pred.dtype), [-1])
     y_pred_f = tf.reshape(y_pred, [-1])
     intersection = tf.reduce_sum(y_true_f * y_pred_f)
     return (2.0 * intersection + 1.0) / (tf.reduce_sum(y_true_f) + tf.reduce_sum(y_pred_f) + 1.0)
@@ -93,10 +98,15 @@ def dice_accuracy(y_true, y_pred):
 
 # Disable pylint warning about too many local variables, since this is a model definition and uses many variables
 # pylint: disable=too-many-locals
-def multiclass_unet_model(img_height, img_width, img_channels, learning_rate=0.001):
-    """U-NET model definition function."""
+def multiclass_unet_model(img_height, img_width, img_channels, learning_rate=0.001, normalise_inputs=False):
+    """U-NET model definition function.
+
+    If normalise_inputs is True, each input image is min-max scaled inside the model by a `MinMaxNormalisation`
+    layer, to train on the uint8 batches from `image_generator(..., output_dtype="uint8")`.
+    """
 
     inputs = Input((img_height, img_width, img_channels))
+    scaled = MinMaxNormalisation()(inputs) if normalise_inputs else inputs
     # inputs = Input(shape=(None, None, IMG_CHANNELS))
 
     # Downsampling
@@ -104,7 +114,7 @@ def multiclass_unet_model(img_height, img_width, img_channels, learning_rate=0.0
     # Dropout is used to try to prevent overfitting. Increase if overfitting happens.
     # Dropout increases deeper into the model to further help prevent overfitting.
 
-    conv1 = Conv2D(16, kernel_size=(3, 3), activation="relu", kernel_initializer="he_normal", padding="same")(inputs)
+    conv1 = Conv2D(16, kernel_size=(3, 3), activation="relu", kernel_initializer="he_normal", padding="same")(scaled)
     conv1 = Dropout(0.1)(conv1)
     conv1 = Conv2D(16, kernel_size=(3, 3), activation="relu", kernel_initializer="he_normal", padding="same")(conv1)
     pooled1 = MaxPooling2D((2, 2))(conv1)
@@ -0,0 +1,420 @@
+"""Per-grain statistics for batches of segmentation predictions."""
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+import numpy as np
+from scipy.ndimage import binary_fill_holes, find_objects, label
+
+from sylvialib.numpy_scripts import calculate_curvature_periodic_boundary
+
+# Columns of the table returned by grain_statistics, in order
+GRAIN_STATISTICS_COLUMNS = (
+    "image_index",
+    "label",
+    "class",
+    "area",
+    "min_row",
+    "min_col",
+    "max_row",
+    "max_col",
+    "centroid_row",
+    "centroid_col",
+    "perimeter",
+    "n_neighbours",
+)
+
+
+def label_prediction(prediction: np.ndarray, threshold: float = 0.5) -> Tuple[np.ndarray, np.ndarray]:
+    """Turn a single predicted mask into a label image of connected grains.
+
+    Single channel predictions are thresholded, multi channel (softmax) predictions are converted to
+    classes with an argmax, where class 0 is background. Each class is labelled separately, so grains of
+    different classes that touch each other are different grains.
+
+    Parameters
+    ----------
+    prediction: np.ndarray
+        Predicted mask with shape (height, width) or (height, width, channels).
+    threshold: float
+        Threshold for single channel predictions.
+
+    Returns
+    -------
+    np.ndarray
+        2D label image where 0 is background and each grain has a unique label from 1 upwards.
+    np.ndarray
+        1D array of the class of each grain, where index i holds the class of label i + 1.
+    """
+    if prediction.ndim == 3 and prediction.shape[-1] == 1:
+        prediction = prediction[..., 0]
+    if prediction.ndim == 2:
+        classes = (prediction > threshold).astype(np.intp)
+        n_classes = 2
+    elif prediction.ndim == 3:
+        classes = np.argmax(prediction, axis=-1)
+        n_classes = prediction.shape[-1]
+    else:
+        raise ValueError(
+            f"prediction must have shape (height, width) or (height, width, channels), got {prediction.shape}."
+        )
+
+    labels = np.zeros(classes.shape, dtype=np.int32)
+    grain_classes = []
+    for class_index in range(1, n_classes):
+        class_labels, n_grains = label(classes == class_index)
+        in_class = class_labels > 0
+        labels[in_class] = class_labels[in_class] + len(grain_classes)
+        grain_classes.extend([class_index] * n_grains)
+
+    return labels, np.array(grain_classes, dtype=np.intp)
+
+
+def _perimeters_and_neighbours(labels: np.ndarray, n_grains: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Count the pixel edges around each grain of a label image and the number of grains it shares an edge with."""
+    # Compare every pixel with its right and lower neighbour, padding with background so the image border
+    # counts towards the perimeter
+    padded = np.pad(labels, 1)
+    pairs = [
+        (padded[:, :-1].ravel(), padded[:, 1:].ravel()),
+        (padded[:-1, :].ravel(), padded[1:, :].ravel()),
+    ]
+    first = np.concatenate([pair[0] for pair in pairs])
+    second = np.concatenate([pair[1] for pair in pairs])
+    differs = first != second
+    first = first[differs]
+    second = second[differs]
+
+    # Each differing edge adds to the perimeter of the grain on both sides of it
+    perimeter = np.bincount(np.concatenate([first, second]), minlength=n_grains + 1)[1:]
+
+    # Count each neighbouring pair of grains once in each direction
+    both_grains = (first > 0) & (second > 0)
+    neighbour_pairs = np.concatenate(
+        [
+            np.stack([first[both_grains], second[both_grains]], axis=1),
+            np.stack([second[both_grains], first[both_grains]], axis=1),
+        ]
+    )
+    neighbour_pairs = np.unique(neighbour_pairs, axis=0)
+    n_neighbours = np.bincount(neighbour_pairs[:, 0], minlength=n_grains + 1)[1:]
+    return perimeter, n_neighbours
+
+
+def image_grain_statistics(labels: np.ndarray, grain_classes: np.ndarray = None) -> Dict[str, np.ndarray]:
+    """Calculate statistics for every grain in a label image using labelled array reductions.
+
+    Notes:
+    - The perimeter is the number of pixel edges between the grain and anything else, including the image border.
+    - Neighbours are grains that share a pixel edge, diagonals do not count as touching, as in `find_touching_pixels`.
+    - Bounding box maxima are exclusive, so can be used directly as slice ends.
+
+    Parameters
+    ----------
+    labels: np.ndarray
+        2D label image where 0 is background and grains are labelled consecutively from 1.
+    grain_classes: np.ndarray
+        Optional 1D array of the class of each grain, as returned by `label_prediction`. Defaults to all 1.
+
+    Returns
+    -------
+    Dict[str, np.ndarray]
+        Columnar table with one row per grain. The `image_index` column is filled with zeros.
+    """
+    labels = np.asarray(labels)
+    n_grains = int(labels.max(initial=0))
+    if grain_classes is None:
+        grain_classes = np.ones(n_grains, dtype=np.intp)
+    flat_labels = labels.ravel()
+
+    area = np.bincount(flat_labels, minlength=n_grains + 1)[1:]
+
+    rows, cols = np.indices(labels.shape)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        centroid_row = np.bincount(flat_labels, weights=rows.ravel(), minlength=n_grains + 1)[1:] / area
+        centroid_col = np.bincount(flat_labels, weights=cols.ravel(), minlength=n_grains + 1)[1:] / area
+
+    bounding_boxes = np.zeros((n_grains, 4), dtype=np.intp)
+    # find_objects takes the max of the labels when max_label is 0, which fails on empty images
+    if n_grains > 0:
+        for index, slices in enumerate(find_objects(labels, max_label=n_grains)):
+            if slices is not None:
+                bounding_boxes[index] = (slices[0].start, slices[1].start, slices[0].stop, slices[1].stop)
+
+    perimeter, n_neighbours = _perimeters_and_neighbours(labels, n_grains)
+
+    return {
+        "image_index": np.zeros(n_grains, dtype=np.intp),
+        "label": np.arange(1, n_grains + 1, dtype=np.intp),
+        "class": np.asarray(grain_classes, dtype=np.intp),
+        "area": area,
+        "min_row": bounding_boxes[:, 0],
+        "min_col": bounding_boxes[:, 1],
+        "max_row": bounding_boxes[:, 2],
+        "max_col": bounding_boxes[:, 3],
+        "centroid_row": centroid_row,
+        "centroid_col": centroid_col,
+        "perimeter": perimeter,
+        "n_neighbours": n_neighbours,
+    }
+
+
+def _prediction_grain_statistics(task: Tuple[int, np.ndarray, float]) -> Dict[str, np.ndarray]:
+    """Label a single prediction and calculate its grain statistics. Module level so it can be pickled."""
+    image_index, prediction, threshold = task
+    labels, grain_classes = label_prediction(prediction, threshold=threshold)
+    table = image_grain_statistics(labels, grain_classes)
+    table["image_index"][:] = image_index
+    return table
+
+
+def grain_statistics(predictions: np.ndarray, threshold: float = 0.5, n_workers: int = None) -> Dict[str, np.ndarray]:
+    """Calculate per-grain statistics for a stack of predicted masks, eg the output of `model.predict`.
+
+    Each prediction is thresholded (or argmaxed for multi channel predictions), labelled into connected
+    grains and reduced to a table of statistics without looping over the grains in Python.
+
+    Example:
+    --------
+    ```
+    >>> table = grain_statistics(model.predict(images), threshold=0.5, n_workers=4)
+    >>> large_grains = table["label"][table["area"] > 100]
+    ```
+
+    Parameters
+    ----------
+    predictions: np.ndarray
+        Stack of predicted masks with shape (batch, height, width) or (batch, height, width, channels).
+    threshold: float
+        Threshold for single channel predictions.
+    n_workers: int
+        Number of processes to spread the images across. The default of None runs in the current process.
+
+    Returns
+    -------
+    Dict[str, np.ndarray]
+        Columnar table with one row per grain, with the columns listed in `GRAIN_STATISTICS_COLUMNS`. The
+        `image_index` column gives the index of the prediction each grain came from, and `label` the label
+        of the grain in that prediction's label image.
+    """
+    tasks = [(image_index, prediction, threshold) for image_index, prediction in enumerate(predictions)]
+    if n_workers is None:
+        tables = [_prediction_grain_statistics(task) for task in tasks]
+    else:
+        chunksize = max(1, len(tasks) // (4 * n_workers))
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            tables = list(executor.map(_prediction_grain_statistics, tasks, chunksize=chunksize))
+
+    if not tables:
+        return {
+            column: np.zeros(0, dtype=np.float64 if column.startswith("centroid") else np.intp)
+            for column in GRAIN_STATISTICS_COLUMNS
+        }
+    return {column: np.concatenate([table[column] for table in tables]) for column in GRAIN_STATISTICS_COLUMNS}
+
+
+def grain_boundaries(labels: np.ndarray) -> np.ndarray:
+    """Find the boundary pixels of every grain at once, the pixels of a grain with a 4-neighbour outside it.
+
+    Pixels on the image border count as boundary pixels, as with the perimeter in `image_grain_statistics`.
+
+    Parameters
+    ----------
+    labels: np.ndarray
+        2D label image where 0 is background and grains are labelled consecutively from 1.
+
+    Returns
+    -------
+    np.ndarray
+        Label image of only the boundary pixels of each grain.
+    """
+    labels = np.asarray(labels)
+    padded = np.pad(labels, 1)
+    centre = padded[1:-1, 1:-1]
+    boundary = (
+        (centre != padded[:-2, 1:-1])
+        | (centre != padded[2:, 1:-1])
+        | (centre != padded[1:-1, :-2])
+        | (centre != padded[1:-1, 2:])
+    )
+    return np.where(boundary, labels, 0)
+
+
+# The 8 neighbours of a pixel as (row, col) offsets, clockwise on screen starting from the west neighbour. Bit i of
+# a pixel's neighbour code is set if the neighbour at _MOORE_NEIGHBOURS[i] is part of the grain.
+_MOORE_NEIGHBOURS = np.array([[0, -1], [-1, -1], [-1, 0], [-1, 1], [0, 1], [1, 1], [1, 0], [1, -1]])
+
+
+def _build_moore_lookup_table() -> np.ndarray:
+    """Build the Moore neighbour tracing step for every neighbour code and search direction.
+
+    Tracing searches a pixel's neighbours clockwise from a background neighbour, the search direction, and moves
+    to the first neighbour in the grain. Entry [code, direction] holds the neighbour moved to and the search
+    direction from that neighbour, which points at the background neighbour checked just before it, or -1 for
+    both if no neighbour is in the grain.
+    """
+    offset_directions = {tuple(offset): direction for direction, offset in enumerate(_MOORE_NEIGHBOURS.tolist())}
+    table = np.full((256, 8, 2), -1, dtype=np.intp)
+    for code in range(256):
+        for direction in range(8):
+            for turn in range(1, 9):
+                neighbour = (direction + turn) % 8
+                if code >> neighbour & 1:
+                    background = _MOORE_NEIGHBOURS[(neighbour - 1) % 8] - _MOORE_NEIGHBOURS[neighbour]
+                    table[code, direction] = neighbour, offset_directions[tuple(background.tolist())]
+                    break
+    return table
+
+
+_MOORE_STEPS = _build_moore_lookup_table()
+
+
+def _order_boundary(grain: np.ndarray) -> np.ndarray:
+    """Order the outer boundary pixels of a single grain into a loop, anticlockwise in (col, row) coordinates so
+    that convex boundaries have positive curvature.
+
+    Holes are filled first so that only the outer boundary is followed. The boundary pixels and their neighbour
+    codes are found in one vectorised pass with `grain_boundaries`, then ordered by Moore neighbour tracing, which
+    only steps through a lookup table per boundary pixel. Parts of the grain only one pixel wide, such as lines
+    and spurs, are traced out along one side and back along the other, like a contour.
+    """
+    mask = np.pad(binary_fill_holes(grain), 1)
+    _, width = mask.shape
+    pixels = np.flatnonzero(grain_boundaries(mask.astype(np.int8)))
+    neighbour_pixels = pixels[:, np.newaxis] + _MOORE_NEIGHBOURS[:, 0] * width + _MOORE_NEIGHBOURS[:, 1]
+    steps = _MOORE_STEPS[(mask.ravel()[neighbour_pixels].astype(np.intp) << np.arange(8)).sum(axis=1)].tolist()
+    # Neighbours moved to are always boundary pixels, so can be walked by their index in pixels
+    neighbour_ids = np.searchsorted(pixels, neighbour_pixels).tolist()
+
+    # The first pixel in raster order has background to its west, so start searching from there
+    loop = [0]
+    direction = 0
+    first_step = None
+    while True:
+        neighbour, next_direction = steps[loop[-1]][direction]
+        # A single pixel grain has no neighbours to move to
+        if neighbour < 0:
+            break
+        step = (loop[-1], neighbour_ids[loop[-1]][neighbour])
+        # Stop on repeating the first step, as the start pixel can be passed through before the loop closes
+        if step == first_step:
+            break
+        first_step = first_step or step
+        loop.append(step[1])
+        direction = next_direction
+    # The final step returns to the start pixel, which is already the first point
+    loop = loop[:-1] if len(loop) > 1 else loop
+    loop = np.stack(np.divmod(pixels[loop], width), axis=1) - 1
+
+    # Shoelace signed area with x as the column and y as the row
+    rows, cols = loop[:, 0], loop[:, 1]
+    if np.sum(cols * np.roll(rows, -1) - np.roll(cols, -1) * rows) < 0:
+        loop = loop[::-1]
+    return loop
+
+
+def _grain_contour_curvature_task(
+    task: Tuple[List[Tuple[Tuple[int, int], np.ndarray]], float, int, int, int],
+) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """Order the boundaries of a chunk of grains and fit their curvature. Module level so it can be pickled."""
+    grains, error, periods, k, min_points = task
+    results = []
+    for origin, grain in grains:
+        loop = _order_boundary(grain) + origin
+        if len(loop) < min_points:
+            curvature = np.full(len(loop), np.nan)
+        else:
+            curvature, _, _ = calculate_curvature_periodic_boundary(
+                loop[:, 1].astype(float), loop[:, 0].astype(float), error=error, periods=periods, k=k
+            )
+        results.append((loop, curvature))
+    return results
+
+
+def _map_grain_chunks(
+    grains: List[Tuple[Tuple[int, int], np.ndarray]], settings: Tuple[float, int, int, int], n_workers: int
+) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """Spread the grains across a process pool in strided chunks, returning the results in the grains' order."""
+    # Several chunks per worker so the load balances when grain sizes vary
+    n_chunks = min(len(grains), 4 * n_workers)
+    tasks = [(grains[start::n_chunks], *settings) for start in range(n_chunks)]
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        chunk_results = list(executor.map(_grain_contour_curvature_task, tasks))
+    # Undo the striding of the grains into chunks
+    results = [None] * len(grains)
+    for start, chunk in enumerate(chunk_results):
+        results[start::n_chunks] = chunk
+    return results
+
+
+def grain_contour_curvature(  # pylint: disable=too-many-arguments
+    labels: np.ndarray,
+    *,
+    error: float = 0.1,
+    periods: int = 2,
+    k: int = 4,
+    min_points: int = 8,
+    n_workers: int = None,
+) -> Dict[str, np.ndarray]:
+    """Calculate the curvature around the boundary of every grain in a label image.
+
+    Each grain is cut out by its bounding box, its outer boundary pixels found with the vectorised
+    `grain_boundaries` and ordered into a loop, and its curvature fitted with
+    `calculate_curvature_periodic_boundary`, with the grains spread across a process pool.
+
+    Example:
+    --------
+    ```
+    >>> contours = grain_contour_curvature(labels, n_workers=4)
+    >>> start, stop = contours["offsets"][i], contours["offsets"][i + 1]
+    >>> grain_curvature = contours["curvature"][start:stop]
+    ```
+
+    Parameters
+    ----------
+    labels: np.ndarray
+        2D label image where 0 is background and grains are labelled consecutively from 1, eg from
+        `label_prediction`.
+    error: float
+        Error in the boundary points, used to weight the spline fit.
+    periods: int
+        Number of times to repeat the boundary either side, to reduce the error where the loop joins.
+    k: int
+        Order of the spline.
+    min_points: int
+        Grains with fewer boundary pixels than this are given nan curvature instead of being fitted.
+    n_workers: int
+        Number of processes to spread the grains across. The default of None runs in the current process.
+
+    Returns
+    -------
+    Dict[str, np.ndarray]
+        Ragged table of the boundaries of the grains. `label` is the label of each grain and `offsets` the
+        start of each grain's boundary in the flat arrays, with a final entry for the total length. The flat
+        arrays are `coordinates`, Nx2 (row, col) coordinates of the boundary pixels in order around each grain,
+        anticlockwise with x as the column so that convex boundaries have positive curvature, and `curvature`,
+        the curvature at each point.
+    """
+    labels = np.asarray(labels)
+    grain_labels = []
+    grains = []
+    for index, slices in enumerate(find_objects(labels)):
+        if slices is not None:
+            grain_labels.append(index + 1)
+            grains.append(((slices[0].start, slices[1].start), labels[slices] == index + 1))
+
+    settings = (error, periods, k, min_points)
+    if n_workers is None:
+        results = _grain_contour_curvature_task((grains, *settings))
+    else:
+        results = _map_grain_chunks(grains, settings, n_workers)
+
+    lengths = [len(loop) for loop, _ in results]
+    return {
+        "label": np.array(grain_labels, dtype=np.intp),
+        "offsets": np.concatenate([[0], np.cumsum(lengths, dtype=np.intp)]),
+        "coordinates": (
+            np.concatenate([loop for loop, _ in results]) if results else np.empty((0, 2), dtype=np.intp)
+        ),
+        "curvature": np.concatenate([curvature for _, curvature in results]) if results else np.empty(0),
+    }
@@ -1,102 +1,362 @@
-"""Splits an image into multiple sprites"""
+"""Splits an image into multiple sprites
 
-import sys
+Can be imported, or run from the command line on one sheet, or on many sheets at once:
+
+```
+python -m sylvialib.images.image_splitter sheet.png --sprite-width 32 --sprite-height 32 --sprite-padding 1
+python -m sylvialib.images.image_splitter sheets/ "more_sheets/*.png" --sprite-width 32 --sprite-height 32 \
+    --n-workers 8 --manifest split_images/manifest.jsonl
+```
+"""
+
+import argparse
+import glob
+import json
+import os
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from contextlib import nullcontext
 from pathlib import Path
+from typing import Iterable, List, Tuple, Union
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
 from PIL import Image
 
-# Ask for the image path and check that it exists
-image_path = Path(
-    input("Enter the path to the image (including file name and extension): ")
-)
-if not image_path.exists():
-    print(f"Error: {image_path} does not exist, exiting.")
-    # print current directory
-    print(f"Current directory: {Path.cwd()}")
-    sys.exit()
-
-image_name = image_path.stem
-image = Image.open(image_path)
-width, height = image.size
-
-print(f"Image {image_name} dimensions: {width}x{height}")
-
-# Ask where to output the sprites and create the directory if it doesn't exist
-output_path = Path(
-    input(
-        "(Optional) Enter the path to the output directory: (default: ./split_images/)"
-    )
-)
-if output_path == Path("") or output_path == Path("."):
-    output_path = Path("./split_images/")
-print(f"Output directory: {output_path}")
-if not output_path.exists():
-    print(f"Creating {output_path}")
-    output_path.mkdir(exist_ok=True)
-
-# Ask for the sprite size and padding
-sprite_width = int(input("Enter the sprite width: "))
-sprite_height = int(input("Enter the sprite height: "))
-sprite_padding = int(input("Enter the sprite padding: "))
-
-# If the image is already the correct size, just save it
-if width == sprite_width and height == sprite_height:
-    print("Image is already the correct size. Save it? (y/n)")
-    if input().lower() == "y":
-        image.save(output_path / "0.png")
-        print(f"Saved {image_path} as 0.png")
-        print("Enter any key to exit.")
-        input()
-    else:
-        sys.exit()
-else:
-    # Check that the image is a size that is a multiple of the sprite size plus padding
-    if (
-        width % (sprite_width + sprite_padding) != 0
-        or height % (sprite_height + sprite_padding) != 0
-    ):
-        print(
-            f"""Image dimensions are not a multiple of the sprite size plus padding.
-\nImage width: {width}, image height: {height}, sprite width: {sprite_width}, 
-sprite height: {sprite_height}, sprite padding: {sprite_padding}, closest multiple of
-sprite size: {width // sprite_width * sprite_width}x{height // sprite_height * sprite_height}
-remainder: {width % sprite_width}x{height % sprite_height}"""
+
+def load_sprite_sheet(image_path: Path) -> Tuple[np.ndarray, bool]:
+    """Load a sprite sheet as a (height, width, channels) numpy array.
+
+    Palette images are converted to RGBA so that their transparency is kept.
+
+    Parameters
+    ----------
+    image_path: Path
+        Path to the sprite sheet.
+
+    Returns
+    -------
+    np.ndarray
+        3D numpy array of the sprite sheet.
+    bool
+        Whether the last channel of the array is an alpha channel.
+    """
+    with Image.open(image_path) as image:
+        if image.mode == "P":
+            image = image.convert("RGBA")
+        has_alpha = "A" in image.getbands()
+        sheet = np.asarray(image)
+    if sheet.ndim == 2:
+        sheet = sheet[..., np.newaxis]
+    return sheet, has_alpha
+
+
+def sprite_grid(sheet: np.ndarray, sprite_width: int, sprite_height: int, sprite_padding: int = 0) -> np.ndarray:
+    """Get a read-only (rows, cols, sprite_height, sprite_width, channels) view of the sprites in a sheet,
+    without copying any pixels.
+
+    The sheet must be a whole number of sprites plus padding wide and high, with or without padding after
+    the last sprite in each row and column.
+
+    Parameters
+    ----------
+    sheet: np.ndarray
+        3D numpy array of the sprite sheet with shape (height, width, channels).
+    sprite_width: int
+        Width of each sprite in pixels.
+    sprite_height: int
+        Height of each sprite in pixels.
+    sprite_padding: int
+        Padding between the sprites in pixels.
+
+    Returns
+    -------
+    np.ndarray
+        5D strided view of the sprites.
+    """
+    height, width, channels = sheet.shape
+    step_x = sprite_width + sprite_padding
+    step_y = sprite_height + sprite_padding
+    n_cols = (width + sprite_padding) // step_x
+    n_rows = (height + sprite_padding) // step_y
+
+    # Allow the sheet to either have or not have padding after the last sprite
+    if width - n_cols * step_x not in (0, -sprite_padding) or height - n_rows * step_y not in (0, -sprite_padding):
+        raise ValueError(
+            f"Image dimensions are not a multiple of the sprite size plus padding. Image width: {width}, image "
+            f"height: {height}, sprite width: {sprite_width}, sprite height: {sprite_height}, sprite padding: "
+            f"{sprite_padding}"
         )
-        print("exiting...")
-        input()
-        sys.exit()
 
-    # If the number of sprites is greater than 32, ask for confirmation
-    sprite_count = (width // (sprite_width + sprite_padding)) * (
-        height // (sprite_height + sprite_padding)
+    row_stride, col_stride, channel_stride = sheet.strides
+    return as_strided(
+        sheet,
+        shape=(n_rows, n_cols, sprite_height, sprite_width, channels),
+        strides=(step_y * row_stride, step_x * col_stride, row_stride, col_stride, channel_stride),
+        writeable=False,
     )
-    if sprite_count > 32:
-        print(
-            f"Up to {sprite_count} sprites will be created (blank ones will be ignored). Continue? (y/n)"
+
+
+def find_non_blank_sprites(sprites: np.ndarray, has_alpha: bool = True) -> np.ndarray:
+    """Find the sprites that are not blank with a single reduction over the sprite grid.
+
+    Parameters
+    ----------
+    sprites: np.ndarray
+        5D sprite grid from `sprite_grid`.
+    has_alpha: bool
+        Whether the last channel is an alpha channel. If so, blank sprites are fully transparent, otherwise
+        blank sprites have every channel equal to 0.
+
+    Returns
+    -------
+    np.ndarray
+        2D (rows, cols) boolean array that is True for sprites that are not blank.
+    """
+    if has_alpha:
+        return sprites[..., -1].max(axis=(2, 3)) > 0
+    return sprites.max(axis=(2, 3, 4)) > 0
+
+
+def _save_sprite(sprite: np.ndarray, path: Path):
+    """Save a single sprite, dropping the channel axis of single channel sprites."""
+    if sprite.shape[-1] == 1:
+        sprite = sprite[..., 0]
+    Image.fromarray(np.ascontiguousarray(sprite)).save(path)
+
+
+def split_sprite_sheet(
+    image_path: Path,
+    output_dir: Path,
+    sprite_width: int,
+    sprite_height: int,
+    sprite_padding: int = 0,
+    n_writers: int = 4,
+) -> List[Path]:
+    """Split a sprite sheet into one png per non-blank sprite, named `{sheet name}_{index}.png`.
+
+    The sheet is loaded once and the sprites are taken from a strided view of it, so no sprite is copied
+    until it is written. Blank sprites (fully transparent, or fully black for images without transparency)
+    are skipped.
+
+    Parameters
+    ----------
+    image_path: Path
+        Path to the sprite sheet.
+    output_dir: Path
+        Directory to save the sprites to, created if it does not exist.
+    sprite_width: int
+        Width of each sprite in pixels.
+    sprite_height: int
+        Height of each sprite in pixels.
+    sprite_padding: int
+        Padding between the sprites in pixels.
+    n_writers: int
+        Number of threads used to save the sprites.
+
+    Returns
+    -------
+    List[Path]
+        Paths of the saved sprites, in reading order.
+    """
+    image_path = Path(image_path)
+    output_dir = Path(output_dir)
+    sheet, has_alpha = load_sprite_sheet(image_path)
+    sprites = sprite_grid(sheet, sprite_width, sprite_height, sprite_padding)
+    rows, cols = np.nonzero(find_non_blank_sprites(sprites, has_alpha=has_alpha))
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    output_paths = [output_dir / f"{image_path.stem}_{sprite_index}.png" for sprite_index in range(len(rows))]
+    with ThreadPoolExecutor(max_workers=n_writers) as executor:
+        futures = [
+            executor.submit(_save_sprite, sprites[row, col], output_path)
+            for row, col, output_path in zip(rows, cols, output_paths)
+        ]
+        # Raise any error from saving the sprites
+        for future in futures:
+            future.result()
+
+    return output_paths
+
+
+def find_sprite_sheets(sheets: Union[str, Path, Iterable[Union[str, Path]]]) -> List[Path]:
+    """Find the sprite sheets described by a directory, a glob pattern, a path, or a list of any of these.
+
+    Directories are searched (not recursively) for png files.
+
+    Parameters
+    ----------
+    sheets: Union[str, Path, Iterable[Union[str, Path]]]
+        Directory, glob pattern or path, or a list of them.
+
+    Returns
+    -------
+    List[Path]
+        Sorted paths of the sprite sheets, without duplicates.
+    """
+    if isinstance(sheets, (str, Path)):
+        sheets = [sheets]
+
+    found = set()
+    for sheet in sheets:
+        if Path(sheet).is_dir():
+            found.update(Path(sheet).glob("*.png"))
+        elif glob.has_magic(str(sheet)):
+            found.update(Path(path) for path in glob.glob(str(sheet)))
+        else:
+            found.add(Path(sheet))
+    return sorted(found)
+
+
+def _split_sprite_sheet_task(task: tuple) -> dict:
+    """Split one sheet in a worker process and summarise the result. Module level so it can be pickled."""
+    image_path, output_dir, sprite_width, sprite_height, sprite_padding, n_writers = task
+    start = time.perf_counter()
+    summary = {"sheet": str(image_path), "sprites": 0, "seconds": 0.0, "error": None}
+    try:
+        summary["sprites"] = len(
+            split_sprite_sheet(image_path, output_dir, sprite_width, sprite_height, sprite_padding, n_writers)
         )
-        if input().lower() != "y":
-            sys.exit()
+    # Record the error and carry on, so one bad sheet does not stop the whole batch
+    # pylint: disable=broad-exception-caught
+    except Exception as error:
+        summary["error"] = f"{type(error).__name__}: {error}"
+    summary["seconds"] = time.perf_counter() - start
+    return summary
+
+
+def split_sprite_sheets(
+    sheets: Union[str, Path, Iterable[Union[str, Path]]],
+    output_dir: Path,
+    sprite_width: int,
+    sprite_height: int,
+    sprite_padding: int = 0,
+    n_workers: int = None,
+    n_writers: int = 2,
+    manifest_path: Path = None,
+) -> List[dict]:
+    """Split many sprite sheets that share the same sprite size and padding across a process pool.
 
-    # Split the image into sprites
-    sprites = []
-    for y in range(0, height, sprite_height + sprite_padding):
-        for x in range(0, width, sprite_width + sprite_padding):
+    Only a bounded number of sheets (twice the number of workers) are submitted to the pool at once, so
+    memory use does not grow with the number of sheets. Each worker writes its sprites straight to disk
+    as `{sheet name}_{index}.png` in the output directory. Sheets that fail to split are recorded in the
+    summary with their error, rather than stopping the batch.
 
-            sprite = image.crop((x, y, x + sprite_width, y + sprite_height))
+    Parameters
+    ----------
+    sheets: Union[str, Path, Iterable[Union[str, Path]]]
+        Directory, glob pattern or path of the sheets, or a list of them. See `find_sprite_sheets`.
+    output_dir: Path
+        Directory to save the sprites to, created if it does not exist.
+    sprite_width: int
+        Width of each sprite in pixels.
+    sprite_height: int
+        Height of each sprite in pixels.
+    sprite_padding: int
+        Padding between the sprites in pixels.
+    n_workers: int
+        Number of worker processes. The default of None uses one per CPU.
+    n_writers: int
+        Number of threads each worker uses to save sprites.
+    manifest_path: Path
+        Optional path of a JSON lines summary manifest, written as each sheet finishes.
+
+    Returns
+    -------
+    List[dict]
+        One summary per sheet, in the order the sheets finished, with the sheet path, number of sprites
+        saved, time taken in seconds and error message (None if the sheet was split).
+
+    Raises
+    ------
+    ValueError
+        If two sheets have the same name, since their sprites would be saved to the same paths.
+    """
+    image_paths = find_sprite_sheets(sheets)
+    # The sprites are named after their sheet, so sheets with the same name would overwrite each other's sprites
+    stems = Counter(image_path.stem for image_path in image_paths)
+    duplicate_stems = sorted(stem for stem, count in stems.items() if count > 1)
+    if duplicate_stems:
+        raise ValueError(
+            f"Sprite sheets in different directories have the same names, so their sprites would overwrite each "
+            f"other: {', '.join(duplicate_stems)}"
+        )
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    n_workers = n_workers or os.cpu_count() or 1
+    max_pending = 2 * n_workers
 
-            # Check if the sprite is empty (all pixels are transparent, ie have an alpha value of 0)
-            if sprite.getbbox() is None:
-                continue
+    summaries = []
+    manifest_context = open(manifest_path, "w", encoding="utf-8") if manifest_path is not None else nullcontext()
+    with manifest_context as manifest_file, ProcessPoolExecutor(max_workers=n_workers) as executor:
+        pending = set()
+        for index, image_path in enumerate(image_paths):
+            task = (image_path, output_dir, sprite_width, sprite_height, sprite_padding, n_writers)
+            pending.add(executor.submit(_split_sprite_sheet_task, task))
+            # Wait for a sheet to finish before submitting more once the limit is reached, or at the end
+            while pending and (len(pending) >= max_pending or index == len(image_paths) - 1):
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    summaries.append(future.result())
+                    if manifest_file is not None:
+                        manifest_file.write(json.dumps(summaries[-1]) + "\n")
 
-            sprites.append(sprite)
+    return summaries
 
-    print(f"Found {len(sprites)} non-blank sprites. Save them?")
-    if input().lower() != "y":
-        sys.exit()
 
-    # Save the sprites
-    for sprite_index, sprite in enumerate(sprites):
-        sprite.save(output_path / f"{image_name}_{sprite_index}.png")
+def main(argv: List[str] = None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Split sprite sheets into one png per non-blank sprite.")
+    parser.add_argument("sheets", nargs="+", help="Sprite sheet paths, directories of sheets or glob patterns.")
+    parser.add_argument("--output-dir", type=Path, default=Path("./split_images/"), help="Output directory.")
+    parser.add_argument("--sprite-width", type=int, required=True, help="Width of each sprite in pixels.")
+    parser.add_argument("--sprite-height", type=int, required=True, help="Height of each sprite in pixels.")
+    parser.add_argument("--sprite-padding", type=int, default=0, help="Padding between the sprites in pixels.")
+    parser.add_argument("--n-writers", type=int, default=4, help="Number of threads used to save the sprites.")
+    parser.add_argument("--n-workers", type=int, default=None, help="Number of processes when splitting many sheets.")
+    parser.add_argument("--manifest", type=Path, default=None, help="JSON lines summary of the sheets split.")
+    args = parser.parse_args(argv)
+
+    image_paths = find_sprite_sheets(args.sheets)
+    missing_paths = [image_path for image_path in image_paths if not image_path.exists()]
+    if missing_paths:
+        parser.error(f"{', '.join(map(str, missing_paths))} does not exist")
+
+    if len(image_paths) == 1 and args.manifest is None:
+        try:
+            output_paths = split_sprite_sheet(
+                image_paths[0],
+                args.output_dir,
+                args.sprite_width,
+                args.sprite_height,
+                sprite_padding=args.sprite_padding,
+                n_writers=args.n_writers,
+            )
+        except ValueError as error:
+            parser.error(str(error))
+        print(f"Split {image_paths[0]} into {len(output_paths)} sprites in {args.output_dir}")
+        return
+
+    try:
+        summaries = split_sprite_sheets(
+            image_paths,
+            args.output_dir,
+            args.sprite_width,
+            args.sprite_height,
+            sprite_padding=args.sprite_padding,
+            n_workers=args.n_workers,
+            n_writers=args.n_writers,
+            manifest_path=args.manifest,
+        )
+    except ValueError as error:
+        parser.error(str(error))
+    for summary in summaries:
+        if summary["error"] is not None:
+            print(f"Failed to split {summary['sheet']}: {summary['error']}")
+    n_sprites = sum(summary["sprites"] for summary in summaries)
+    print(f"Split {len(summaries)} sheets into {n_sprites} sprites in {args.output_dir}")
+
 
-    print(f"Split {image_path} into {len(sprites)} sprites")
-    print("Enter any key to exit.")
-    input()
+if __name__ == "__main__":
+    main()
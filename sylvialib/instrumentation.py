@@ -0,0 +1,314 @@
+"""Opt-in profiling of sylvialib functions.
+
+Public functions across sylvialib are wrapped with `instrument`, which records call counts, latencies and
+input sizes in a registry when profiling is enabled. Profiling is off by default, and while it is off a wrapped
+function costs one attribute check on top of the call.
+
+Enable profiling for a block of code with the `profiling` context manager:
+
+```
+from sylvialib import instrumentation
+
+with instrumentation.profiling():
+    run_pipeline()
+instrumentation.report()
+```
+
+or for a whole run by setting the `SYLVIALIB_PROFILE` environment variable. `SYLVIALIB_PROFILE=1` prints a
+report to the terminal when the interpreter exits, and `SYLVIALIB_PROFILE=profile.json` writes the report to
+that JSON file instead.
+
+Notes:
+- Times are inclusive, so a wrapped function that calls another wrapped function includes its time. Calls made
+  from inside another wrapped call in the same thread are counted as nested, so that top level totals can be
+  told apart from time already counted by the caller.
+- Generator functions are timed per item, each `next` is recorded as one call.
+- Calls made in worker processes of a process pool are recorded in the workers' registries, not the parent's.
+"""
+
+import atexit
+import contextlib
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Dict, Union
+
+import numpy as np
+
+PROFILE_ENVIRONMENT_VARIABLE = "SYLVIALIB_PROFILE"
+MAX_LATENCY_SAMPLES = 10000
+PERCENTILES = (50, 90, 99)
+
+
+class _ProfilingState:  # pylint: disable=too-few-public-methods
+    """Whether profiling is enabled, kept as a single attribute so that the disabled check is cheap."""
+
+    def __init__(self):
+        self.enabled = False
+
+
+class _FunctionRecord:  # pylint: disable=too-few-public-methods,too-many-instance-attributes
+    """Statistics for a single instrumented function."""
+
+    def __init__(self):
+        self.calls = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        # Bounded so that long runs have a fixed memory cost, the percentiles are of the most recent calls
+        self.latencies = deque(maxlen=MAX_LATENCY_SAMPLES)
+        self.total_input_bytes = 0
+        self.max_input_bytes = 0
+        self.nested_calls = 0
+        self.nested_seconds = 0.0
+
+
+_STATE = _ProfilingState()
+_REGISTRY: Dict[str, _FunctionRecord] = {}
+_LOCK = threading.Lock()
+# Depth of the wrapped calls running in each thread, to tell nested calls from top level ones
+_CALL_DEPTH = threading.local()
+
+
+def enable():
+    """Start recording instrumented calls."""
+    _STATE.enabled = True
+
+
+def disable():
+    """Stop recording instrumented calls. The statistics recorded so far are kept."""
+    _STATE.enabled = False
+
+
+def is_enabled() -> bool:
+    """Whether instrumented calls are being recorded."""
+    return _STATE.enabled
+
+
+def reset():
+    """Clear all recorded statistics."""
+    with _LOCK:
+        _REGISTRY.clear()
+
+
+@contextlib.contextmanager
+def profiling(reset_statistics: bool = False):
+    """Context manager that records instrumented calls made inside it.
+
+    Parameters
+    ----------
+    reset_statistics: bool
+        Clear the statistics recorded before entering the block.
+    """
+    if reset_statistics:
+        reset()
+    was_enabled = _STATE.enabled
+    _STATE.enabled = True
+    try:
+        yield
+    finally:
+        _STATE.enabled = was_enabled
+
+
+def _input_bytes(args: tuple, kwargs: dict) -> int:
+    """Total size of the numpy array arguments, including arrays inside list or tuple arguments."""
+    total = 0
+    for argument in _chain_arguments(args, kwargs):
+        if isinstance(argument, np.ndarray):
+            total += argument.nbytes
+        elif isinstance(argument, (list, tuple)):
+            total += sum(item.nbytes for item in argument if isinstance(item, np.ndarray))
+    return total
+
+
+def _chain_arguments(args: tuple, kwargs: dict):
+    """Iterate over the positional then keyword argument values of a call."""
+    yield from args
+    yield from kwargs.values()
+
+
+def _record(name: str, seconds: float, input_bytes: int, nested: bool):
+    """Add a call to the registry."""
+    with _LOCK:
+        record = _REGISTRY.get(name)
+        if record is None:
+            record = _REGISTRY[name] = _FunctionRecord()
+        record.calls += 1
+        record.total_seconds += seconds
+        record.max_seconds = max(record.max_seconds, seconds)
+        record.latencies.append(seconds)
+        record.total_input_bytes += input_bytes
+        record.max_input_bytes = max(record.max_input_bytes, input_bytes)
+        if nested:
+            record.nested_calls += 1
+            record.nested_seconds += seconds
+
+
+def _call_timed(name: str, func, args: tuple, kwargs: dict, input_bytes: int):
+    """Call a function, recording the time it takes and whether it was called from inside another wrapped call."""
+    depth = getattr(_CALL_DEPTH, "depth", 0)
+    _CALL_DEPTH.depth = depth + 1
+    start = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        seconds = time.perf_counter() - start
+        _CALL_DEPTH.depth = depth
+        _record(name, seconds, input_bytes, nested=depth > 0)
+
+
+def _timed_generator(name: str, generator, input_bytes: int):
+    """Yield from a generator, recording the time taken to produce each item."""
+    while True:
+        try:
+            # Records the final, exhausting next as well as the ones that produce items
+            item = _call_timed(name, next, (generator,), {}, input_bytes)
+        except StopIteration:
+            return
+        yield item
+
+
+def instrument(func=None, *, name: str = None):
+    """Decorator that records calls to a function in the registry while profiling is enabled.
+
+    Can be used bare, `@instrument`, or with a name, `@instrument(name="module.function")`. The name defaults
+    to the module and qualified name of the function.
+
+    Parameters
+    ----------
+    func: Callable
+        Function to instrument.
+    name: str
+        Name to record the function under.
+
+    Returns
+    -------
+    Callable
+        The wrapped function.
+    """
+    if func is None:
+        return functools.partial(instrument, name=name)
+
+    if name is None:
+        name = f"{func.__module__}.{func.__qualname__}"
+
+    if inspect.isgeneratorfunction(func):
+
+        @functools.wraps(func)
+        def generator_wrapper(*args, **kwargs):
+            if not _STATE.enabled:
+                return func(*args, **kwargs)
+            return _timed_generator(name, func(*args, **kwargs), _input_bytes(args, kwargs))
+
+        return generator_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _STATE.enabled:
+            return func(*args, **kwargs)
+        return _call_timed(name, func, args, kwargs, _input_bytes(args, kwargs))
+
+    return wrapper
+
+
+def get_statistics() -> Dict[str, Dict]:
+    """Summarise the recorded calls of each instrumented function.
+
+    Returns
+    -------
+    Dict[str, Dict]
+        Dictionary of function name to calls, total, mean, max and percentile latencies in seconds, the total
+        and max input size in bytes, and the number and total time of the calls nested in other wrapped calls.
+        Functions are ordered by total time, largest first.
+    """
+    with _LOCK:
+        records = list(_REGISTRY.items())
+        latencies = {name: np.array(record.latencies) for name, record in records}
+
+    statistics = {}
+    for name, record in sorted(records, key=lambda item: item[1].total_seconds, reverse=True):
+        percentiles = np.percentile(latencies[name], PERCENTILES) if len(latencies[name]) else [0.0] * 3
+        statistics[name] = {
+            "calls": record.calls,
+            "total_seconds": record.total_seconds,
+            "mean_seconds": record.total_seconds / record.calls,
+            **{f"p{percentile}_seconds": float(value) for percentile, value in zip(PERCENTILES, percentiles)},
+            "max_seconds": record.max_seconds,
+            "total_input_bytes": record.total_input_bytes,
+            "max_input_bytes": record.max_input_bytes,
+            "nested_calls": record.nested_calls,
+            "nested_seconds": record.nested_seconds,
+        }
+    return statistics
+
+
+def export_json(path: Union[str, Path] = None) -> str:
+    """Export the statistics as JSON, optionally writing them to a file.
+
+    Parameters
+    ----------
+    path: Union[str, Path]
+        Optional file to write the JSON to.
+
+    Returns
+    -------
+    str
+        The statistics as a JSON string.
+    """
+    output = json.dumps(get_statistics(), indent=2)
+    if path is not None:
+        Path(path).write_text(output, encoding="utf-8")
+    return output
+
+
+def report(file=None):
+    """Print a table of the statistics, ordered by total time.
+
+    The nested column counts the calls made from inside another wrapped call, whose time is already included in
+    the caller's total.
+
+    Parameters
+    ----------
+    file: TextIO
+        Stream to print to, defaults to stdout.
+    """
+    file = sys.stdout if file is None else file
+    statistics = get_statistics()
+    width = max([len(name) for name in statistics] + [len("function")])
+    print(
+        f"{'function':<{width}}{'calls':>10}{'total s':>12}{'mean ms':>12}{'p50 ms':>10}{'p90 ms':>10}"
+        f"{'p99 ms':>10}{'max MB in':>12}{'nested':>10}",
+        file=file,
+    )
+    for name, stats in statistics.items():
+        print(
+            f"{name:<{width}}{stats['calls']:>10}{stats['total_seconds']:>12.3f}{stats['mean_seconds'] * 1e3:>12.3f}"
+            f"{stats['p50_seconds'] * 1e3:>10.3f}{stats['p90_seconds'] * 1e3:>10.3f}"
+            f"{stats['p99_seconds'] * 1e3:>10.3f}{stats['max_input_bytes'] / 1e6:>12.2f}{stats['nested_calls']:>10}",
+            file=file,
+        )
+
+
+def _report_at_exit(destination: str):
+    """Print the report, or write it as JSON if the destination is a .json path."""
+    if destination.endswith(".json"):
+        export_json(destination)
+    else:
+        report(file=sys.stderr)
+
+
+def _enable_from_environment():
+    """Enable profiling for the whole run if the environment variable is set."""
+    destination = os.environ.get(PROFILE_ENVIRONMENT_VARIABLE, "")
+    if destination in ("", "0"):
+        return
+    enable()
+    atexit.register(_report_at_exit, destination)
+
+
+_enable_from_environment()
@@ -1,10 +1,15 @@
 """Scripts for various numpy operations."""
 
-from typing import List, Tuple
+from itertools import chain
+from pathlib import Path
+from typing import List, Tuple, Union
 
 import numpy as np
 from scipy.interpolate import UnivariateSpline
 from scipy.ndimage import binary_dilation
+from scipy.signal import savgol_filter
+
+from sylvialib.instrumentation import instrument
 
 
 def coordinate_in_array(coordinate: np.ndarray[(int, int)], array: np.ndarray[Tuple]) -> bool:
@@ -13,6 +18,7 @@ def coordinate_in_array(coordinate: np.ndarray[(int, int)], array: np.ndarray[Tu
     return (coordinate == array).all(axis=1).any()
 
 
+@instrument
 def find_touching_pixels(image: np.ndarray) -> np.ndarray:
     """Take an image with three labels: background 0, object 1, and object 2,
     and return the pixels where object 1 are adjacent to object 2.
@@ -38,6 +44,7 @@ def find_touching_pixels(image: np.ndarray) -> np.ndarray:
     return touching_pixels
 
 
+@instrument
 def create_2d_array_from_string(string: str) -> np.ndarray:
     """Create a 2d numpy array from grid in the form of a string. This is useful for creating
     custom images and masks to use in testing.
@@ -106,14 +113,158 @@ def create_2d_array_from_string(string: str) -> np.ndarray:
     return array
 
 
+@instrument
 def detect_overlap(mask_1: np.ndarray, mask_2: np.ndarray):
     """Detect if two masks overlap and return the overlapping image"""
 
     return np.logical_and(mask_1, mask_2).any()
 
 
-def calculate_curvature_from_points(x_points, y_points, error=0.1, k=4):
-    """Calculate the curvature for a set of points"""
+def _iterate_tiles(shape: Tuple[int, int], tile_size: int, halo: int = 0):
+    """Yield the (row, col) slices of each tile of an image, and the slices of the tile including a halo of
+    neighbouring pixels, clipped to the image."""
+    height, width = shape[:2]
+    for row_start in range(0, height, tile_size):
+        for col_start in range(0, width, tile_size):
+            row_stop = min(row_start + tile_size, height)
+            col_stop = min(col_start + tile_size, width)
+            tile = (slice(row_start, row_stop), slice(col_start, col_stop))
+            halo_tile = (
+                slice(max(row_start - halo, 0), min(row_stop + halo, height)),
+                slice(max(col_start - halo, 0), min(col_stop + halo, width)),
+            )
+            yield tile, halo_tile
+
+
+def _tiled_output(shape: Tuple[int, int], out):
+    """Get the boolean array that a tiled function writes to, creating a .npy memmap if out is a path."""
+    if out is None:
+        return np.zeros(shape, dtype=bool)
+    if isinstance(out, (str, Path)):
+        return np.lib.format.open_memmap(out, mode="w+", dtype=bool, shape=tuple(shape))
+    if tuple(out.shape) != tuple(shape):
+        raise ValueError(f"out must have shape {tuple(shape)}, got {tuple(out.shape)}.")
+    return out
+
+
+def _sorted_coordinates(coordinates: List[np.ndarray]) -> np.ndarray:
+    """Join the coordinates found in each tile, in row major order like np.argwhere."""
+    if not coordinates:
+        return np.empty((0, 2), dtype=np.intp)
+    coordinates = np.concatenate(coordinates)
+    return coordinates[np.lexsort((coordinates[:, 1], coordinates[:, 0]))]
+
+
+@instrument
+def find_touching_pixels_tiled(
+    image: np.ndarray, tile_size: int = 1024, out=None, return_coordinates: bool = False
+) -> np.ndarray:
+    """Tiled version of `find_touching_pixels` for label images too large to fit in memory, such as memmaps.
+
+    The image is processed one tile at a time, with a one pixel halo around each tile so that adjacency across
+    tile edges is still found, so peak memory is bounded by the tile size rather than the image size.
+
+    Parameters
+    ----------
+    image: np.ndarray
+        2D label image, or a memmap of one, with background 0, object 1 and object 2.
+    tile_size: int
+        Length of the side of each square tile in pixels.
+    out: Union[np.ndarray, str, Path]
+        Optional boolean array or memmap to write the touching pixels to, or a path to create a .npy memmap at.
+        By default an in-memory array is created. Ignored if return_coordinates is True.
+    return_coordinates: bool
+        If True, return the (row, col) coordinates of the touching pixels instead of an image.
+
+    Returns
+    -------
+    np.ndarray
+        Boolean image of the pixels in object 1 that touch object 2, or Nx2 numpy array of their coordinates in
+        row major order.
+    """
+    output = None if return_coordinates else _tiled_output(image.shape, out)
+    coordinates = []
+    for tile, halo_tile in _iterate_tiles(image.shape, tile_size, halo=1):
+        touching = find_touching_pixels(np.asarray(image[halo_tile]))
+        # Crop the halo back off
+        touching = touching[
+            tile[0].start - halo_tile[0].start : tile[0].stop - halo_tile[0].start,
+            tile[1].start - halo_tile[1].start : tile[1].stop - halo_tile[1].start,
+        ]
+        if return_coordinates:
+            coordinates.append(np.argwhere(touching) + (tile[0].start, tile[1].start))
+        else:
+            output[tile] = touching
+
+    if return_coordinates:
+        return _sorted_coordinates(coordinates)
+    return output
+
+
+@instrument
+def detect_overlap_tiled(
+    mask_1: np.ndarray, mask_2: np.ndarray, tile_size: int = 1024, return_coordinates: bool = False
+) -> Union[bool, np.ndarray]:
+    """Tiled version of `detect_overlap` for masks too large to fit in memory, such as memmaps.
+
+    Only one tile of each mask is in memory at a time. Without return_coordinates the scan stops at the first
+    tile that overlaps.
+
+    Parameters
+    ----------
+    mask_1: np.ndarray
+        2D mask, or a memmap of one.
+    mask_2: np.ndarray
+        2D mask, or a memmap of one, the same shape as mask_1.
+    tile_size: int
+        Length of the side of each square tile in pixels.
+    return_coordinates: bool
+        If True, return the (row, col) coordinates of every overlapping pixel instead of whether there are any.
+
+    Returns
+    -------
+    Union[bool, np.ndarray]
+        Whether the masks overlap, or Nx2 numpy array of the coordinates where they overlap in row major order.
+    """
+    if tuple(mask_1.shape) != tuple(mask_2.shape):
+        raise ValueError(f"Masks must have the same shape, got {tuple(mask_1.shape)} and {tuple(mask_2.shape)}.")
+
+    coordinates = []
+    for tile, _ in _iterate_tiles(mask_1.shape, tile_size):
+        overlap = np.logical_and(mask_1[tile], mask_2[tile])
+        if return_coordinates:
+            coordinates.append(np.argwhere(overlap) + (tile[0].start, tile[1].start))
+        elif overlap.any():
+            return True
+
+    if return_coordinates:
+        return _sorted_coordinates(coordinates)
+    return False
+
+
+@instrument
+def fit_path_spline(x_points, y_points, error=0.1, k=4):
+    """Fit a smoothing spline to each of the x and y coordinates of a path, using the point index as the
+    independent variable.
+
+    Parameters
+    ----------
+    x_points: np.ndarray
+        1D numpy array of x coordinates of the points.
+    y_points: np.ndarray
+        1D numpy array of y coordinates of the points.
+    error: float
+        Error in the points. Used to weight the points in the spline calculation.
+    k: int
+        Order of the spline.
+
+    Returns
+    -------
+    UnivariateSpline
+        Spline of the x coordinates.
+    UnivariateSpline
+        Spline of the y coordinates.
+    """
     # Check that the number of points is the same for both x and y
     if x_points.shape[0] != y_points.shape[0]:
         raise ValueError(
@@ -134,6 +285,16 @@ def calculate_curvature_from_points(x_points, y_points, error=0.1, k=4):
     weight_values = 1 / np.sqrt(error * np.ones_like(x_points))
     fx = UnivariateSpline(t, x_points, k=k, w=weight_values)
     fy = UnivariateSpline(t, y_points, k=k, w=weight_values)
+    return fx, fy
+
+
+@instrument
+def calculate_curvature_from_points(x_points, y_points, error=0.1, k=4):
+    """Calculate the curvature for a set of points"""
+    # Disable pylint warning about snake case variable names for this function
+    # pylint: disable=invalid-name
+    fx, fy = fit_path_spline(x_points, y_points, error=error, k=k)
+    t = np.arange(x_points.shape[0])
 
     spline_x = fx(t)
     spline_y = fy(t)
@@ -146,6 +307,7 @@ def calculate_curvature_from_points(x_points, y_points, error=0.1, k=4):
     return curvatures, spline_x, spline_y
 
 
+@instrument
 def calculate_curvature_periodic_boundary(x_points, y_points, error=0.1, periods=2, k=4):
     """Take a set of points that form a loop and calculate the curvature. Uses periodic
     boundary conditions, so the first and last points are connected. This reduces the error
@@ -196,6 +358,95 @@ def calculate_curvature_periodic_boundary(x_points, y_points, error=0.1, periods
     )
 
 
+def _local_derivatives(
+    points: np.ndarray, closed: bool, method: str, window_length: int, polyorder: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Estimate the smoothed points and their first and second derivatives along the last axis, for
+    `calculate_curvature_fast`."""
+    if method == "savgol":
+        if polyorder < 2:
+            raise ValueError(f"polyorder must be at least 2 to estimate the second derivative, got {polyorder}.")
+        mode = "wrap" if closed else "interp"
+        smoothed = savgol_filter(points, window_length, polyorder, axis=-1, mode=mode)
+        first = savgol_filter(points, window_length, polyorder, deriv=1, axis=-1, mode=mode)
+        second = savgol_filter(points, window_length, polyorder, deriv=2, axis=-1, mode=mode)
+    elif method == "finite_difference":
+        smoothed = points
+        if closed:
+            first = (np.roll(points, -1, axis=-1) - np.roll(points, 1, axis=-1)) / 2
+            second = np.roll(points, -1, axis=-1) - 2 * points + np.roll(points, 1, axis=-1)
+        else:
+            first = np.gradient(points, axis=-1)
+            second = np.gradient(first, axis=-1)
+    else:
+        raise ValueError(f"method must be either savgol or finite_difference, got {method}.")
+    return smoothed, first, second
+
+
+@instrument
+def calculate_curvature_fast(  # pylint: disable=too-many-arguments
+    x_points: np.ndarray,
+    y_points: np.ndarray,
+    closed: bool = False,
+    *,
+    method: str = "savgol",
+    window_length: int = 11,
+    polyorder: int = 3,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Calculate the curvature of one or many traces from local derivative estimates, without fitting a spline.
+
+    This is much faster than `calculate_curvature_from_points`, and works on a whole batch of equal length
+    traces at once, but only smooths the points locally, over `window_length` points.
+
+    Parameters
+    ----------
+    x_points: np.ndarray
+        1D numpy array of the x coordinates of a trace, or 2D (n_traces, n_points) array of a batch of traces.
+    y_points: np.ndarray
+        y coordinates, the same shape as x_points.
+    closed: bool
+        Whether the traces are closed loops, in which case the derivatives wrap around from the last point to
+        the first, as in `calculate_curvature_periodic_boundary`. The first point should not be repeated.
+    method: str
+        "savgol" to fit local polynomials with a Savitzky-Golay filter, or "finite_difference" for central
+        finite differences with no smoothing.
+    window_length: int
+        Number of points in each Savitzky-Golay window. Must be odd, and for open traces no more than the
+        number of points.
+    polyorder: int
+        Order of the Savitzky-Golay polynomials, at least 2 so that the second derivative is not zero.
+
+    Returns
+    -------
+    np.ndarray
+        Curvature at each point, the same shape as x_points.
+    np.ndarray
+        Smoothed x coordinates.
+    np.ndarray
+        Smoothed y coordinates.
+    """
+    x_points = np.asarray(x_points, dtype=float)
+    y_points = np.asarray(y_points, dtype=float)
+    if x_points.shape != y_points.shape:
+        raise ValueError(
+            f"x_points and y_points must have the same shape. x_points has shape {x_points.shape} and y_points has "
+            f"shape {y_points.shape}."
+        )
+
+    # Stack x and y so that both are differentiated in the same call
+    smoothed, first, second = _local_derivatives(
+        np.stack([x_points, y_points]), closed, method, window_length, polyorder
+    )
+
+    # Disable pylint warning about snake case variable names for this function
+    # pylint: disable=invalid-name
+    dx, dy = first
+    dx2, dy2 = second
+    curvatures = (dx * dy2 - dy * dx2) / np.power(dx**2 + dy**2, 3 / 2)
+    return curvatures, smoothed[0], smoothed[1]
+
+
+@instrument
 def turn_spline_path_into_pixel_map(array: np.ndarray):
     """Convert a spline path into a pixelated map where there are no doubly connected pixels.
 
@@ -259,6 +510,159 @@ def turn_spline_path_into_pixel_map(array: np.ndarray):
     return pixel_map, pixelated_path
 
 
+# Offsets of the 8 neighbours of a pixel, clockwise from the top left. Bit i of a neighbour code is set if the
+# neighbour at NEIGHBOUR_OFFSETS[i] is part of the skeleton.
+NEIGHBOUR_OFFSETS = np.array([[-1, -1], [-1, 0], [-1, 1], [0, 1], [1, 1], [1, 0], [1, -1], [0, -1]])
+
+
+def _build_skeleton_lookup_tables() -> Tuple[np.ndarray, np.ndarray, List[Tuple[int, ...]]]:
+    """Build lookup tables from each 8 bit neighbour code to the neighbours a path walks through.
+
+    A diagonal neighbour is dropped if either of the two orthogonal neighbours next to it is set, since the
+    path reaches it through that orthogonal neighbour. This stops staircases forming false junctions.
+    """
+    codes = np.arange(256)
+    bits = (codes[:, np.newaxis] >> np.arange(8)) & 1
+    for diagonal in (0, 2, 4, 6):
+        redundant = bits[:, (diagonal - 1) % 8] | bits[:, (diagonal + 1) % 8]
+        bits[:, diagonal] &= 1 - redundant
+    effective_codes = (bits << np.arange(8)).sum(axis=1)
+    counts = bits.sum(axis=1)
+    neighbour_bits = [tuple(np.flatnonzero(code_bits).tolist()) for code_bits in bits]
+    return effective_codes, counts, neighbour_bits
+
+
+_SKELETON_EFFECTIVE_CODES, _SKELETON_NEIGHBOUR_COUNTS, _SKELETON_NEIGHBOUR_BITS = _build_skeleton_lookup_tables()
+
+
+def _skeleton_neighbours(skeleton: np.ndarray) -> Tuple[np.ndarray, int, List[List[int]]]:
+    """Find the neighbours that paths walk through from each skeleton pixel, for `trace_skeleton`.
+
+    Returns
+    -------
+    np.ndarray
+        Flat indices of the skeleton pixels in the skeleton padded by one pixel. The position of a pixel in this
+        array is its id.
+    int
+        Width of the padded skeleton.
+    List[List[int]]
+        The ids of the neighbours of each pixel. Lists rather than numpy arrays, since the walk indexes single
+        pixels.
+    """
+    padded = np.pad(np.asarray(skeleton, dtype=bool), 1)
+    _, width = padded.shape
+    padded = padded.ravel()
+
+    # Neighbour code of every skeleton pixel, looking up its neighbours in the flat padded image
+    pixels = np.flatnonzero(padded)
+    neighbour_pixels = pixels[:, np.newaxis] + NEIGHBOUR_OFFSETS[:, 0] * width + NEIGHBOUR_OFFSETS[:, 1]
+    codes = _SKELETON_EFFECTIVE_CODES[(padded[neighbour_pixels].astype(np.intp) << np.arange(8)).sum(axis=1)]
+
+    # Work on compact ids so that the walk never touches background pixels
+    neighbour_ids = np.searchsorted(pixels, neighbour_pixels).tolist()
+    neighbours = [
+        [pixel_neighbour_ids[bit] for bit in _SKELETON_NEIGHBOUR_BITS[code]]
+        for pixel_neighbour_ids, code in zip(neighbour_ids, codes.tolist())
+    ]
+    return pixels, width, neighbours
+
+
+def _walk_branch(neighbours: List[List[int]], is_node: List[bool], visited: List[bool], node: int, first: int):
+    """Walk a branch from a node through its neighbour first until the next node, marking the pixels visited."""
+    path = [node, first]
+    visited[first] = True
+    previous, current = node, first
+    while True:
+        current_neighbours = neighbours[current]
+        following = current_neighbours[0] if current_neighbours[0] != previous else current_neighbours[1]
+        path.append(following)
+        if is_node[following]:
+            return path
+        visited[following] = True
+        previous, current = current, following
+
+
+def _walk_skeleton(neighbours: List[List[int]]) -> Tuple[List[List[int]], List[bool]]:
+    """Walk every branch and closed loop of a skeleton, returning the ids along each and whether it is closed."""
+    # End points, junctions and isolated pixels are nodes, anything else is in the middle of a path
+    is_node = [len(pixel_neighbours) != 2 for pixel_neighbours in neighbours]
+    visited = [False] * len(neighbours)
+    flat_paths = []
+    closed = []
+
+    # Walk every branch out of every end point and junction
+    for node in (pixel for pixel, pixel_is_node in enumerate(is_node) if pixel_is_node):
+        if not neighbours[node]:
+            flat_paths.append([node])
+            closed.append(False)
+        for first in neighbours[node]:
+            # Join adjacent nodes once
+            if is_node[first] and node < first:
+                flat_paths.append([node, first])
+                closed.append(False)
+            elif not is_node[first] and not visited[first]:
+                flat_paths.append(_walk_branch(neighbours, is_node, visited, node, first))
+                closed.append(False)
+
+    # Anything left is a closed loop with no end points or junctions
+    for start, start_visited in enumerate(visited):
+        if start_visited or is_node[start]:
+            continue
+        path = [start]
+        visited[start] = True
+        previous, current = start, neighbours[start][0]
+        while current != start:
+            path.append(current)
+            visited[current] = True
+            current_neighbours = neighbours[current]
+            following = current_neighbours[0] if current_neighbours[0] != previous else current_neighbours[1]
+            previous, current = current, following
+        flat_paths.append(path)
+        closed.append(True)
+    return flat_paths, closed
+
+
+@instrument
+def trace_skeleton(skeleton: np.ndarray) -> Tuple[List[np.ndarray], List[bool]]:
+    """Trace a binary skeleton into ordered paths of pixel coordinates, the inverse of
+    `turn_spline_path_into_pixel_map`.
+
+    The 8-neighbour connectivity of every skeleton pixel is found in one vectorised step, as a neighbour code
+    passed through a lookup table. Each branch between end points and junctions is then walked once, and any
+    closed loops without junctions are walked afterwards, so the time taken is linear in the number of
+    skeleton pixels. Many disjoint skeletons in one image are all traced.
+
+    Notes:
+    - A diagonal step is only taken if neither of the orthogonal pixels next to it is in the skeleton.
+    - Branches include the end point or junction pixels at each end, so branches meeting at a junction share it.
+    - Adjacent junction pixels are joined by two pixel branches.
+    - Isolated pixels are returned as single pixel paths.
+
+    Parameters
+    ----------
+    skeleton: np.ndarray
+        2D binary numpy array of the skeleton.
+
+    Returns
+    -------
+    List[np.ndarray]
+        List of Nx2 numpy arrays of the (row, col) coordinates along each path.
+    List[bool]
+        Whether each path is a closed loop, in which case the last pixel connects back to the first, which is
+        not repeated.
+    """
+    pixels, width, neighbours = _skeleton_neighbours(skeleton)
+    flat_paths, closed = _walk_skeleton(neighbours)
+
+    if not flat_paths:
+        return [], []
+    # Convert all the ids to coordinates at once, then split them back into paths
+    lengths = np.fromiter((len(path) for path in flat_paths), dtype=np.intp, count=len(flat_paths))
+    flat_pixels = pixels[np.fromiter(chain.from_iterable(flat_paths), dtype=np.intp)]
+    coordinates = np.stack(np.divmod(flat_pixels, width), axis=1) - 1
+    return np.split(coordinates, np.cumsum(lengths)[:-1]), closed
+
+
 def signed_angle_between_vectors(vector1: np.ndarray, vector2: np.ndarray):
     """Calculate the signed angle between two vectors, where the sign is determined by the cross product
     so that angles are negative when the second vector is to the left of the first vector.
@@ -325,6 +729,7 @@ def rotate_points(points: np.ndarray, angle: float):
     return rotated_points
 
 
+@instrument
 def align_points_to_vertical(points: np.ndarray, orientation_vector: np.ndarray):
     """Align the points to the vertical by rotating them by the angle between the orientation vector and the vertical.
 
@@ -352,6 +757,7 @@ def align_points_to_vertical(points: np.ndarray, orientation_vector: np.ndarray)
     return rotated_points, rotated_orientation_vector, -angle
 
 
+@instrument
 def calculate_path_length(path: np.ndarray):
     """Calculate the length of a path.
 
@@ -365,7 +771,152 @@ def calculate_path_length(path: np.ndarray):
     float
         The length of the path.
     """
-    path_length = 0.0
-    for i in range(1, len(path)):
-        path_length += np.linalg.norm(path[i] - path[i - 1])
-    return path_length
+    path = np.asarray(path, dtype=float)
+    if len(path) < 2:
+        return 0.0
+    return float(np.linalg.norm(np.diff(path, axis=0), axis=1).sum())
+
+
+def _arc_length_samples(
+    totals: np.ndarray, step: float, n_points: int, closed: bool
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Choose the arc lengths to sample a batch of paths at, for `resample_paths`.
+
+    Returns
+    -------
+    np.ndarray
+        Number of samples of each path.
+    np.ndarray
+        Flat numpy array of the arc length of each sample from the start of its path.
+    """
+    if step is not None:
+        if closed:
+            counts = np.maximum(np.ceil(totals / step - 1e-9).astype(np.intp), 1)
+        else:
+            counts = np.floor(totals / step + 1e-9).astype(np.intp) + 1
+        spacing = np.repeat(np.full(len(totals), float(step)), counts)
+    else:
+        counts = np.full(len(totals), n_points, dtype=np.intp)
+        divisions = n_points if closed else max(n_points - 1, 1)
+        spacing = np.repeat(totals / divisions, counts)
+    sample_index = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return counts, sample_index * spacing
+
+
+@instrument
+def resample_paths(
+    paths: List[np.ndarray],
+    step: float = None,
+    n_points: int = None,
+    closed: bool = False,
+) -> List[np.ndarray]:
+    """Resample a batch of paths of different lengths to points evenly spaced along their arc length.
+
+    All the paths are concatenated and resampled with a single `np.interp` call per coordinate, using the
+    cumulative segment lengths of each path, shifted so that the paths do not overlap.
+
+    Parameters
+    ----------
+    paths: List[np.ndarray]
+        List of Nx2 numpy arrays of points, where N can differ between paths.
+    step: float
+        Arc length between resampled points. The end of an open path is only included if its length is a
+        multiple of the step. Give either step or n_points.
+    n_points: int
+        Number of points to resample each path to. Open paths keep both their end points, closed paths are
+        sampled evenly around the loop without repeating the first point.
+    closed: bool
+        Whether the paths are closed loops, where the last point connects back to the first.
+
+    Returns
+    -------
+    List[np.ndarray]
+        List of Mx2 numpy arrays of the resampled points.
+
+    Raises
+    ------
+    ValueError
+        If not exactly one of step and n_points is given, or a path has no points.
+    """
+    if (step is None) == (n_points is None):
+        raise ValueError("Give exactly one of step or n_points.")
+    if step is not None and step <= 0:
+        raise ValueError(f"step must be positive, got {step}.")
+    if len(paths) == 0:
+        return []
+
+    paths = [np.asarray(path, dtype=float).reshape(-1, 2) for path in paths]
+    # An empty path has no arc length of its own to sample, the samples would come from its neighbours
+    if min(len(path) for path in paths) == 0:
+        raise ValueError("Paths must have at least one point.")
+    if closed:
+        paths = [np.concatenate([path, path[:1]]) for path in paths]
+    lengths = np.array([len(path) for path in paths])
+    points = np.concatenate(paths)
+
+    # Cumulative arc length along each path, restarting at 0 at the start of each path
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    segment_lengths = np.linalg.norm(np.diff(points, axis=0), axis=1)
+    segment_lengths[starts[1:] - 1] = 0.0
+    cumulative = np.concatenate([[0.0], np.cumsum(segment_lengths)])
+    cumulative -= np.repeat(cumulative[starts], lengths)
+    totals = cumulative[starts + lengths - 1]
+
+    # Shift each path past the end of the previous one, with a gap so that no sample falls between paths
+    offsets = np.concatenate([[0.0], np.cumsum(totals + 1.0)[:-1]])
+    cumulative += np.repeat(offsets, lengths)
+
+    counts, distances = _arc_length_samples(totals, step, n_points, closed)
+    distances += np.repeat(offsets, counts)
+
+    resampled = np.stack(
+        [np.interp(distances, cumulative, points[:, 0]), np.interp(distances, cumulative, points[:, 1])], axis=1
+    )
+    return np.split(resampled, np.cumsum(counts)[:-1])
+
+
+@instrument
+def resample_path(  # pylint: disable=too-many-arguments
+    path: np.ndarray,
+    step: float = None,
+    n_points: int = None,
+    closed: bool = False,
+    *,
+    spline: Tuple[UnivariateSpline, UnivariateSpline] = None,
+    oversample: int = 10,
+) -> np.ndarray:
+    """Resample a path to points evenly spaced along its arc length.
+
+    Evenly spaced points make the spline fits used to calculate curvature better conditioned, since the
+    point index used as the spline parameter is then proportional to arc length.
+
+    Parameters
+    ----------
+    path: np.ndarray
+        Nx2 numpy array of points in the path. Ignored if a spline is given.
+    step: float
+        Arc length between resampled points. Give either step or n_points.
+    n_points: int
+        Number of points to resample the path to.
+    closed: bool
+        Whether the path is a closed loop, where the last point connects back to the first.
+    spline: Tuple[UnivariateSpline, UnivariateSpline]
+        Optional already fitted splines of the x and y coordinates, as returned by `fit_path_spline`. The
+        spline is resampled instead of the straight segments between the points.
+    oversample: int
+        Number of spline evaluations per unit of the spline parameter, used to measure the arc length of
+        the spline.
+
+    Returns
+    -------
+    np.ndarray
+        Mx2 numpy array of the resampled points.
+    """
+    if spline is not None:
+        # Disable pylint warning about snake case variable names for the splines
+        # pylint: disable=invalid-name
+        fx, fy = spline
+        knots = fx.get_knots()
+        t = np.linspace(knots[0], knots[-1], int(np.ceil((knots[-1] - knots[0]) * oversample)) + 1)
+        path = np.stack([fx(t), fy(t)], axis=1)
+    return resample_paths([path], step=step, n_points=n_points, closed=closed)[0]
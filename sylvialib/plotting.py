@@ -1,34 +1,442 @@
 """Useful plotting functions"""
 
-from typing import Union
+import functools
+import itertools
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Sequence, Union
 
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.colors
+from matplotlib import colormaps
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from PIL import Image, ImageDraw, ImageFont
 
+from sylvialib.instrumentation import instrument
 
+
+def _block_average(image: np.ndarray) -> np.ndarray:
+    """Halve the resolution of an image by averaging each 2x2 block of pixels.
+
+    Odd edges are padded by repeating the last row or column, so partial blocks average only their own pixels.
+    Integer images are rounded back to their dtype.
+    """
+    image = np.asarray(image)
+    height, width = image.shape[:2]
+    padding = [(0, height % 2), (0, width % 2)] + [(0, 0)] * (image.ndim - 2)
+    padded = np.pad(image, padding, mode="edge")
+    blocks = padded.reshape(padded.shape[0] // 2, 2, padded.shape[1] // 2, 2, *image.shape[2:])
+    averaged = blocks.mean(axis=(1, 3))
+    if np.issubdtype(image.dtype, np.integer) or image.dtype == bool:
+        averaged = np.round(averaged)
+    return averaged.astype(image.dtype)
+
+
+class ImagePyramid:
+    """A lazily built, cached multi-resolution pyramid of a large image.
+
+    Level 0 is the image itself, which can be a numpy memmap or any array-like that supports slicing. Level k
+    has half the resolution of level k - 1, each pixel the average of a 2x2 block, so fine structure is smoothed
+    rather than aliased. Levels are built in square tiles when they are first needed, each from the tiles of the
+    next finer level, and the most recently used tiles are kept in a bounded cache. Memory use is bounded by the
+    cache and the size of the regions read, however large the image.
+
+    Parameters
+    ----------
+    image: np.ndarray
+        2D image, or 3D RGB(A) image, or a memmap / array-like of one.
+    min_size: int
+        The coarsest level is the first whose longest side is at most this many pixels.
+    tile_size: int
+        Side of the square tiles the levels are built and cached in.
+    max_tiles: int
+        Number of tiles to cache, least recently used tiles are dropped first.
+    """
+
+    def __init__(self, image, min_size: int = 256, tile_size: int = 256, max_tiles: int = 64):
+        self.image = image
+        self.shape = tuple(image.shape)
+        longest_side = max(self.shape[:2])
+        self.n_levels = 1
+        while longest_side > min_size and longest_side > 1:
+            longest_side = -(-longest_side // 2)
+            self.n_levels += 1
+        self.tile_size = tile_size
+        self.max_tiles = max_tiles
+        self._tiles = OrderedDict()
+
+    def level_shape(self, level: int) -> tuple:
+        """(rows, cols) of a level of the pyramid."""
+        return -(-self.shape[0] // 2**level), -(-self.shape[1] // 2**level)
+
+    def level(self, level: int) -> np.ndarray:
+        """Get a whole level of the pyramid as an in-memory array.
+
+        Level 0 is returned as it is, without reading it into memory. Use `region` to read part of a fine level
+        of a large image.
+        """
+        self._check_level(level)
+        if level == 0:
+            return self.image
+        return self._read(level, (0, self.shape[0]), (0, self.shape[1]))
+
+    def _check_level(self, level: int):
+        """Raise a ValueError if a level is not in the pyramid."""
+        if not 0 <= level < self.n_levels:
+            raise ValueError(f"level must be between 0 and {self.n_levels - 1}, got {level}.")
+
+    def _tile(self, level: int, tile_row: int, tile_col: int) -> np.ndarray:
+        """Get a tile of a level from the cache, building it from the next finer level if needed."""
+        key = (level, tile_row, tile_col)
+        if key in self._tiles:
+            self._tiles.move_to_end(key)
+            return self._tiles[key]
+        rows = (2 * tile_row * self.tile_size, 2 * (tile_row + 1) * self.tile_size)
+        cols = (2 * tile_col * self.tile_size, 2 * (tile_col + 1) * self.tile_size)
+        if level == 1:
+            finer = self.image[rows[0] : rows[1], cols[0] : cols[1]]
+        else:
+            finer = self._read(level - 1, rows, cols)
+        self._tiles[key] = _block_average(finer)
+        if len(self._tiles) > self.max_tiles:
+            self._tiles.popitem(last=False)
+        return self._tiles[key]
+
+    def _read(self, level: int, rows: tuple, cols: tuple) -> np.ndarray:
+        """Read a (start, stop) range of rows and columns of a level, in the level's pixels, from its tiles."""
+        level_rows, level_cols = self.level_shape(level)
+        rows = (min(rows[0], level_rows), min(rows[1], level_rows))
+        cols = (min(cols[0], level_cols), min(cols[1], level_cols))
+        size = self.tile_size
+        crop = None
+        for tile_row in range(rows[0] // size, -(-rows[1] // size)):
+            for tile_col in range(cols[0] // size, -(-cols[1] // size)):
+                tile = self._tile(level, tile_row, tile_col)
+                if crop is None:
+                    crop = np.empty((rows[1] - rows[0], cols[1] - cols[0], *tile.shape[2:]), dtype=tile.dtype)
+                # The overlap of the tile and the range, in level pixels
+                top, bottom = max(rows[0], tile_row * size), min(rows[1], (tile_row + 1) * size)
+                left, right = max(cols[0], tile_col * size), min(cols[1], (tile_col + 1) * size)
+                crop[top - rows[0] : bottom - rows[0], left - cols[0] : right - cols[0]] = tile[
+                    top - tile_row * size : bottom - tile_row * size, left - tile_col * size : right - tile_col * size
+                ]
+        if crop is None:
+            crop = np.empty((0, 0, *self.shape[2:]), dtype=self.image.dtype)
+        return crop
+
+    def choose_level(self, visible_shape: tuple, display_shape: tuple) -> int:
+        """Choose the coarsest level that still has at least one pixel per display pixel.
+
+        Parameters
+        ----------
+        visible_shape: tuple
+            (rows, cols) of full resolution pixels that are visible.
+        display_shape: tuple
+            (rows, cols) of display pixels they are drawn into.
+
+        Returns
+        -------
+        int
+            The pyramid level to draw from.
+        """
+        ratio = max(visible_shape[0] / max(display_shape[0], 1), visible_shape[1] / max(display_shape[1], 1))
+        if ratio <= 1:
+            return 0
+        return int(min(np.floor(np.log2(ratio)), self.n_levels - 1))
+
+    def region(self, level: int, rows: tuple, cols: tuple) -> tuple:
+        """Get the part of a level covering a region of the full resolution image.
+
+        Parameters
+        ----------
+        level: int
+            The pyramid level.
+        rows: tuple
+            (start, stop) full resolution rows of the region.
+        cols: tuple
+            (start, stop) full resolution columns of the region.
+
+        Returns
+        -------
+        np.ndarray
+            The in-memory crop of the level.
+        tuple
+            (left, right, bottom, top) extent of the crop in full resolution pixel coordinates, for imshow.
+        """
+        self._check_level(level)
+        height, width = self.shape[:2]
+        rows = (min(max(rows[0], 0), height), min(max(rows[1], 0), height))
+        cols = (min(max(cols[0], 0), width), min(max(cols[1], 0), width))
+        step = 2**level
+        row_start, row_stop = rows[0] // step, -(-rows[1] // step)
+        col_start, col_stop = cols[0] // step, -(-cols[1] // step)
+        if level == 0:
+            crop = np.asarray(self.image[row_start:row_stop, col_start:col_stop])
+        else:
+            crop = self._read(level, (row_start, row_stop), (col_start, col_stop))
+        # The last block of an odd edge is padded, so stop the extent at the edge of the image rather than the block
+        extent = (
+            col_start * step - 0.5,
+            min(col_stop * step, width) - 0.5,
+            min(row_stop * step, height) - 0.5,
+            row_start * step - 0.5,
+        )
+        return crop, extent
+
+
+# The image is driven by the axes callbacks, so only needs the one public method
+class LevelOfDetailImage:  # pylint: disable=too-few-public-methods
+    """Draw a large image on an axes from an `ImagePyramid`, redrawing from the right level when the view changes.
+
+    Only the visible part of the image is drawn, at no more than about one image pixel per screen pixel, so
+    the memory and time taken to draw are bounded by the size of the axes rather than the size of the image.
+    The axes keep the level of detail image alive through its callbacks, so no other reference is needed.
+
+    Parameters
+    ----------
+    axes: matplotlib.axes.Axes
+        The axes to draw on.
+    image: np.ndarray
+        2D image, or 3D RGB(A) image, or a memmap / array-like of one.
+    cmap: Union[str, matplotlib.colors.Colormap]
+        Colour map for single channel images.
+    min_size: int
+        Longest side of the coarsest pyramid level.
+    """
+
+    def __init__(self, axes, image, cmap: Union[str, matplotlib.colors.Colormap] = None, min_size: int = 256):
+        self.axes = axes
+        self.pyramid = ImagePyramid(image, min_size=min_size)
+        height, width = self.pyramid.shape[:2]
+        self.current_level = None
+
+        # Fix the colour limits from the coarsest level so they do not jump as the view changes
+        coarsest = self.pyramid.level(self.pyramid.n_levels - 1)
+        self.axes_image = axes.imshow(
+            coarsest,
+            cmap=cmap,
+            extent=(-0.5, width - 0.5, height - 0.5, -0.5),
+            vmin=np.nanmin(coarsest) if coarsest.ndim == 2 else None,
+            vmax=np.nanmax(coarsest) if coarsest.ndim == 2 else None,
+            interpolation="nearest",
+        )
+        axes.set_xlim(-0.5, width - 0.5)
+        axes.set_ylim(height - 0.5, -0.5)
+        self.update()
+        # matplotlib only keeps weak references to bound methods, so connect a partial, which the axes keep
+        # alive, and with it this object for as long as the axes exist
+        update = functools.partial(LevelOfDetailImage.update, self)
+        axes.callbacks.connect("xlim_changed", update)
+        axes.callbacks.connect("ylim_changed", update)
+
+    def update(self, _axes=None):
+        """Redraw the visible region of the image from the pyramid level that matches the axes size."""
+        height, width = self.pyramid.shape[:2]
+        # Pixel i covers i - 0.5 to i + 0.5, so convert the view limits to the whole pixels that are visible
+        y_limits = np.sort(self.axes.get_ylim()) + 0.5
+        x_limits = np.sort(self.axes.get_xlim()) + 0.5
+        rows = tuple(int(limit) for limit in np.clip([np.floor(y_limits[0]), np.ceil(y_limits[1])], 0, height))
+        cols = tuple(int(limit) for limit in np.clip([np.floor(x_limits[0]), np.ceil(x_limits[1])], 0, width))
+        if rows[1] <= rows[0] or cols[1] <= cols[0]:
+            return
+
+        window = self.axes.get_window_extent()
+        level = self.pyramid.choose_level((rows[1] - rows[0], cols[1] - cols[0]), (window.height, window.width))
+        crop, extent = self.pyramid.region(level, rows, cols)
+        self.current_level = level
+        self.axes_image.set_data(crop)
+        self.axes_image.set_extent(extent)
+
+
+@instrument
 def imshow(
     image: np.ndarray,
     size=(8, 8),
     title: str = "",
     cmap: Union[str, matplotlib.colors.Colormap] = None,
-):
-    """Plot an image"""
-    plt.figure(figsize=size)
-    if cmap:
+    level_of_detail: bool = None,
+) -> Optional[LevelOfDetailImage]:
+    """Plot an image.
+
+    Large images, including numpy memmaps, can be drawn with level of detail, where the image is block averaged
+    down to the figure's pixel budget using a tiled, cached `ImagePyramid` and redrawn from the right level when
+    zooming.
+    By default level of detail is used when the image has more pixels than the figure.
+
+    Returns
+    -------
+    Optional[LevelOfDetailImage]
+        The level of detail image if level of detail was used, otherwise None.
+    """
+    figure = plt.figure(figsize=size)
+    if level_of_detail is None:
+        figure_pixels = figure.get_figwidth() * figure.get_figheight() * figure.dpi**2
+        level_of_detail = image.shape[0] * image.shape[1] > figure_pixels
+
+    level_of_detail_image = None
+    if level_of_detail:
+        level_of_detail_image = LevelOfDetailImage(figure.gca(), image, cmap=cmap)
+    else:
         plt.imshow(image, cmap=cmap)
-    plt.imshow(image)
     plt.title(title)
     plt.show()
+    return level_of_detail_image
+
+
+def _thumbnail(image: np.ndarray, thumbnail_size: int) -> np.ndarray:
+    """Resize an image with nearest neighbour sampling so that its longest side is thumbnail_size pixels."""
+    height, width = image.shape[:2]
+    scale = thumbnail_size / max(height, width)
+    new_height = max(1, int(round(height * scale)))
+    new_width = max(1, int(round(width * scale)))
+    rows = (np.arange(new_height) * height / new_height).astype(np.intp)
+    cols = (np.arange(new_width) * width / new_width).astype(np.intp)
+    return image[rows[:, np.newaxis], cols]
+
+
+def _to_rgb(image: np.ndarray, cmap: matplotlib.colors.Colormap) -> np.ndarray:
+    """Convert an image to uint8 RGB. Single channel images are min-max normalised and coloured with the
+    colour map. RGB(A) images are scaled from 0 to 1 if they are floats, and from 0 to their dtype's maximum if
+    they are integers."""
+    image = np.asarray(image)
+    if image.ndim == 3 and image.shape[-1] == 1:
+        image = image[..., 0]
+    if image.ndim == 2:
+        image = image.astype(np.float64)
+        image_min, image_max = np.nanmin(image), np.nanmax(image)
+        if image_max > image_min:
+            image = (image - image_min) / (image_max - image_min)
+        else:
+            image = np.zeros_like(image)
+        return cmap(image, bytes=True)[..., :3]
+    if image.dtype == np.uint8:
+        return image[..., :3]
+    if np.issubdtype(image.dtype, np.integer):
+        return np.round(np.clip(image[..., :3], 0, None) * (255 / np.iinfo(image.dtype).max)).astype(np.uint8)
+    return np.round(np.clip(image[..., :3], 0, 1) * 255).astype(np.uint8)
+
+
+def _paste_thumbnails(
+    canvas: np.ndarray,
+    images: List[np.ndarray],
+    positions: np.ndarray,
+    thumbnail_size: int,
+    cmap: matplotlib.colors.Colormap,
+) -> None:
+    """Write an RGB thumbnail of each image into a montage canvas with its top left corner at the given position."""
+    for (top, left), image in zip(positions.tolist(), images):
+        thumbnail = _to_rgb(_thumbnail(np.asarray(image), thumbnail_size), cmap)
+        canvas[top : top + thumbnail.shape[0], left : left + thumbnail.shape[1]] = thumbnail
+
+
+def _draw_labels(canvas: np.ndarray, labels: List[str], positions: np.ndarray, font, background: int) -> np.ndarray:
+    """Draw a label at each (top, left) position of a montage canvas, in a colour that shows on the background."""
+    canvas_image = Image.fromarray(canvas)
+    draw = ImageDraw.Draw(canvas_image)
+    text_colour = (0, 0, 0) if background > 127 else (255, 255, 255)
+    for (top, left), label in zip(positions.tolist(), labels):
+        draw.text((left, top), str(label), fill=text_colour, font=font)
+    return np.asarray(canvas_image)
 
 
-def plot_gallery(images: list[np.ndarray], n_cols=4, title=None):
-    """Plot a list of images in a grid."""
+@instrument
+def make_montage(  # pylint: disable=too-many-arguments
+    images: List[np.ndarray],
+    n_cols: int = 4,
+    thumbnail_size: int = 128,
+    padding: int = 2,
+    *,
+    labels: List[str] = None,
+    cmap: Union[str, matplotlib.colors.Colormap] = "viridis",
+    background: int = 255,
+    output_path: Path = None,
+) -> np.ndarray:
+    """Pack a list of images into a single RGB canvas, as a grid of thumbnails.
+
+    Each image is downsampled so that its longest side is `thumbnail_size` pixels and copied into its cell
+    of a preallocated canvas. This is much faster than creating an axes per image, so is practical for
+    galleries of thousands of images.
+
+    Parameters
+    ----------
+    images: List[np.ndarray]
+        List of 2D single channel images or 3D RGB(A) images, of any sizes.
+    n_cols: int
+        Number of thumbnails per row.
+    thumbnail_size: int
+        Length in pixels of the longest side of each thumbnail.
+    padding: int
+        Number of pixels between thumbnails and around the edge of the canvas.
+    labels: List[str]
+        Optional label for each image, drawn under its thumbnail.
+    cmap: Union[str, matplotlib.colors.Colormap]
+        Colour map for single channel images, which are each min-max normalised.
+    background: int
+        Grey level of the canvas background, from 0 to 255.
+    output_path: Path
+        Optional path to save the canvas to as a png.
+
+    Returns
+    -------
+    np.ndarray
+        (height, width, 3) uint8 RGB canvas.
+    """
+    if labels is not None and len(labels) != len(images):
+        raise ValueError(f"Got {len(labels)} labels for {len(images)} images.")
+    if isinstance(cmap, str):
+        cmap = colormaps[cmap]
+
+    n_cols = max(1, min(int(n_cols), len(images)))
+    font = ImageFont.load_default() if labels is not None else None
+    label_height = font.getbbox("Ag")[3] + padding if labels is not None else 0
+    cell_shape = (thumbnail_size + label_height + padding, thumbnail_size + padding)
+    # (top, left) of each image's cell, in reading order
+    positions = padding + np.stack(np.divmod(np.arange(len(images)), n_cols), axis=1) * cell_shape
+
+    canvas = np.full(
+        (-(-len(images) // n_cols) * cell_shape[0] + padding, n_cols * cell_shape[1] + padding, 3),
+        background,
+        dtype=np.uint8,
+    )
+    _paste_thumbnails(canvas, images, positions, thumbnail_size, cmap)
+    if labels is not None:
+        # Labels go in the space under each thumbnail
+        canvas = _draw_labels(canvas, labels, positions + (thumbnail_size + padding // 2, 0), font, background)
+
+    if output_path is not None:
+        Image.fromarray(canvas).save(output_path)
+
+    return canvas
+
+
+@instrument
+def plot_gallery(images: list[np.ndarray], n_cols=4, title=None, montage: bool = False, **montage_kwargs):
+    """Plot a list of images in a grid.
+
+    If montage is True, the images are packed into a single canvas with `make_montage` and drawn with one
+    `imshow` call, which is much faster for large numbers of images. The figure is at most 20 inches on each
+    side however many images there are. Any extra keyword arguments are passed on to `make_montage`.
+    """
+
+    if montage:
+        canvas = make_montage(images, n_cols=n_cols, **montage_kwargs)
+        # Fit the canvas into a fixed size figure, imshow downsamples it however many images there are
+        scale = 20 / max(canvas.shape[:2])
+        plt.figure(figsize=(canvas.shape[1] * scale, canvas.shape[0] * scale))
+        plt.imshow(canvas)
+        plt.axis("off")
+        if title:
+            plt.title(title)
+        plt.show()
+        return
 
     n_images = len(images)
-    n_rows = np.ceil(n_images / n_cols)
+    n_rows = int(np.ceil(n_images / n_cols))
 
-    _fig, axes = plt.subplots(n_rows, n_cols, figsize=(20 * n_rows, 20))
+    _fig, axes = plt.subplots(n_rows, n_cols, figsize=(20 * n_rows, 20), squeeze=False)
     for index, image in enumerate(images):
         axes[int(index // n_cols), index % n_cols].imshow(image)
 
@@ -36,3 +444,193 @@ def plot_gallery(images: list[np.ndarray], n_cols=4, title=None):
         plt.title(title)
 
     plt.show()
+
+
+@functools.lru_cache(maxsize=1)
+def _make_render_figure(figsize: tuple, dpi: int) -> Figure:
+    """Create an Agg figure for rendering overlays. Cached so that each process reuses its figure until the size
+    changes."""
+    figure = Figure(figsize=figsize, dpi=dpi)
+    FigureCanvasAgg(figure)
+    figure.add_axes((0, 0, 1, 1))
+    return figure
+
+
+def _get_render_figure(figsize=(8, 8), dpi: int = 100) -> Figure:
+    """Get this process's Agg figure for rendering overlays, creating it on first use or if the size changes.
+
+    The figure is created directly rather than through pyplot, so it never touches the interactive backend and is
+    never shown.
+    """
+    return _make_render_figure(tuple(figsize), dpi)
+
+
+def _as_mask(mask: np.ndarray, threshold: float) -> np.ndarray:
+    """Turn a mask or prediction into a 2D float mask, thresholding single channel predictions and taking the
+    argmax of multi channel predictions, where class 0 is background."""
+    mask = np.asarray(mask)
+    if mask.ndim == 3 and mask.shape[-1] == 1:
+        mask = mask[..., 0]
+    if mask.ndim == 3:
+        return (np.argmax(mask, axis=-1) > 0).astype(np.float32)
+    return (mask > threshold).astype(np.float32)
+
+
+@instrument
+def render_overlay(  # pylint: disable=too-many-arguments
+    image: np.ndarray,
+    output_path: Path,
+    mask: np.ndarray = None,
+    prediction: np.ndarray = None,
+    *,
+    title: str = None,
+    threshold: float = 0.5,
+    figsize=(8, 8),
+    dpi: int = 100,
+):
+    """Render an image with the outlines of its ground truth mask (green) and prediction (red) to a file.
+
+    Uses the Agg backend without pyplot, so works on headless machines, and reuses one figure per process
+    rather than creating a figure per image.
+
+    Parameters
+    ----------
+    image: np.ndarray
+        2D image, drawn in grey.
+    output_path: Path
+        Path to save the render to. The format is taken from the extension.
+    mask: np.ndarray
+        Optional ground truth mask, outlined in green.
+    prediction: np.ndarray
+        Optional prediction, single channel probabilities or multi channel class scores, outlined in red.
+    title: str
+        Optional title drawn in the top left corner.
+    threshold: float
+        Threshold for masks and single channel predictions.
+    figsize: tuple
+        Size of the render in inches.
+    dpi: int
+        Resolution of the render in dots per inch.
+    """
+    figure = _get_render_figure(figsize=figsize, dpi=dpi)
+    axes = figure.get_axes()[0]
+    axes.clear()
+    axes.set_axis_off()
+    image = np.asarray(image)
+    if image.ndim == 3 and image.shape[-1] == 1:
+        image = image[..., 0]
+    axes.imshow(image, cmap="gray", interpolation="nearest")
+
+    for outline, colour in ((mask, "lime"), (prediction, "red")):
+        if outline is None:
+            continue
+        outline = _as_mask(outline, threshold)
+        # Contours of a constant mask are empty and make matplotlib warn
+        if outline.min() < outline.max():
+            axes.contour(outline, levels=[0.5], colors=colour, linewidths=1)
+
+    if title:
+        axes.text(2, 2, title, color="yellow", va="top", ha="left", fontsize="small")
+    figure.savefig(output_path)
+
+
+def _load_array(array: Union[np.ndarray, str, Path, None]) -> np.ndarray:
+    """Load an array given as a path to a .npy file, leaving arrays and None as they are."""
+    if isinstance(array, (str, Path)):
+        return np.load(array)
+    return array
+
+
+def _render_overlay_task(task: tuple):
+    """Render a single overlay in a worker process. Module level so it can be pickled."""
+    image, mask, prediction, output_path, title, (threshold, figsize, dpi) = task
+    render_overlay(
+        _load_array(image),
+        output_path,
+        mask=_load_array(mask),
+        prediction=_load_array(prediction),
+        title=title,
+        threshold=threshold,
+        figsize=figsize,
+        dpi=dpi,
+    )
+
+
+def _per_image_values(n_images: int, **sequences: Optional[Sequence]) -> List[Sequence]:
+    """Check that each optional sequence has one value per image, replacing missing sequences with Nones."""
+    for name, values in sequences.items():
+        if values is not None and len(values) != n_images:
+            raise ValueError(f"Got {len(values)} {name} for {n_images} images.")
+    return [values if values is not None else [None] * n_images for values in sequences.values()]
+
+
+@instrument
+def render_overlays(  # pylint: disable=too-many-arguments
+    images: Sequence[Union[np.ndarray, str, Path]],
+    output_dir: Path,
+    masks: Sequence[Union[np.ndarray, str, Path]] = None,
+    predictions: Sequence[Union[np.ndarray, str, Path]] = None,
+    *,
+    titles: Sequence[str] = None,
+    file_name_format: str = "overlay_{index}.png",
+    threshold: float = 0.5,
+    n_workers: int = None,
+    figsize=(8, 8),
+    dpi: int = 100,
+) -> List[Path]:
+    """Render overlays of images, ground truth masks and predictions to files, optionally across a process pool.
+
+    Each worker process reuses a single Agg figure for all the images it renders. Images, masks and
+    predictions can be given as arrays or as paths to .npy files, which are loaded in the workers to avoid
+    sending large arrays between processes.
+
+    Example:
+    --------
+    ```
+    >>> render_overlays(images, "qa_renders", masks=masks, predictions=model.predict(images), n_workers=8)
+    ```
+
+    Parameters
+    ----------
+    images: Sequence[Union[np.ndarray, str, Path]]
+        2D images, or paths to them.
+    output_dir: Path
+        Directory to save the renders to, created if it does not exist.
+    masks: Sequence[Union[np.ndarray, str, Path]]
+        Optional ground truth masks, or paths to them, one per image.
+    predictions: Sequence[Union[np.ndarray, str, Path]]
+        Optional predictions, or paths to them, one per image.
+    titles: Sequence[str]
+        Optional title for each render.
+    file_name_format: str
+        Format of the render file names, formatted with the index of the image.
+    threshold: float
+        Threshold for masks and single channel predictions.
+    n_workers: int
+        Number of processes to render with. The default of None renders in the current process.
+    figsize: tuple
+        Size of each render in inches.
+    dpi: int
+        Resolution of each render in dots per inch.
+
+    Returns
+    -------
+    List[Path]
+        Paths of the renders, in the order of the images.
+    """
+    masks, predictions, titles = _per_image_values(len(images), masks=masks, predictions=predictions, titles=titles)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    output_paths = [output_dir / file_name_format.format(index=index) for index in range(len(images))]
+    tasks = zip(images, masks, predictions, output_paths, titles, itertools.repeat((threshold, figsize, dpi)))
+
+    if n_workers is None:
+        for task in tasks:
+            _render_overlay_task(task)
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            # Consume the results so that any error while rendering is raised here
+            for _ in executor.map(_render_overlay_task, tasks, chunksize=max(1, len(images) // (4 * n_workers))):
+                pass
+
+    return output_paths
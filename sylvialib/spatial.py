@@ -0,0 +1,239 @@
+"""Spatial queries between traces and point sets, backed by a KD-tree.
+
+Comparing paths by broadcasting every point against every other point takes O(N * M) time and memory. A
+`SpatialIndex` is built once over a point set or path in O(N log N) and each query point then takes O(log N),
+so comparing traces, matching a predicted trace to the ground truth or finding nearby molecules scales to
+large point sets.
+
+Example:
+--------
+```
+>>> index = SpatialIndex(ground_truth_trace)
+>>> distances, closest = index.nearest(predicted_trace)
+>>> hausdorff_distance(predicted_trace, index)
+```
+"""
+
+from typing import Dict, List, Sequence, Tuple, Union
+
+import numpy as np
+from scipy.spatial import KDTree
+
+
+class SpatialIndex:
+    """Reusable KD-tree index over a set of points, such as the (row, col) coordinates of a path.
+
+    Parameters
+    ----------
+    points: np.ndarray
+        NxD numpy array of the points to index.
+    leafsize: int
+        Number of points at which the tree stops splitting, passed to `scipy.spatial.KDTree`.
+    """
+
+    def __init__(self, points: np.ndarray, leafsize: int = 16):
+        points = np.asarray(points, dtype=float)
+        if points.ndim != 2 or len(points) == 0:
+            raise ValueError(f"points must be a non-empty NxD array, got shape {points.shape}.")
+        self.tree = KDTree(points, leafsize=leafsize)
+
+    @property
+    def points(self) -> np.ndarray:
+        """The indexed points."""
+        return self.tree.data
+
+    def __len__(self) -> int:
+        return self.tree.n
+
+    def nearest(
+        self, query: np.ndarray, k: int = 1, max_distance: float = np.inf, workers: int = 1
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Find the nearest indexed points to each query point.
+
+        Parameters
+        ----------
+        query: np.ndarray
+            MxD numpy array of query points.
+        k: int
+            Number of nearest points to find for each query point.
+        max_distance: float
+            Only find points closer than this. Missing neighbours have infinite distance and an index equal to
+            the number of indexed points.
+        workers: int
+            Number of threads to query with, -1 for all CPUs.
+
+        Returns
+        -------
+        np.ndarray
+            Distance to the nearest points, shape (M,) for k of 1, otherwise (M, k).
+        np.ndarray
+            Indexes of the nearest points, the same shape as the distances.
+        """
+        return self.tree.query(np.asarray(query, dtype=float), k=k, distance_upper_bound=max_distance, workers=workers)
+
+    def within_radius(self, query: np.ndarray, radius: float, workers: int = 1) -> List[np.ndarray]:
+        """Find every indexed point within a radius of each query point.
+
+        Returns
+        -------
+        List[np.ndarray]
+            For each query point, a sorted numpy array of the indexes of the points within the radius.
+        """
+        neighbours = self.tree.query_ball_point(np.asarray(query, dtype=float), r=radius, workers=workers)
+        return [np.array(sorted(indexes), dtype=np.intp) for indexes in neighbours]
+
+    def count_within_radius(self, query: np.ndarray, radius: float, workers: int = 1) -> np.ndarray:
+        """Count the indexed points within a radius of each query point, without building the lists of points."""
+        return np.asarray(
+            self.tree.query_ball_point(np.asarray(query, dtype=float), r=radius, workers=workers, return_length=True)
+        )
+
+    def contains(self, query: np.ndarray, tolerance: float = 0.0) -> np.ndarray:
+        """Check whether each query point is in the index, an O(log N) replacement for `coordinate_in_array`.
+
+        Returns
+        -------
+        np.ndarray
+            Boolean numpy array, True where an indexed point is within the tolerance of the query point.
+        """
+        distances, _ = self.nearest(query)
+        return distances <= tolerance
+
+
+def _as_index(points: Union[np.ndarray, SpatialIndex]) -> SpatialIndex:
+    """Build an index over a point set, or use it as it is if it is already an index."""
+    return points if isinstance(points, SpatialIndex) else SpatialIndex(points)
+
+
+def _as_points(points: Union[np.ndarray, SpatialIndex]) -> np.ndarray:
+    """The points of a point set or of an index."""
+    return points.points if isinstance(points, SpatialIndex) else np.asarray(points, dtype=float)
+
+
+def hausdorff_distance(
+    path_1: Union[np.ndarray, SpatialIndex], path_2: Union[np.ndarray, SpatialIndex]
+) -> float:
+    """Symmetric Hausdorff distance between two point sets, the furthest any point is from the other set.
+
+    Either set may be given as a `SpatialIndex` to reuse it across calls.
+
+    Parameters
+    ----------
+    path_1: Union[np.ndarray, SpatialIndex]
+        NxD numpy array of points, or an index of them.
+    path_2: Union[np.ndarray, SpatialIndex]
+        MxD numpy array of points, or an index of them.
+
+    Returns
+    -------
+    float
+        The Hausdorff distance.
+    """
+    distances_1, _ = _as_index(path_2).nearest(_as_points(path_1))
+    distances_2, _ = _as_index(path_1).nearest(_as_points(path_2))
+    return float(max(distances_1.max(), distances_2.max()))
+
+
+def mean_closest_point_distance(
+    path_1: Union[np.ndarray, SpatialIndex], path_2: Union[np.ndarray, SpatialIndex]
+) -> float:
+    """Symmetric mean closest point distance between two point sets, the mean over the points of both sets of
+    the distance to the closest point in the other set.
+
+    Parameters
+    ----------
+    path_1: Union[np.ndarray, SpatialIndex]
+        NxD numpy array of points, or an index of them.
+    path_2: Union[np.ndarray, SpatialIndex]
+        MxD numpy array of points, or an index of them.
+
+    Returns
+    -------
+    float
+        The mean closest point distance.
+    """
+    distances_1, _ = _as_index(path_2).nearest(_as_points(path_1))
+    distances_2, _ = _as_index(path_1).nearest(_as_points(path_2))
+    return float((distances_1.sum() + distances_2.sum()) / (len(distances_1) + len(distances_2)))
+
+
+def batch_nearest(
+    paths: Sequence[np.ndarray], reference: Union[np.ndarray, SpatialIndex], workers: int = 1
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Find the nearest reference point to every point of many paths in a single query.
+
+    The paths are concatenated and queried together, so there is one call into the tree however many paths
+    there are.
+
+    Parameters
+    ----------
+    paths: Sequence[np.ndarray]
+        Sequence of NxD numpy arrays of points, which may have different lengths.
+    reference: Union[np.ndarray, SpatialIndex]
+        MxD numpy array of reference points, or an index of them.
+    workers: int
+        Number of threads to query with, -1 for all CPUs.
+
+    Returns
+    -------
+    np.ndarray
+        Flat numpy array of the distance from each path point to the nearest reference point.
+    np.ndarray
+        Flat numpy array of the index of the nearest reference point.
+    np.ndarray
+        Offsets of each path in the flat arrays, with a final entry for the total length.
+    """
+    lengths = [len(path) for path in paths]
+    if 0 in lengths:
+        raise ValueError("Paths must not be empty.")
+    offsets = np.concatenate([[0], np.cumsum(lengths, dtype=np.intp)])
+    if not lengths:
+        return np.empty(0), np.empty(0, dtype=np.intp), offsets
+    points = np.concatenate([np.asarray(path, dtype=float) for path in paths])
+    distances, indexes = _as_index(reference).nearest(points, workers=workers)
+    return distances, indexes, offsets
+
+
+def batch_path_distances(
+    paths: Sequence[np.ndarray], reference: Union[np.ndarray, SpatialIndex], workers: int = 1
+) -> Dict[str, np.ndarray]:
+    """Compare many paths with one reference, eg every predicted trace with the ground truth.
+
+    The distances from the paths to the reference are found with a single batched query and reduced per path.
+    The distances back from the reference to each path need an index per path.
+
+    Parameters
+    ----------
+    paths: Sequence[np.ndarray]
+        Sequence of NxD numpy arrays of points, which may have different lengths.
+    reference: Union[np.ndarray, SpatialIndex]
+        MxD numpy array of reference points, or an index of them.
+    workers: int
+        Number of threads to query with, -1 for all CPUs.
+
+    Returns
+    -------
+    Dict[str, np.ndarray]
+        Columnar table with one row per path. `directed_hausdorff` and `directed_mean_distance` are the max and
+        mean distance from the path to the reference, and `hausdorff` and `mean_closest_point_distance` the
+        symmetric distances, as from `hausdorff_distance` and `mean_closest_point_distance`.
+    """
+    reference = _as_index(reference)
+    distances, _, offsets = batch_nearest(paths, reference, workers=workers)
+    lengths = np.diff(offsets)
+    directed_hausdorff = np.maximum.reduceat(distances, offsets[:-1])
+    directed_sum = np.add.reduceat(distances, offsets[:-1])
+
+    reverse_max = np.empty(len(paths))
+    reverse_sum = np.empty(len(paths))
+    for index, path in enumerate(paths):
+        reverse_distances, _ = SpatialIndex(path).nearest(reference.points, workers=workers)
+        reverse_max[index] = reverse_distances.max()
+        reverse_sum[index] = reverse_distances.sum()
+
+    return {
+        "directed_hausdorff": directed_hausdorff,
+        "directed_mean_distance": directed_sum / lengths,
+        "hausdorff": np.maximum(directed_hausdorff, reverse_max),
+        "mean_closest_point_distance": (directed_sum + reverse_sum) / (lengths + len(reference)),
+    }
@@ -2,9 +2,12 @@
 
 from pathlib import Path
 
+import pytest
+
 import numpy as np
 
 from sylvialib.deep_learning.file_management import (
+    rename_files,
     rename_files_alphabetical,
     rename_files_numerical,
 )
@@ -88,3 +91,86 @@ def test_rename_files_numerical(tmp_path: Path):
     assert expected_file_names == actual_file_names
     assert expected_contents_order == actual_contents_order
     print(actual_contents_order, expected_contents_order)
+
+
+def test_rename_files_collisions(tmp_path: Path):
+    """Test that rename_files handles targets that are taken by other files and names without digits"""
+
+    # The mask files already have the right names and the file without digits sorts last
+    file_names = ["mask_1.npy", "mask_0.npy", "mask_2.npy", "no_digits.npy"]
+    for i, file_name in enumerate(file_names):
+        np.save(tmp_path / file_name, i)
+    (tmp_path / "other.txt").write_text("not renamed")
+    unchanged_inode = (tmp_path / "mask_2.npy").stat().st_ino
+
+    plan = rename_files(tmp_path, "npy", "mask", order="numerical")
+
+    assert [(source.name, target.name) for source, target in plan] == [
+        ("mask_0.npy", "mask_0.npy"),
+        ("mask_1.npy", "mask_1.npy"),
+        ("mask_2.npy", "mask_2.npy"),
+        ("no_digits.npy", "mask_3.npy"),
+    ]
+    assert sorted(file.name for file in tmp_path.iterdir()) == [
+        "mask_0.npy",
+        "mask_1.npy",
+        "mask_2.npy",
+        "mask_3.npy",
+        "other.txt",
+    ]
+    assert (tmp_path / "mask_2.npy").stat().st_ino == unchanged_inode
+    assert [np.load(tmp_path / f"mask_{i}.npy").tolist() for i in range(4)] == [1, 0, 2, 3]
+
+    # Alphabetical order with more than ten files, reversing the names so that every target is taken
+    for file in tmp_path.glob("*.npy"):
+        file.unlink()
+    for i in range(12):
+        np.save(tmp_path / f"mask_{i}.npy", i)
+    rename_files(tmp_path, ".npy", "mask", order="alphabetical")
+    expected_order = sorted(range(12), key=lambda i: f"mask_{i}.npy")
+    assert [np.load(tmp_path / f"mask_{i}.npy").tolist() for i in range(12)] == expected_order
+
+
+def test_rename_files_dry_run_and_errors(tmp_path: Path):
+    """Test that a dry run leaves the files alone and that errors raise exceptions"""
+
+    np.save(tmp_path / "labelling_task_5.npy", 0)
+
+    plan = rename_files(tmp_path, "npy", "image", dry_run=True)
+
+    assert [(source.name, target.name) for source, target in plan] == [("labelling_task_5.npy", "image_0.npy")]
+    assert [file.name for file in tmp_path.iterdir()] == ["labelling_task_5.npy"]
+
+    with pytest.raises(FileNotFoundError):
+        rename_files(tmp_path, "png", "image")
+    with pytest.raises(NotADirectoryError):
+        rename_files(tmp_path / "labelling_task_5.npy", "npy", "image")
+    with pytest.raises(ValueError):
+        rename_files(tmp_path, "npy", "image", order="random")
+
+
+def test_rename_files_failure_is_undone(tmp_path: Path, monkeypatch):
+    """Test that when a rename fails partway through, the files are moved back to their original names"""
+
+    # Every file moves down one number, so all but the last go through a temporary name
+    for i in range(1, 5):
+        np.save(tmp_path / f"mask_{i}.npy", i)
+    original_rename = Path.rename
+    failures = []
+
+    def failing_rename(self, target):
+        # Fail the first rename to mask_2.npy, which happens in the second pass
+        if Path(target).name == "mask_2.npy" and not failures:
+            failures.append(self)
+            raise PermissionError("Cannot rename")
+        return original_rename(self, target)
+
+    monkeypatch.setattr(Path, "rename", failing_rename)
+
+    with pytest.raises(PermissionError):
+        rename_files(tmp_path, "npy", "mask", order="numerical")
+
+    monkeypatch.undo()
+    assert failures[0].name.endswith(".tmp")
+    assert sorted(file.name for file in tmp_path.iterdir()) == [f"mask_{i}.npy" for i in range(1, 5)]
+    assert [np.load(tmp_path / f"mask_{i}.npy").tolist() for i in range(1, 5)] == [1, 2, 3, 4]
@@ -0,0 +1,45 @@
+"""Test the image generator"""
+
+import random
+from pathlib import Path
+
+import pytest
+
+import numpy as np
+
+from sylvialib.deep_learning.generator import image_generator
+
+
+@pytest.fixture(name="dataset")
+def fixture_dataset(tmp_path: Path):
+    """Create a small dataset of random images with their masks"""
+
+    for index in range(3):
+        np.save(tmp_path / f"image_{index}.npy", np.random.default_rng(index).random((16, 16)))
+        np.save(tmp_path / f"mask_{index}.npy", np.ones((16, 16), dtype=np.uint8))
+    return tmp_path, tmp_path
+
+
+def test_image_generator_uint8(dataset):
+    """Test that uint8 batches match the float32 batches once normalised, at a quarter of the size"""
+
+    image_dir, mask_dir = dataset
+    batches = {}
+    for output_dtype in ("float32", "uint8"):
+        random.seed(0)
+        np.random.seed(0)
+        batches[output_dtype] = next(
+            image_generator(image_dir, mask_dir, [0, 1, 2], batch_size=3, output_dtype=output_dtype)
+        )
+
+    float_x, float_y = batches["float32"]
+    uint8_x, uint8_y = batches["uint8"]
+    minimum = uint8_x.min(axis=(1, 2), keepdims=True).astype(np.float32)
+    maximum = uint8_x.max(axis=(1, 2), keepdims=True).astype(np.float32)
+
+    assert uint8_x.dtype == uint8_y.dtype == np.uint8
+    assert uint8_x.nbytes * 4 == float_x.nbytes
+    assert np.allclose((uint8_x - minimum) / (maximum - minimum), float_x, atol=1 / 510)
+    assert np.array_equal(uint8_y, float_y)
+    with pytest.raises(ValueError):
+        next(image_generator(image_dir, mask_dir, [0], output_dtype="float16"))
@@ -0,0 +1,187 @@
+"""Test the functions in the grain_statistics module"""
+
+import numpy as np
+from scipy.ndimage import binary_fill_holes, gaussian_filter
+
+from sylvialib.numpy_scripts import create_2d_array_from_string
+from sylvialib.grain_statistics import (
+    GRAIN_STATISTICS_COLUMNS,
+    grain_boundaries,
+    grain_contour_curvature,
+    grain_statistics,
+    image_grain_statistics,
+    label_prediction,
+)
+
+
+def test_label_prediction_multiclass():
+    """Test that touching grains of different classes get different labels"""
+
+    classes = create_2d_array_from_string(
+        """
+        0 1 1 0 0
+        0 1 2 2 0
+        0 0 2 0 0
+        1 0 0 0 0
+        """
+    )
+    prediction = np.eye(3)[classes]
+
+    labels, grain_classes = label_prediction(prediction)
+
+    assert labels.max() == 3
+    assert sorted(grain_classes.tolist()) == [1, 1, 2]
+    assert len(np.unique(labels[classes == 2])) == 1
+    assert grain_classes[labels[1, 2] - 1] == 2
+
+
+def test_image_grain_statistics():
+    """Test the grain statistics for a small label image"""
+
+    labels = create_2d_array_from_string(
+        """
+        1 1 0 0 0
+        1 1 2 2 0
+        0 0 0 0 0
+        0 0 0 0 3
+        """
+    )
+
+    table = image_grain_statistics(labels)
+
+    assert table["area"].tolist() == [4, 2, 1]
+    assert table["perimeter"].tolist() == [8, 6, 4]
+    assert table["n_neighbours"].tolist() == [1, 1, 0]
+    assert table["min_row"].tolist() == [0, 1, 3]
+    assert table["min_col"].tolist() == [0, 2, 4]
+    assert table["max_row"].tolist() == [2, 2, 4]
+    assert table["max_col"].tolist() == [2, 4, 5]
+    assert table["centroid_row"].tolist() == [0.5, 1.0, 3.0]
+    assert table["centroid_col"].tolist() == [0.5, 2.5, 4.0]
+
+
+def test_grain_statistics_batch():
+    """Test that a batch of predictions gives the same table serially and in a process pool"""
+
+    rng = np.random.default_rng(0)
+    predictions = rng.random((4, 32, 32, 1))
+
+    serial = grain_statistics(predictions, threshold=0.7)
+    parallel = grain_statistics(predictions, threshold=0.7, n_workers=2)
+
+    assert tuple(serial) == GRAIN_STATISTICS_COLUMNS
+    assert serial["area"].sum() == (predictions > 0.7).sum()
+    assert sorted(set(serial["image_index"].tolist())) == [0, 1, 2, 3]
+    for column in GRAIN_STATISTICS_COLUMNS:
+        np.testing.assert_array_equal(serial[column], parallel[column])
+
+
+def test_grain_statistics_empty():
+    """Test that an empty batch and an image without grains give empty tables with the usual dtypes"""
+
+    empty_batch = grain_statistics(np.zeros((0, 32, 32)))
+    no_grains = image_grain_statistics(np.zeros((8, 8), dtype=np.int32))
+
+    assert tuple(empty_batch) == GRAIN_STATISTICS_COLUMNS
+    for column in GRAIN_STATISTICS_COLUMNS:
+        assert len(empty_batch[column]) == 0
+        assert len(no_grains[column]) == 0
+        assert empty_batch[column].dtype == no_grains[column].dtype
+
+
+def test_grain_boundaries():
+    """Test that only the pixels of each grain with a 4-neighbour outside it are kept"""
+
+    labels = create_2d_array_from_string(
+        """
+        1 1 1 1 0
+        1 1 1 1 2
+        1 1 1 1 2
+        1 1 1 0 0
+        """
+    )
+
+    expected = create_2d_array_from_string(
+        """
+        1 1 1 1 0
+        1 0 0 1 2
+        1 0 0 1 2
+        1 1 1 0 0
+        """
+    )
+
+    assert np.array_equal(grain_boundaries(labels), expected)
+
+
+def test_grain_contour_curvature():
+    """Test the ordered boundaries and curvature of discs, a ring and thin grains, serially and in a pool"""
+
+    rows, cols = np.indices((120, 200))
+    labels = np.zeros((120, 200), dtype=np.int32)
+    labels[(rows - 40) ** 2 + (cols - 40) ** 2 < 30**2] = 1
+    # A ring, whose outer boundary is used
+    labels[(rows - 60) ** 2 + (cols - 130) ** 2 < 20**2] = 2
+    labels[(rows - 60) ** 2 + (cols - 130) ** 2 < 8**2] = 0
+    # Grains too thin to have a closed boundary at their size
+    labels[100:102, 10:70] = 3
+    labels[110, 100:110] = 4
+    labels[115, 150] = 5
+
+    contours = grain_contour_curvature(labels)
+    parallel_contours = grain_contour_curvature(labels, n_workers=2)
+
+    assert contours["label"].tolist() == [1, 2, 3, 4, 5]
+    assert np.diff(contours["offsets"]).tolist()[2:] == [120, 18, 1]
+    assert len(contours["coordinates"]) == len(contours["curvature"]) == contours["offsets"][-1]
+    for key, value in contours.items():
+        assert np.array_equal(value, parallel_contours[key], equal_nan=True)
+
+    for label, radius in ((1, 30), (2, 20)):
+        start, stop = contours["offsets"][label - 1 : label + 1]
+        loop = contours["coordinates"][start:stop]
+        # Every boundary pixel is visited once, in 8-connected steps
+        assert len(np.unique(loop, axis=0)) == len(loop)
+        assert np.abs(np.diff(loop, axis=0, append=loop[:1])).max() == 1
+        assert np.isclose(np.median(contours["curvature"][start:stop]), 1 / radius, rtol=0.1)
+
+    # The line is traced out to one end and back, so every pixel but the ends is visited twice
+    start, stop = contours["offsets"][3:5]
+    line = contours["coordinates"][start:stop]
+    assert np.unique(line, axis=0, return_counts=True)[1].tolist() == [1] + [2] * 8 + [1]
+    assert np.abs(np.diff(line, axis=0)).max() == 1
+    # The single pixel has too few points to fit
+    assert contours["coordinates"][-1].tolist() == [115, 150]
+    assert np.isnan(contours["curvature"][-1])
+
+
+def test_grain_contour_curvature_thresholded_blobs():
+    """Test that every grain of a thresholded noise image, with branching thin parts, is traced around its outer
+    boundary"""
+
+    labels, _ = label_prediction(gaussian_filter(np.random.default_rng(3).random((256, 256)), 3), threshold=0.52)
+
+    contours = grain_contour_curvature(labels)
+
+    assert contours["label"].tolist() == list(range(1, labels.max() + 1))
+    for index, label in enumerate(contours["label"]):
+        loop = contours["coordinates"][contours["offsets"][index] : contours["offsets"][index + 1]]
+        outer_boundary = grain_boundaries(binary_fill_holes(labels == label).astype(np.int32))
+        assert {tuple(point) for point in loop} == {tuple(point) for point in np.argwhere(outer_boundary)}
+        if len(loop) > 1:
+            assert np.abs(np.diff(loop, axis=0, append=loop[:1])).max() == 1
+
+
+def test_grain_contour_curvature_ring_with_spur():
+    """Test that a ring with a spur off its outer edge is traced around the outside, not around its hole"""
+
+    rows, cols = np.indices((80, 80))
+    squared_radius = (rows - 40) ** 2 + (cols - 40) ** 2
+    labels = ((squared_radius < 25**2) & (squared_radius >= 10**2)).astype(np.int32)
+    labels[40, 65:70] = 1
+
+    contours = grain_contour_curvature(labels)
+
+    radii = np.hypot(*(contours["coordinates"] - 40).T)
+    assert radii.min() >= 24
+    # The five spur pixels are traced out to the tip and back
+    assert np.count_nonzero(radii >= 25) == 9
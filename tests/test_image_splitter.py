@@ -0,0 +1,109 @@
+"""Test the sprite sheet splitter"""
+
+from pathlib import Path
+
+import pytest
+
+import numpy as np
+from PIL import Image
+
+from sylvialib.images.image_splitter import main, split_sprite_sheet, split_sprite_sheets, sprite_grid
+
+
+def make_sprite_sheet(path: Path, n_rows: int = 2, n_cols: int = 3, size: int = 4, padding: int = 1):
+    """Save an RGBA sprite sheet where sprite (row, col) is filled with row * n_cols + col + 1 and sprite
+    (0, 1) is transparent, returning the sheet array"""
+
+    step = size + padding
+    sheet = np.zeros((n_rows * step, n_cols * step, 4), dtype=np.uint8)
+    for row in range(n_rows):
+        for col in range(n_cols):
+            sheet[row * step : row * step + size, col * step : col * step + size] = row * n_cols + col + 1
+    sheet[0:size, step : step + size, 3] = 0
+    Image.fromarray(sheet).save(path)
+    return sheet
+
+
+def test_sprite_grid():
+    """Test that sprite_grid is a view of the sheet with the sprites in reading order"""
+
+    sheet = np.arange(9 * 14 * 1).reshape(9, 14, 1)
+
+    # Without padding after the last sprite
+    sprites = sprite_grid(sheet, sprite_width=4, sprite_height=4, sprite_padding=1)
+
+    assert sprites.shape == (2, 3, 4, 4, 1)
+    assert np.shares_memory(sprites, sheet)
+    assert np.array_equal(sprites[1, 2], sheet[5:9, 10:14])
+
+    with pytest.raises(ValueError):
+        sprite_grid(sheet, sprite_width=5, sprite_height=4, sprite_padding=1)
+
+
+def test_split_sprite_sheet(tmp_path: Path):
+    """Test that the non-blank sprites are saved in reading order"""
+
+    make_sprite_sheet(tmp_path / "sheet.png")
+
+    output_paths = split_sprite_sheet(tmp_path / "sheet.png", tmp_path / "sprites", 4, 4, sprite_padding=1)
+
+    assert [path.name for path in output_paths] == [f"sheet_{index}.png" for index in range(5)]
+    assert [np.asarray(Image.open(path))[0, 0, 0] for path in output_paths] == [1, 3, 4, 5, 6]
+    assert np.asarray(Image.open(output_paths[0])).shape == (4, 4, 4)
+
+
+def test_split_sprite_sheets(tmp_path: Path):
+    """Test that many sheets are split in a process pool and summarised in the manifest"""
+
+    sheet_dir = tmp_path / "sheets"
+    sheet_dir.mkdir()
+    for index in range(5):
+        make_sprite_sheet(sheet_dir / f"sheet_{index}.png", n_rows=index + 1)
+    Image.fromarray(np.zeros((7, 7, 4), dtype=np.uint8)).save(sheet_dir / "wrong_size.png")
+
+    summaries = split_sprite_sheets(
+        sheet_dir, tmp_path / "sprites", 4, 4, sprite_padding=1, n_workers=2, manifest_path=tmp_path / "manifest.jsonl"
+    )
+
+    summaries = {Path(summary["sheet"]).name: summary for summary in summaries}
+    assert {name: summary["sprites"] for name, summary in summaries.items() if summary["error"] is None} == {
+        f"sheet_{index}.png": 3 * (index + 1) - 1 for index in range(5)
+    }
+    assert "ValueError" in summaries["wrong_size.png"]["error"]
+    assert len((tmp_path / "manifest.jsonl").read_text().splitlines()) == 6
+    assert len(list((tmp_path / "sprites").glob("*.png"))) == sum(3 * (index + 1) - 1 for index in range(5))
+
+
+def test_split_sprite_sheets_duplicate_names(tmp_path: Path):
+    """Test that sheets with the same name in different directories are rejected rather than overwritten"""
+
+    for directory in ("a", "b"):
+        (tmp_path / directory).mkdir()
+        make_sprite_sheet(tmp_path / directory / "sheet.png")
+
+    with pytest.raises(ValueError, match="sheet"):
+        split_sprite_sheets([tmp_path / "a", tmp_path / "b"], tmp_path / "sprites", 4, 4, sprite_padding=1)
+    assert not list((tmp_path / "sprites").glob("*.png"))
+
+
+def test_main(tmp_path: Path, capsys):
+    """Test the command line entry point"""
+
+    make_sprite_sheet(tmp_path / "sheet.png")
+
+    main(
+        [
+            str(tmp_path / "sheet.png"),
+            "--output-dir",
+            str(tmp_path / "sprites"),
+            "--sprite-width",
+            "4",
+            "--sprite-height",
+            "4",
+            "--sprite-padding",
+            "1",
+        ]
+    )
+
+    assert "into 5 sprites" in capsys.readouterr().out
+    assert len(list((tmp_path / "sprites").glob("*.png"))) == 5
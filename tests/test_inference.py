@@ -0,0 +1,122 @@
+"""Test the inference helpers"""
+
+import pytest
+
+import numpy as np
+
+from sylvialib.deep_learning.inference import (
+    DIHEDRAL_TRANSFORMS,
+    BucketedPredictor,
+    dihedral_transform,
+    inverse_dihedral_transform,
+    predict_with_tta,
+)
+
+
+class CountingModel:  # pylint: disable=too-few-public-methods
+    """A dummy model whose predictions are a pixelwise function of the input, recording calls to predict."""
+
+    def __init__(self):
+        self.calls = []
+
+    def predict(self, images, batch_size=None):
+        """Return the input squared, recording the batch shape and batch size"""
+        self.calls.append((images.shape, batch_size))
+        return images**2
+
+
+@pytest.mark.parametrize(("rotation", "flip"), DIHEDRAL_TRANSFORMS)
+def test_inverse_dihedral_transform(rotation, flip):
+    """Test that inverse_dihedral_transform undoes dihedral_transform"""
+
+    images = np.arange(2 * 4 * 4 * 3).reshape(2, 4, 4, 3)
+
+    transformed = dihedral_transform(images, rotation, flip)
+
+    assert np.array_equal(inverse_dihedral_transform(transformed, rotation, flip), images)
+
+
+@pytest.mark.parametrize("n_variants", [1, 2, 4, 8])
+def test_predict_with_tta(n_variants):
+    """Test that predict_with_tta makes a single batched predict call and returns aligned predictions"""
+
+    images = np.random.default_rng(0).random((3, 8, 8, 1)).astype(np.float32)
+    model = CountingModel()
+
+    predictions = predict_with_tta(model, images, n_variants=n_variants, batch_size=5)
+
+    assert model.calls == [((3 * n_variants, 8, 8, 1), 5)]
+    np.testing.assert_allclose(predictions, images**2, rtol=1e-6)
+
+
+def test_predict_with_tta_non_square():
+    """Test that rotated variants are refused for non-square images"""
+
+    images = np.zeros((1, 8, 4, 1))
+
+    assert predict_with_tta(CountingModel(), images, n_variants=4).shape == images.shape
+    with pytest.raises(ValueError):
+        predict_with_tta(CountingModel(), images, n_variants=8)
+
+
+def tiny_pooling_model():
+    """A small model of any input size that pools and upsamples four times, like the U-NETs"""
+
+    keras = pytest.importorskip("keras")
+    inputs = keras.Input((None, None, 1))
+    layer = inputs
+    for _ in range(4):
+        layer = keras.layers.Conv2D(2, 3, padding="same")(layer)
+        layer = keras.layers.MaxPooling2D((2, 2))(layer)
+    for _ in range(4):
+        layer = keras.layers.UpSampling2D((2, 2))(layer)
+    outputs = keras.layers.Conv2D(1, 3, padding="same", activation="sigmoid")(layer)
+    return keras.Model(inputs, outputs)
+
+
+@pytest.mark.parametrize("jit_compile", [False, True])
+def test_bucketed_predictor(jit_compile):
+    """Test that each image is predicted as if padded to its bucket alone, tracing once per bucket"""
+
+    model = tiny_pooling_model()
+    predictor = BucketedPredictor(model, buckets=[(64, 64), (32, 32)], batch_size=2, jit_compile=jit_compile)
+    rng = np.random.default_rng(0)
+    images = [rng.random(shape, dtype=np.float32) for shape in [(20, 30), (64, 50), (32, 32), (17, 5), (40, 10)]]
+
+    predictions = predictor.predict(images)
+
+    assert predictor.buckets == [(32, 32), (64, 64)]
+    assert predictor.n_traces == 2
+    for image, prediction in zip(images, predictions):
+        assert prediction.shape == (*image.shape, 1)
+        bucket = (32, 32) if max(image.shape) <= 32 else (64, 64)
+        padded = np.pad(image, ((0, bucket[0] - image.shape[0]), (0, bucket[1] - image.shape[1])), mode="edge")
+        expected = model.predict(padded[np.newaxis, ..., np.newaxis], verbose=0)[0, : image.shape[0], : image.shape[1]]
+        np.testing.assert_allclose(prediction, expected, atol=1e-5)
+
+    # New sizes within the buckets reuse the traced functions
+    predictor.predict([rng.random((10, 60), dtype=np.float32), rng.random((31, 1), dtype=np.float32)])
+    assert predictor.n_traces == 2
+
+
+def test_bucketed_predictor_warmup_and_stacked():
+    """Test that warmup traces every bucket, stacked batches come back stacked and oversized images get a bucket"""
+
+    predictor = BucketedPredictor(tiny_pooling_model(), buckets=[(16, 16), (32, 48)], batch_size=3)
+
+    timings = predictor.warmup()
+
+    assert list(timings) == [(16, 16), (32, 48)]
+    assert predictor.n_traces == 2
+    assert predictor.predict(np.zeros((4, 20, 20, 1))).shape == (4, 20, 20, 1)
+    assert predictor.n_traces == 2
+    with pytest.warns(UserWarning):
+        assert predictor.predict([np.zeros((40, 33))])[0].shape == (40, 33, 1)
+    assert (48, 48) in predictor.buckets
+
+
+def test_bucketed_predictor_invalid_bucket():
+    """Test that buckets that cannot be pooled four times are rejected"""
+
+    with pytest.raises(ValueError):
+        BucketedPredictor(tiny_pooling_model(), buckets=[(64, 60)])
@@ -0,0 +1,115 @@
+"""Test the instrumentation registry"""
+
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from sylvialib import instrumentation
+from sylvialib.instrumentation import instrument
+from sylvialib.numpy_scripts import calculate_path_length
+
+
+@instrument
+def add_arrays(array_1: np.ndarray, array_2: np.ndarray) -> np.ndarray:
+    """Instrumented function to profile"""
+    return array_1 + array_2
+
+
+@instrument(name="count_up")
+def count_up(n: int):
+    """Instrumented generator to profile"""
+    yield from range(n)
+
+
+def test_instrument():
+    """Test that calls are only recorded while profiling, with their input sizes"""
+
+    instrumentation.reset()
+    array = np.zeros(10, dtype=np.float64)
+
+    add_arrays(array, array)
+    assert not instrumentation.get_statistics()
+
+    with instrumentation.profiling():
+        add_arrays(array, array_2=array)
+        add_arrays(array, (array, array))
+        calculate_path_length(np.array([[0, 0], [3, 4]]))
+    add_arrays(array, array)
+
+    assert not instrumentation.is_enabled()
+    statistics = instrumentation.get_statistics()
+    stats = statistics[f"{__name__}.add_arrays"]
+    assert stats["calls"] == 2
+    assert stats["total_input_bytes"] == 160 + 240
+    assert stats["max_input_bytes"] == 240
+    assert 0 < stats["p50_seconds"] <= stats["p99_seconds"] <= stats["max_seconds"] <= stats["total_seconds"]
+    assert statistics["sylvialib.numpy_scripts.calculate_path_length"]["calls"] == 1
+
+
+@instrument(name="sum_arrays")
+def sum_arrays(arrays: list) -> np.ndarray:
+    """Instrumented function that calls another instrumented function"""
+    total = arrays[0]
+    for array in arrays[1:]:
+        total = add_arrays(total, array)
+    return total
+
+
+def test_instrument_nested():
+    """Test that calls made inside another instrumented call are counted as nested"""
+
+    with instrumentation.profiling(reset_statistics=True):
+        sum_arrays([np.zeros(2)] * 3)
+        add_arrays(np.zeros(2), np.zeros(2))
+
+    statistics = instrumentation.get_statistics()
+    assert statistics["sum_arrays"]["calls"] == 1
+    assert statistics["sum_arrays"]["nested_calls"] == 0
+    assert statistics[f"{__name__}.add_arrays"]["calls"] == 3
+    assert statistics[f"{__name__}.add_arrays"]["nested_calls"] == 2
+    assert 0 < statistics[f"{__name__}.add_arrays"]["nested_seconds"] <= statistics["sum_arrays"]["total_seconds"]
+
+
+def test_instrument_generator():
+    """Test that each item of an instrumented generator is recorded, and the generator is unchanged"""
+
+    with instrumentation.profiling(reset_statistics=True):
+        assert list(count_up(3)) == [0, 1, 2]
+
+    # Three items and the final next that stops the generator
+    assert instrumentation.get_statistics()["count_up"]["calls"] == 4
+
+
+def test_export(tmp_path: Path, capsys):
+    """Test the JSON export and terminal report"""
+
+    with instrumentation.profiling(reset_statistics=True):
+        add_arrays(np.zeros(2), np.zeros(2))
+
+    exported = json.loads(instrumentation.export_json(tmp_path / "profile.json"))
+    instrumentation.report()
+
+    assert exported == json.loads((tmp_path / "profile.json").read_text(encoding="utf-8"))
+    assert exported[f"{__name__}.add_arrays"]["calls"] == 1
+    assert f"{__name__}.add_arrays" in capsys.readouterr().out
+
+
+def test_environment_variable(tmp_path: Path):
+    """Test that the environment variable profiles a whole run and writes the report at exit"""
+
+    script = (
+        "import numpy as np\n"
+        "from sylvialib.numpy_scripts import detect_overlap\n"
+        "detect_overlap(np.ones(4), np.ones(4))\n"
+    )
+    environment = {**os.environ, instrumentation.PROFILE_ENVIRONMENT_VARIABLE: str(tmp_path / "profile.json")}
+    subprocess.run(
+        [sys.executable, "-c", script], env=environment, check=True, cwd=Path(__file__).parents[1], timeout=60
+    )
+
+    exported = json.loads((tmp_path / "profile.json").read_text(encoding="utf-8"))
+    assert exported["sylvialib.numpy_scripts.detect_overlap"]["calls"] == 1
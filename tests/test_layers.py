@@ -0,0 +1,65 @@
+"""Test the custom keras layers"""
+
+import pytest
+
+import numpy as np
+
+pytest.importorskip("tensorflow")
+
+# pylint: disable=wrong-import-position
+from sylvialib.deep_learning.layers import MinMaxNormalisation  # noqa: E402
+from sylvialib.deep_learning.unet_binary_class import unet_model  # noqa: E402
+from sylvialib.deep_learning.unet_multi_class import multiclass_unet_model  # noqa: E402
+
+
+def test_min_max_normalisation():
+    """Test that each image is scaled by its own minimum and maximum, as in the generator"""
+
+    rng = np.random.default_rng(0)
+    images = rng.integers(0, 256, size=(3, 8, 8, 1), dtype=np.uint8)
+    images[2] = 7
+
+    normalised = np.asarray(MinMaxNormalisation()(images))
+
+    expected = images[:2] - images[:2].min(axis=(1, 2, 3), keepdims=True)
+    expected = expected / expected.max(axis=(1, 2, 3), keepdims=True)
+    assert normalised.dtype == np.float32
+    assert np.allclose(normalised[:2], expected)
+    # A constant image has no range to scale by
+    assert np.array_equal(normalised[2], np.zeros((8, 8, 1)))
+
+
+@pytest.mark.parametrize("model_fn", [unet_model, multiclass_unet_model])
+def test_normalise_inputs(model_fn):
+    """Test that a model normalising its own uint8 inputs predicts the same as one given normalised floats"""
+
+    images = np.random.default_rng(1).integers(0, 256, size=(2, 32, 32, 1), dtype=np.uint8)
+    normalised_images = np.asarray(MinMaxNormalisation()(images))
+
+    model = model_fn(32, 32, 1)
+    normalising_model = model_fn(32, 32, 1, normalise_inputs=True)
+    normalising_model.set_weights(model.get_weights())
+
+    assert isinstance(normalising_model.layers[1], MinMaxNormalisation)
+    assert np.allclose(
+        normalising_model.predict(images, verbose=0), model.predict(normalised_images, verbose=0), atol=1e-6
+    )
+
+
+@pytest.mark.parametrize("model_fn", [unet_model, multiclass_unet_model])
+def test_train_on_uint8_batches(model_fn):
+    """Test that a model normalising its own inputs trains on uint8 images and masks, as from the generator"""
+
+    rng = np.random.default_rng(2)
+    images = rng.integers(0, 256, size=(2, 32, 32, 1), dtype=np.uint8)
+    model = model_fn(32, 32, 1, normalise_inputs=True)
+    n_classes = model.output_shape[-1]
+    if n_classes == 1:
+        masks = rng.integers(0, 2, size=(2, 32, 32, 1), dtype=np.uint8)
+    else:
+        # One hot masks for the multi class model
+        masks = np.eye(n_classes, dtype=np.uint8)[rng.integers(0, n_classes, size=(2, 32, 32))]
+
+    results = model.train_on_batch(images, masks, return_dict=True)
+
+    assert np.isfinite(list(results.values())).all()
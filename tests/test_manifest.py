@@ -0,0 +1,74 @@
+"""Test the dataset manifest"""
+
+from pathlib import Path
+
+import pytest
+
+import numpy as np
+
+from sylvialib.deep_learning import manifest as manifest_module
+from sylvialib.deep_learning.generator import image_generator
+from sylvialib.deep_learning.manifest import build_manifest, load_manifest
+
+
+@pytest.fixture(name="dataset")
+def fixture_dataset(tmp_path: Path):
+    """Create a small dataset of image / mask pairs, with an image that has no mask"""
+
+    image_dir = tmp_path / "images"
+    mask_dir = tmp_path / "masks"
+    image_dir.mkdir()
+    mask_dir.mkdir()
+    for index in range(3):
+        np.save(image_dir / f"image_{index}.npy", np.random.default_rng(index).random((16, 16)))
+        np.save(mask_dir / f"mask_{index}.npy", np.ones((16, 16), dtype=np.uint8))
+    np.save(image_dir / "image_3.npy", np.zeros((16, 16)))
+    return image_dir, mask_dir
+
+
+def test_build_manifest(dataset, tmp_path: Path, monkeypatch):
+    """Test that the manifest records each pair and only rereads changed files when refreshed"""
+
+    image_dir, mask_dir = dataset
+    manifest_path = tmp_path / "manifest.jsonl"
+
+    with pytest.warns(UserWarning, match="without a partner"):
+        manifest = build_manifest(image_dir, mask_dir, manifest_path=manifest_path)
+
+    assert sorted(manifest) == [0, 1, 2]
+    assert manifest[0]["image"]["shape"] == [16, 16]
+    assert manifest[0]["image"]["dtype"] == "float64"
+    assert manifest[0]["mask"]["dtype"] == "uint8"
+    assert manifest[0]["mask"]["size"] == (mask_dir / "mask_0.npy").stat().st_size
+    assert load_manifest(manifest_path) == manifest
+
+    # Change one image and refresh, only that image should have its header read again
+    np.save(image_dir / "image_1.npy", np.zeros((8, 8), dtype=np.float32))
+    read_paths = []
+    read_array_info = manifest_module.read_array_info
+    monkeypatch.setattr(
+        manifest_module, "read_array_info", lambda path: read_paths.append(Path(path).name) or read_array_info(path)
+    )
+
+    with pytest.warns(UserWarning):
+        refreshed = build_manifest(image_dir, mask_dir, manifest_path=manifest_path)
+
+    assert read_paths == ["image_1.npy"]
+    assert refreshed[1]["image"]["shape"] == [8, 8]
+    assert refreshed[0] == manifest[0]
+
+
+def test_image_generator_with_manifest(dataset):
+    """Test that the image generator can take its files from a manifest"""
+
+    image_dir, mask_dir = dataset
+    with pytest.warns(UserWarning):
+        manifest = build_manifest(image_dir, mask_dir)
+
+    batch_x, batch_y = next(image_generator(None, None, batch_size=2, manifest=manifest))
+
+    assert batch_x.shape == (2, 512, 512)
+    assert batch_y.shape == (2, 512, 512)
+
+    with pytest.raises(ValueError, match="missing from the manifest"):
+        next(image_generator(None, None, [0, 3], manifest=manifest))
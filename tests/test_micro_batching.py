@@ -0,0 +1,78 @@
+"""Test the micro-batching predictor"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import numpy as np
+
+from sylvialib.deep_learning.micro_batching import MicroBatchPredictor
+
+
+class DummyModel:  # pylint: disable=too-few-public-methods
+    """A dummy model that doubles its input and records the size of each batch"""
+
+    def __init__(self, delay: float = 0.0):
+        self.batch_sizes = []
+        self.delay = delay
+        self.event = threading.Event()
+
+    def predict(self, images, **_kwargs):
+        """Return the input doubled"""
+        self.event.wait(self.delay)
+        self.batch_sizes.append(images.shape[0])
+        return images * 2
+
+
+def test_micro_batch_predictor_batches_concurrent_requests():
+    """Test that concurrent requests are grouped into batches and each caller gets its own result"""
+
+    model = DummyModel(delay=0.01)
+    images = [np.full((4, 4, 1), i, dtype=np.float32) for i in range(32)]
+
+    with MicroBatchPredictor(model, max_batch_size=8, max_wait=0.05) as predictor:
+        with ThreadPoolExecutor(max_workers=32) as pool:
+            predictions = list(pool.map(predictor.predict, images))
+        stats = predictor.stats()
+
+    for image, prediction in zip(images, predictions):
+        assert np.array_equal(prediction, image * 2)
+    assert sum(model.batch_sizes) == 32
+    assert max(model.batch_sizes) <= 8
+    assert len(model.batch_sizes) < 32
+    assert stats["requests"] == 32
+    assert stats["batches"] == len(model.batch_sizes)
+    assert stats["max_batch_size"] == max(model.batch_sizes)
+    assert sum(size * count for size, count in stats["batch_size_histogram"].items()) == 32
+
+
+def test_micro_batch_predictor_async():
+    """Test that predictions can be awaited from asyncio code"""
+
+    async def predict_all(predictor):
+        return await asyncio.gather(*(predictor.predict_async(np.full((2, 2), i)) for i in range(5)))
+
+    with MicroBatchPredictor(DummyModel(), max_batch_size=5, max_wait=0.05) as predictor:
+        predictions = asyncio.run(predict_all(predictor))
+
+    assert [prediction[0, 0] for prediction in predictions] == [0, 2, 4, 6, 8]
+
+
+def test_micro_batch_predictor_errors():
+    """Test that model errors are passed to the callers and that closed predictors refuse requests"""
+
+    class BrokenModel:  # pylint: disable=too-few-public-methods
+        """A model that always fails"""
+
+        def predict(self, images, **_kwargs):
+            """Raise an error"""
+            raise RuntimeError("broken")
+
+    predictor = MicroBatchPredictor(BrokenModel())
+    with pytest.raises(RuntimeError, match="broken"):
+        predictor.predict(np.zeros((2, 2)))
+    predictor.close()
+    with pytest.raises(RuntimeError, match="closed"):
+        predictor.submit(np.zeros((2, 2)))
@@ -1,5 +1,7 @@
 """Test the functions in the numpy_scripts module"""
 
+from pathlib import Path
+
 import pytest
 
 import numpy as np
@@ -7,9 +9,20 @@ import numpy as np
 
 from sylvialib.numpy_scripts import (
     create_2d_array_from_string,
+    detect_overlap,
+    detect_overlap_tiled,
     find_touching_pixels,
+    find_touching_pixels_tiled,
     coordinate_in_array,
     signed_angle_between_vectors,
+    calculate_curvature_fast,
+    calculate_curvature_periodic_boundary,
+    calculate_path_length,
+    fit_path_spline,
+    resample_path,
+    resample_paths,
+    trace_skeleton,
+    turn_spline_path_into_pixel_map,
 )
 
 
@@ -104,3 +117,199 @@ def test_signed_angle_between_vectors(vector1, vector2, expected_angle) -> None:
     angle = signed_angle_between_vectors(vector1, vector2)
 
     assert angle == expected_angle
+
+
+def test_calculate_path_length():
+    """Test the calculate_path_length function"""
+
+    assert calculate_path_length(np.array([[0, 0], [3, 4], [3, 10]])) == 11.0
+    assert calculate_path_length(np.array([[1, 1]])) == 0.0
+
+
+def test_resample_path():
+    """Test resampling open and closed paths by step and by number of points"""
+
+    # An open L shaped path of length 10, with unevenly spaced points
+    path = np.array([[0, 0], [1, 0], [5, 0], [5, 5]])
+
+    resampled = resample_path(path, step=2.5)
+    np.testing.assert_allclose(resampled, [[0, 0], [2.5, 0], [5, 0], [5, 2.5], [5, 5]])
+
+    resampled = resample_path(path, step=3)
+    np.testing.assert_allclose(resampled, [[0, 0], [3, 0], [5, 1], [5, 4]])
+
+    resampled = resample_path(path, n_points=3)
+    np.testing.assert_allclose(resampled, [[0, 0], [5, 0], [5, 5]])
+
+    # A closed unit square of perimeter 4
+    square = np.array([[0, 0], [1, 0], [1, 1], [0, 1]])
+    resampled = resample_path(square, n_points=8, closed=True)
+    np.testing.assert_allclose(resampled[:3], [[0, 0], [0.5, 0], [1, 0]])
+    np.testing.assert_allclose(resampled[-1], [0, 0.5])
+    assert len(resample_path(square, step=0.5, closed=True)) == 8
+
+
+def test_resample_paths_ragged_batch():
+    """Test that each path of a ragged batch is sampled every step along its own arc length"""
+
+    rng = np.random.default_rng(0)
+    paths = [rng.random((length, 2)) * 10 for length in (2, 7, 30)] + [np.array([[0.0, 0.0], [0.0, 2.0]])]
+    step = 0.3
+
+    for closed in (False, True):
+        batch = resample_paths(paths, step=step, closed=closed)
+
+        assert len(batch) == len(paths)
+        for path, resampled in zip(paths, batch):
+            loop = np.concatenate([path, path[:1]]) if closed else path
+            cumulative = np.concatenate([[0], np.cumsum(np.linalg.norm(np.diff(loop, axis=0), axis=1))])
+            n_samples = int(np.ceil(cumulative[-1] / step)) if closed else int(cumulative[-1] // step) + 1
+            distances = np.arange(n_samples) * step
+            expected = np.stack([np.interp(distances, cumulative, loop[:, axis]) for axis in (0, 1)], axis=1)
+            np.testing.assert_allclose(resampled, expected, atol=1e-9)
+
+    # Along a straight path the points are exactly a step apart. Its length of 2 is not a multiple of the step,
+    # so the last point stops short of the end.
+    straight = resample_paths(paths, step=step)[-1]
+    np.testing.assert_allclose(np.linalg.norm(np.diff(straight, axis=0), axis=1), step)
+    np.testing.assert_allclose(straight[-1], [0, 1.8])
+
+
+@pytest.mark.parametrize("position", [0, -1])
+def test_resample_paths_empty_path(position):
+    """Test that empty paths are rejected wherever they are in the batch, rather than sampling their neighbours"""
+
+    paths = [np.array([[0.0, 0.0], [1.0, 1.0]])] * 2
+    paths.insert(position if position >= 0 else len(paths), np.zeros((0, 2)))
+
+    with pytest.raises(ValueError, match="at least one point"):
+        resample_paths(paths, n_points=4)
+    with pytest.raises(ValueError, match="at least one point"):
+        resample_paths(paths, step=0.5, closed=True)
+
+
+def test_resample_path_spline():
+    """Test resampling an already fitted spline of a circle to evenly spaced points"""
+
+    angles = np.linspace(0, 2 * np.pi, 60) ** 1.2 / (2 * np.pi) ** 0.2
+    x_points, y_points = 10 * np.cos(angles), 10 * np.sin(angles)
+
+    resampled = resample_path(None, n_points=50, spline=fit_path_spline(x_points, y_points, error=0.001))
+
+    spacing = np.linalg.norm(np.diff(resampled, axis=0), axis=1)
+    np.testing.assert_allclose(spacing, spacing.mean(), rtol=1e-2)
+    np.testing.assert_allclose(np.linalg.norm(resampled, axis=1), 10, rtol=1e-2)
+
+
+def test_trace_skeleton_branches():
+    """Test tracing a staircase line, a T junction and an isolated pixel in one image"""
+
+    skeleton = create_2d_array_from_string(
+        """
+        1 1 0 0 0 0 0 0 0
+        0 1 1 0 0 1 1 1 1
+        0 0 1 0 0 0 0 1 0
+        0 0 0 1 0 0 0 1 0
+        0 0 0 0 0 1 0 0 0
+        """
+    )
+
+    paths, closed = trace_skeleton(skeleton)
+
+    paths = sorted((path.tolist() for path in paths), key=len)
+    assert not any(closed)
+    assert paths[0] == [[4, 5]]
+    # The T junction at (1, 7) splits into three branches that share it
+    junction_branches = [path for path in paths if [1, 7] in (path[0], path[-1])]
+    assert sorted(len(path) for path in junction_branches) == [2, 3, 3]
+    # The staircase is one branch, walked through the orthogonal steps
+    assert [[0, 0], [0, 1], [1, 1], [1, 2], [2, 2], [3, 3]] in (paths[-1], paths[-1][::-1])
+
+
+def test_trace_skeleton_loops():
+    """Test tracing closed loops, including the pixel path of a spline"""
+
+    angles = np.linspace(0, 2 * np.pi, 200)
+    circle = np.stack([20 + 10 * np.cos(angles), 20 + 10 * np.sin(angles)], axis=1)
+    pixel_map, _ = turn_spline_path_into_pixel_map(circle)
+    skeleton = np.zeros((45, 45), dtype=bool)
+    skeleton[: pixel_map.shape[0], : pixel_map.shape[1]] = pixel_map
+    skeleton[40:43, 40:43] = True
+    skeleton[41, 41] = False
+
+    paths, closed = trace_skeleton(skeleton)
+
+    assert closed == [True, True]
+    assert sorted(len(path) for path in paths) == [8, int(skeleton.sum()) - 8]
+    for path in paths:
+        steps = np.abs(np.diff(np.vstack([path, path[:1]]), axis=0))
+        assert steps.max() == 1
+        assert np.all(skeleton[path[:, 0], path[:, 1]])
+
+
+@pytest.mark.parametrize("method", ["savgol", "finite_difference"])
+def test_calculate_curvature_fast_batch(method):
+    """Test the fast curvature of a batch of closed circles against the true and spline curvature"""
+
+    radii = np.array([[5.0], [10.0], [20.0]])
+    angles = np.linspace(0, 2 * np.pi, 100, endpoint=False)
+    x_points = radii * np.cos(angles)
+    y_points = radii * np.sin(angles)
+
+    curvatures, smoothed_x, smoothed_y = calculate_curvature_fast(x_points, y_points, closed=True, method=method)
+
+    assert curvatures.shape == (3, 100)
+    np.testing.assert_allclose(curvatures, np.broadcast_to(1 / radii, (3, 100)), rtol=1e-2)
+    np.testing.assert_allclose(smoothed_x, x_points, atol=1e-2 * radii.max())
+    np.testing.assert_allclose(smoothed_y, y_points, atol=1e-2 * radii.max())
+    spline_curvature = calculate_curvature_periodic_boundary(x_points[1], y_points[1], error=0.001)[0]
+    np.testing.assert_allclose(curvatures[1], spline_curvature, rtol=1e-1)
+
+
+def test_calculate_curvature_fast_open():
+    """Test the fast curvature of an open, clockwise arc, which has negative curvature"""
+
+    angles = np.linspace(np.pi, 0, 50)
+
+    curvatures, _, _ = calculate_curvature_fast(4 * np.cos(angles), 4 * np.sin(angles), window_length=7)
+
+    np.testing.assert_allclose(curvatures, -0.25, rtol=2e-2)
+    with pytest.raises(ValueError):
+        calculate_curvature_fast(np.zeros(10), np.zeros(9))
+    with pytest.raises(ValueError):
+        calculate_curvature_fast(np.zeros(10), np.zeros(10), method="spline")
+
+
+def test_find_touching_pixels_tiled(tmp_path: Path):
+    """Test that the tiled touching pixels match the whole image version, including across tile edges"""
+
+    image = np.lib.format.open_memmap(tmp_path / "labels.npy", mode="w+", dtype=np.uint8, shape=(50, 37))
+    image[:] = np.random.default_rng(0).integers(0, 3, size=(50, 37))
+    expected = find_touching_pixels(np.asarray(image))
+
+    touching = find_touching_pixels_tiled(image, tile_size=8, out=tmp_path / "touching.npy")
+    coordinates = find_touching_pixels_tiled(image, tile_size=8, return_coordinates=True)
+
+    assert isinstance(touching, np.memmap)
+    assert np.array_equal(touching, expected)
+    assert np.array_equal(np.load(tmp_path / "touching.npy"), expected)
+    assert np.array_equal(coordinates, np.argwhere(expected))
+
+
+def test_detect_overlap_tiled():
+    """Test that the tiled overlap detection matches the whole image version"""
+
+    mask_1 = np.zeros((30, 30), dtype=bool)
+    mask_2 = np.zeros((30, 30), dtype=bool)
+    mask_1[:20, :20] = True
+    mask_2[25:, 25:] = True
+
+    assert detect_overlap_tiled(mask_1, mask_2, tile_size=7) == detect_overlap(mask_1, mask_2)
+    assert detect_overlap_tiled(mask_1, mask_2, tile_size=7, return_coordinates=True).shape == (0, 2)
+
+    mask_2[19:21, 19:21] = True
+
+    assert detect_overlap_tiled(mask_1, mask_2, tile_size=7)
+    assert np.array_equal(detect_overlap_tiled(mask_1, mask_2, tile_size=7, return_coordinates=True), [[19, 19]])
+    with pytest.raises(ValueError):
+        detect_overlap_tiled(mask_1, mask_2[:10])
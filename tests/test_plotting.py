@@ -0,0 +1,230 @@
+"""Test the plotting functions"""
+
+import gc
+from pathlib import Path
+
+import matplotlib
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+import numpy as np
+from PIL import Image
+
+from sylvialib import plotting
+from sylvialib.plotting import ImagePyramid, LevelOfDetailImage, make_montage, render_overlays
+
+matplotlib.use("Agg")
+
+
+class CountingArray:  # pylint: disable=too-few-public-methods
+    """An array-like that counts the pixels read from it, standing in for a memmap"""
+
+    def __init__(self, array: np.ndarray):
+        self.array = array
+        self.shape = array.shape
+        self.dtype = array.dtype
+        self.pixels_read = 0
+
+    def __getitem__(self, key):
+        crop = self.array[key]
+        self.pixels_read += crop.size
+        return crop
+
+
+def test_image_pyramid(tmp_path: Path):
+    """Test that pyramid levels are block averaged, cached in bounded tiles and cropped to the requested region"""
+
+    image = np.lib.format.open_memmap(tmp_path / "scan.npy", mode="w+", dtype=np.float64, shape=(1000, 600))
+    image[:] = np.random.default_rng(0).random((1000, 600))
+    counting_image = CountingArray(image)
+
+    pyramid = ImagePyramid(counting_image, min_size=100, tile_size=64, max_tiles=8)
+
+    assert pyramid.n_levels == 5
+    assert pyramid.level(0) is counting_image
+    assert counting_image.pixels_read == 0
+    assert pyramid.level(2).shape == (250, 150)
+    np.testing.assert_allclose(pyramid.level(3), image.reshape(125, 8, 75, 8).mean(axis=(1, 3)))
+    # The last row of level 4 averages the last 8 rows of the image only
+    assert pyramid.level(4).shape == (63, 38)
+    np.testing.assert_allclose(pyramid.level(4)[-1, 0], image[992:, :16].mean())
+    assert len(pyramid._tiles) <= 8  # pylint: disable=protected-access
+
+    # The coarsest level is a single tile, so is not read again
+    pixels_read = counting_image.pixels_read
+    pyramid.level(4)
+    assert counting_image.pixels_read == pixels_read
+
+    assert pyramid.choose_level((1000, 600), (1000, 600)) == 0
+    assert pyramid.choose_level((1000, 600), (250, 150)) == 2
+    assert pyramid.choose_level((1000, 600), (10, 10)) == 4
+
+    crop, extent = pyramid.region(2, (100, 200), (0, 40))
+    np.testing.assert_allclose(crop, pyramid.level(2)[25:50, 0:10])
+    assert extent == (-0.5, 39.5, 199.5, 99.5)
+    # Regions running off the edge of the image are cropped to it, as with the level
+    crop, extent = pyramid.region(3, (990, 1000), (595, 600))
+    np.testing.assert_allclose(crop, pyramid.level(3)[123:125, 74:75])
+    assert extent == (591.5, 599.5, 999.5, 983.5)
+    # Regions ending past the edge of the image are clipped to it, so the extent matches the image
+    crop, extent = pyramid.region(4, (980, 1010), (590, 620))
+    np.testing.assert_allclose(crop, pyramid.level(4)[61:63, 36:38])
+    assert extent == (575.5, 599.5, 999.5, 975.5)
+    # Level 0 regions are read straight from the image
+    crop, _ = pyramid.region(0, (10, 20), (30, 35))
+    assert np.array_equal(crop, image[10:20, 30:35])
+
+
+def test_image_pyramid_averages():
+    """Test that averaging the levels smooths fine structure instead of aliasing it, keeping integer dtypes"""
+
+    checkerboard = (np.indices((64, 64)).sum(axis=0) % 2 * 255).astype(np.uint8)
+    rgb = np.repeat(checkerboard[..., np.newaxis], 3, axis=2)
+
+    pyramid = ImagePyramid(rgb, min_size=8, tile_size=16)
+
+    assert pyramid.level(1).dtype == np.uint8
+    assert pyramid.level(1).shape == (32, 32, 3)
+    assert np.array_equal(np.unique(pyramid.level(3)), [128])
+
+
+def test_level_of_detail_image():
+    """Test that zooming in redraws a smaller region from a finer level"""
+
+    image = np.random.default_rng(0).random((2048, 2048))
+    figure = Figure(figsize=(2, 2), dpi=100)
+    FigureCanvasAgg(figure)
+    axes = figure.add_axes((0, 0, 1, 1))
+
+    lod_image = LevelOfDetailImage(axes, image)
+
+    assert lod_image.current_level == 3
+    assert lod_image.axes_image.get_array().shape == (256, 256)
+
+    axes.set_xlim(99.5, 199.5)
+    axes.set_ylim(199.5, 99.5)
+
+    assert lod_image.current_level == 0
+    assert np.array_equal(lod_image.axes_image.get_array(), image[100:200, 100:200])
+    figure.canvas.draw()
+
+
+def test_level_of_detail_image_kept_alive():
+    """Test that a level of detail image keeps redrawing when only its axes refer to it, and that imshow
+    returns it"""
+
+    image = np.random.default_rng(0).random((2048, 2048))
+    figure = Figure(figsize=(2, 2), dpi=100)
+    FigureCanvasAgg(figure)
+    axes = figure.add_axes((0, 0, 1, 1))
+
+    LevelOfDetailImage(axes, image)
+    gc.collect()
+    axes.set_xlim(99.5, 199.5)
+    axes.set_ylim(199.5, 99.5)
+
+    assert np.array_equal(axes.images[0].get_array(), image[100:200, 100:200])
+    assert isinstance(plotting.imshow(image, size=(2, 2)), LevelOfDetailImage)
+    assert plotting.imshow(image[:10, :10], size=(2, 2)) is None
+    plt.close("all")
+
+
+def test_make_montage(tmp_path: Path):
+    """Test that the thumbnails are packed into the canvas in reading order"""
+
+    images = [np.full((20, 10), index) for index in range(4)] + [np.zeros((5, 5, 3), dtype=np.uint8)]
+    images[0][0, 0] = 1
+
+    canvas = make_montage(images, n_cols=3, thumbnail_size=8, padding=2, cmap="gray", output_path=tmp_path / "m.png")
+
+    assert canvas.shape == (2 + 2 * 10, 2 + 3 * 10, 3)
+    assert canvas.dtype == np.uint8
+    # The first image is tall, so its thumbnail is 8x4 with the top left pixel white
+    assert canvas[2, 2].tolist() == [255, 255, 255]
+    assert canvas[9, 5].tolist() == [0, 0, 0]
+    assert canvas[9, 6].tolist() == [255, 255, 255]
+    # The RGB image in the second row is used as it is
+    assert canvas[12:20, 12:20].max() == 0
+    assert np.array_equal(np.asarray(Image.open(tmp_path / "m.png")), canvas)
+
+
+def test_make_montage_labels():
+    """Test that labels add a band under each row"""
+
+    images = [np.zeros((8, 8))] * 2
+
+    unlabelled = make_montage(images, thumbnail_size=8, padding=2)
+    labelled = make_montage(images, thumbnail_size=8, padding=2, labels=["a", "b"])
+
+    assert labelled.shape[0] > unlabelled.shape[0]
+    assert labelled.shape[1] == unlabelled.shape[1]
+    assert (labelled[10:] < 255).any()
+
+
+def test_make_montage_integer_rgb():
+    """Test that integer RGB images are scaled by their dtype's maximum and float RGB images from 0 to 1"""
+
+    uint16_image = np.zeros((4, 4, 3), dtype=np.uint16)
+    uint16_image[..., 0] = 65535
+    uint16_image[..., 1] = 32768
+    float_image = np.full((4, 4, 3), 0.5)
+
+    canvas = make_montage([uint16_image, float_image], thumbnail_size=4, padding=0)
+
+    assert canvas[:, :4].reshape(-1, 3).tolist() == [[255, 128, 0]] * 16
+    assert canvas[:, 4:].reshape(-1, 3).tolist() == [[128, 128, 128]] * 16
+
+
+def test_plot_gallery(monkeypatch):
+    """Test that plot_gallery works with a single row and in montage mode"""
+
+    shown = []
+    monkeypatch.setattr(plotting.plt, "show", lambda: shown.append(plotting.plt.gcf().get_size_inches()))
+
+    plotting.plot_gallery([np.zeros((4, 4))] * 3, n_cols=4)
+    plotting.plot_gallery([np.zeros((4, 4))] * 3, n_cols=2, montage=True, thumbnail_size=4)
+    # The montage figure stays the same size however many rows there are
+    plotting.plot_gallery([np.zeros((4, 4))] * 2000, n_cols=4, montage=True, thumbnail_size=4)
+
+    assert len(shown) == 3
+    assert shown[2].max() == 20
+    plotting.plt.close("all")
+
+
+def test_render_overlays(tmp_path: Path):
+    """Test that overlays are rendered to files, with the same output serially and in a process pool"""
+
+    image = np.random.default_rng(0).random((32, 32))
+    mask = np.zeros((32, 32))
+    mask[8:24, 8:24] = 1
+    np.save(tmp_path / "image.npy", image)
+
+    serial_paths = render_overlays(
+        [image, tmp_path / "image.npy"], tmp_path / "serial", masks=[mask, mask], predictions=[None, 1 - mask], dpi=10
+    )
+    parallel_paths = render_overlays(
+        [image, tmp_path / "image.npy"],
+        tmp_path / "parallel",
+        masks=[mask, mask],
+        predictions=[None, 1 - mask],
+        dpi=10,
+        n_workers=2,
+    )
+
+    assert [path.name for path in serial_paths] == ["overlay_0.png", "overlay_1.png"]
+    renders = [np.asarray(Image.open(path)) for path in serial_paths + parallel_paths]
+    assert renders[0].shape == (80, 80, 4)
+    assert not np.array_equal(renders[0], renders[1])
+    assert np.array_equal(renders[0], renders[2])
+    assert np.array_equal(renders[1], renders[3])
+
+
+def test_get_render_figure():
+    """Test that the render figure is reused until its size changes"""
+
+    # pylint: disable=protected-access
+    figure = plotting._get_render_figure(figsize=(2, 2), dpi=50)
+
+    assert plotting._get_render_figure(figsize=[2, 2], dpi=50) is figure
+    assert plotting._get_render_figure(figsize=(3, 2), dpi=50) is not figure
@@ -0,0 +1,85 @@
+"""Test the spatial query functions"""
+
+import pytest
+
+import numpy as np
+from scipy.spatial.distance import cdist
+
+from sylvialib.spatial import (
+    SpatialIndex,
+    batch_nearest,
+    batch_path_distances,
+    hausdorff_distance,
+    mean_closest_point_distance,
+)
+
+
+def random_path(rng: np.random.Generator, n_points: int) -> np.ndarray:
+    """Make a random walk of (row, col) points"""
+    return np.cumsum(rng.normal(size=(n_points, 2)), axis=0)
+
+
+def test_spatial_index():
+    """Test the nearest neighbour, radius and containment queries against brute force"""
+
+    rng = np.random.default_rng(0)
+    points = rng.uniform(0, 10, size=(200, 2))
+    query = rng.uniform(0, 10, size=(50, 2))
+    all_distances = cdist(query, points)
+    index = SpatialIndex(points)
+
+    distances, closest = index.nearest(query)
+    within = index.within_radius(query, 1.5)
+
+    assert len(index) == 200
+    assert np.allclose(distances, all_distances.min(axis=1))
+    assert np.array_equal(closest, all_distances.argmin(axis=1))
+    assert [indexes.tolist() for indexes in within] == [
+        np.flatnonzero(row <= 1.5).tolist() for row in all_distances
+    ]
+    assert np.array_equal(index.count_within_radius(query, 1.5), (all_distances <= 1.5).sum(axis=1))
+    assert index.contains(np.concatenate([points[:3], query[:1]])).tolist() == [True, True, True, False]
+    with pytest.raises(ValueError):
+        SpatialIndex(np.empty((0, 2)))
+
+
+def test_path_distances():
+    """Test the Hausdorff and mean closest point distances against brute force"""
+
+    rng = np.random.default_rng(1)
+    path_1 = random_path(rng, 80)
+    path_2 = random_path(rng, 50)
+    all_distances = cdist(path_1, path_2)
+
+    expected_hausdorff = max(all_distances.min(axis=1).max(), all_distances.min(axis=0).max())
+    expected_mean = np.concatenate([all_distances.min(axis=1), all_distances.min(axis=0)]).mean()
+
+    assert hausdorff_distance(path_1, path_2) == pytest.approx(expected_hausdorff)
+    assert hausdorff_distance(SpatialIndex(path_1), path_2) == pytest.approx(expected_hausdorff)
+    assert mean_closest_point_distance(path_1, SpatialIndex(path_2)) == pytest.approx(expected_mean)
+    assert hausdorff_distance(path_1, path_1) == 0
+
+
+def test_batch_path_distances():
+    """Test that batched queries over ragged paths match comparing each path separately"""
+
+    rng = np.random.default_rng(2)
+    paths = [random_path(rng, n_points) for n_points in (5, 40, 1, 17)]
+    reference = random_path(rng, 60)
+
+    distances, closest, offsets = batch_nearest(paths, reference)
+    table = batch_path_distances(paths, SpatialIndex(reference))
+
+    assert offsets.tolist() == [0, 5, 45, 46, 63]
+    for path_index, path in enumerate(paths):
+        path_distances = cdist(path, reference)
+        start, stop = offsets[path_index : path_index + 2]
+        assert np.allclose(distances[start:stop], path_distances.min(axis=1))
+        assert np.array_equal(closest[start:stop], path_distances.argmin(axis=1))
+        assert table["directed_hausdorff"][path_index] == pytest.approx(path_distances.min(axis=1).max())
+        assert table["directed_mean_distance"][path_index] == pytest.approx(path_distances.min(axis=1).mean())
+        assert table["hausdorff"][path_index] == pytest.approx(hausdorff_distance(path, reference))
+        assert table["mean_closest_point_distance"][path_index] == pytest.approx(
+            mean_closest_point_distance(path, reference)
+        )
+    assert batch_path_distances([], reference)["hausdorff"].shape == (0,)
@@ -0,0 +1,191 @@
+"""Test the data parallel training entry point"""
+
+import json
+import os
+import socket
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import numpy as np
+
+pytest.importorskip("tensorflow")
+
+# pylint: disable=wrong-import-position
+from sylvialib.deep_learning.training import shard_indexes  # noqa: E402
+
+REPO_ROOT = Path(__file__).parents[1]
+
+# Trains a tiny model so that the test is quick, and records what each process saw
+TRAINING_SCRIPT = """
+import gc, json, sys
+from pathlib import Path
+
+import keras
+import numpy as np
+
+from sylvialib.deep_learning.training import make_dataset_fn, make_strategy, train
+
+data_dir, output_path, n_local_devices = Path(sys.argv[1]), sys.argv[2], int(sys.argv[3])
+strategy = make_strategy(n_local_devices)
+
+
+def tiny_model(img_height, img_width, img_channels, learning_rate):
+    inputs = keras.Input((img_height, img_width, img_channels))
+    outputs = keras.layers.Conv2D(1, 1, activation="sigmoid")(inputs)
+    model = keras.Model(inputs, outputs)
+    model.compile(optimizer=keras.optimizers.Adam(learning_rate=learning_rate), loss="binary_crossentropy")
+    return model
+
+
+def tiny_multiclass_model(img_height, img_width, img_channels, learning_rate):
+    inputs = keras.Input((img_height, img_width, img_channels))
+    outputs = keras.layers.Conv2D(3, 1, activation="softmax")(inputs)
+    model = keras.Model(inputs, outputs)
+    model.compile(optimizer=keras.optimizers.Adam(learning_rate=learning_rate), loss="categorical_crossentropy")
+    return model
+
+
+image_indexes = list(range(8))
+model, history = train(
+    data_dir, data_dir, image_indexes, model_fn=tiny_model, per_replica_batch_size=2, epochs=1,
+    steps_per_epoch=2, strategy=strategy, verbose=False,
+)
+# Single channel masks are one hot encoded for models with several output channels
+_, multiclass_history = train(
+    data_dir, data_dir, image_indexes, model_fn=tiny_multiclass_model, per_replica_batch_size=2, epochs=1,
+    steps_per_epoch=1, strategy=strategy, verbose=False,
+)
+
+
+def image_index(image):
+    # A quarter of the image is at the low background level, a quarter at the level identifying the image and half
+    # at the high background level. Resizing rings along the edges between them and so shifts the normalisation,
+    # so compare the levels at the middle of each part.
+    low, level, high = np.percentile(image, [12.5, 37.5, 75])
+    return int(np.round(15 * (level - low) / (high - low))) - 4
+
+
+# The images each local replica sees identify its shard. Batches are drawn at random from the shard, so take
+# enough that every image in it is seen.
+np.random.seed(0)
+dataset = strategy.distribute_datasets_from_function(make_dataset_fn(data_dir, data_dir, image_indexes, 16))
+iterator = iter(dataset)
+seen = None
+for _ in range(20):
+    images, _ = next(iterator)
+    local_images = strategy.experimental_local_results(images)
+    seen = seen or [set() for _ in local_images]
+    for replica_seen, replica in zip(seen, local_images):
+        replica_seen.update(image_index(image) for image in replica.numpy())
+seen = [sorted(replica_seen) for replica_seen in seen]
+# Release the generator threads so that the workers can exit
+del iterator
+gc.collect()
+
+Path(output_path).write_text(json.dumps({
+    "n_replicas": strategy.num_replicas_in_sync,
+    "learning_rate": float(model.optimizer.learning_rate.numpy()),
+    "loss": history["loss"],
+    "multiclass_loss": multiclass_history["loss"],
+    "weights": [weight.tolist() for weight in model.get_weights()],
+    "seen": seen,
+}))
+"""
+
+
+def make_training_data(data_dir: Path):
+    """Save 8 image and mask pairs, where a quarter of image i is i + 4 and the rest is 0 or 15, so that the
+    normalised image identifies which index it came from"""
+
+    data_dir.mkdir()
+    for index in range(8):
+        image = np.full((16, 16), 15.0)
+        image[:4] = 0
+        image[4:8] = index + 4
+        mask = np.zeros((16, 16))
+        mask[:, :8] = 1
+        np.save(data_dir / f"image_{index}.npy", image)
+        np.save(data_dir / f"mask_{index}.npy", mask)
+
+
+def run_training(data_dir: Path, output_path: Path, n_local_devices: int, tf_config: dict = None):
+    """Start the training script in a new process, so that the TensorFlow devices can be configured"""
+
+    environment = {**os.environ, "PYTHONPATH": str(REPO_ROOT), "TF_CPP_MIN_LOG_LEVEL": "3"}
+    environment.pop("TF_CONFIG", None)
+    if tf_config is not None:
+        environment["TF_CONFIG"] = json.dumps(tf_config)
+    return subprocess.Popen(  # pylint: disable=consider-using-with
+        [sys.executable, "-c", TRAINING_SCRIPT, str(data_dir), str(output_path), str(n_local_devices)],
+        env=environment,
+    )
+
+
+def free_port() -> int:
+    """Find a free localhost port"""
+
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+def test_shard_indexes():
+    """Test that the shards are disjoint and cover every index"""
+
+    shards = [shard_indexes(range(10), 3, shard) for shard in range(3)]
+
+    assert shards == [[0, 3, 6, 9], [1, 4, 7], [2, 5, 8]]
+    with pytest.raises(ValueError):
+        shard_indexes([0, 1], 3, 0)
+
+
+def test_train_mirrored(tmp_path: Path):
+    """Test mirrored training over two logical CPU devices, each replica seeing its own shard"""
+
+    make_training_data(tmp_path / "data")
+
+    process = run_training(tmp_path / "data", tmp_path / "result.json", n_local_devices=2)
+    assert process.wait(timeout=300) == 0
+
+    result = json.loads((tmp_path / "result.json").read_text())
+    assert result["n_replicas"] == 2
+    assert result["learning_rate"] == pytest.approx(0.002)
+    assert np.isfinite(result["loss"]).all()
+    assert np.isfinite(result["multiclass_loss"]).all()
+    # Each replica sees exactly its own shard
+    assert result["seen"] == [shard_indexes(range(8), 2, replica) for replica in range(2)]
+    assert not set(result["seen"][0]) & set(result["seen"][1])
+
+
+def test_train_multi_worker(tmp_path: Path):
+    """Test multi-worker training with two worker processes on localhost, which must end with the same weights"""
+
+    make_training_data(tmp_path / "data")
+    workers = [f"localhost:{free_port()}", f"localhost:{free_port()}"]
+
+    processes = [
+        run_training(
+            tmp_path / "data",
+            tmp_path / f"result_{index}.json",
+            n_local_devices=1,
+            tf_config={"cluster": {"worker": workers}, "task": {"type": "worker", "index": index}},
+        )
+        for index in range(2)
+    ]
+    try:
+        assert [process.wait(timeout=300) for process in processes] == [0, 0]
+    finally:
+        for process in processes:
+            process.kill()
+
+    results = [json.loads((tmp_path / f"result_{index}.json").read_text()) for index in range(2)]
+    assert [result["n_replicas"] for result in results] == [2, 2]
+    assert results[0]["learning_rate"] == pytest.approx(0.002)
+    for weights_0, weights_1 in zip(results[0]["weights"], results[1]["weights"]):
+        assert np.allclose(weights_0, weights_1)
+    # Each worker's replica sees exactly its own shard
+    assert [result["seen"] for result in results] == [[shard_indexes(range(8), 2, worker)] for worker in range(2)]
+    assert not set(results[0]["seen"][0]) & set(results[1]["seen"][0])
@@ -0,0 +1,52 @@
+"""Smoke test the training throughput benchmark"""
+
+import importlib.util
+import json
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("tensorflow")
+
+BENCHMARK_PATH = Path(__file__).parents[1] / "benchmarks" / "training_throughput.py"
+
+
+@pytest.fixture(name="benchmark", scope="module")
+def fixture_benchmark():
+    """Import the benchmark script, which is not part of the package"""
+
+    spec = importlib.util.spec_from_file_location("training_throughput", BENCHMARK_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.mark.parametrize("output_dtype", ["float32", "uint8"])
+def test_training_throughput(benchmark, output_dtype, tmp_path: Path, capsys):
+    """Test that every run of the benchmark completes a step in both batch dtypes"""
+
+    benchmark.main(
+        [
+            "--data-dir",
+            str(tmp_path),
+            "--n-images",
+            "2",
+            "--image-size",
+            "32",
+            "--batch-size",
+            "1",
+            "--steps",
+            "1",
+            "--warmup-steps",
+            "1",
+            "--output-dtype",
+            output_dtype,
+            "--json",
+        ]
+    )
+
+    results = json.loads(capsys.readouterr().out)
+    assert [result["run"] for result in results] == ["generator", "unet", "multiclass"]
+    for result in results:
+        assert result["steps"] == 1
+        assert result["samples_per_second"] > 0